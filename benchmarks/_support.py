@@ -0,0 +1,174 @@
+"""Helpers shared by the local benchmark scripts."""
+import importlib.util
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda')
+# Modules from the common layer are importable the same way /opt/python is in Lambda
+COMMON_LAYER_DIR = os.path.join(LAMBDA_DIR, 'common_layer', 'python')
+if COMMON_LAYER_DIR not in sys.path:
+    sys.path.insert(0, COMMON_LAYER_DIR)
+
+# boto3 needs a region and credentials to build clients, even though the
+# benchmarks swap every client for an in-process stand-in.
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+# The handlers log at INFO on the root logger; keep that out of the results
+logging.getLogger().addHandler(logging.NullHandler())
+
+
+def load_handler(function_dir, module_file, env=None):
+    """
+    Imports a Lambda module from lambda/<function_dir>/<module_file> as a fresh
+    module object, the way a new container would. File names with dashes
+    (custom-auth.py) are supported. The per-invocation request metrics are off
+    (METRICS_SAMPLE_RATE=0) unless `env` turns them on, so EMF lines stay out
+    of the result tables and the measured latencies.
+    """
+    os.environ.update({'METRICS_SAMPLE_RATE': '0', **(env or {})})
+    # Drop previously imported repo modules (e.g. the common layer) so module
+    # level state starts cold as well
+    for name, module in list(sys.modules.items()):
+        if (getattr(module, '__file__', None) or '').startswith(LAMBDA_DIR):
+            del sys.modules[name]
+    path = os.path.join(LAMBDA_DIR, function_dir, module_file)
+    name = f"bench_{function_dir}_{time.perf_counter_ns()}"
+    function_path = os.path.join(LAMBDA_DIR, function_dir)
+    if function_path not in sys.path:
+        sys.path.insert(0, function_path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def policy_grants(policy_name, path=os.path.join(REPO_ROOT, 'terraform', 'iam-roles.tf')):
+    """
+    {(action, terraform table name)} that an aws_iam_policy in iam-roles.tf
+    grants on DynamoDB tables, read from its jsonencode() statements.
+    """
+    with open(path) as f:
+        source = f.read()
+    start = source.index(f'resource "aws_iam_policy" "{policy_name}"')
+    end = source.find('\nresource "', start + 1)
+    block = source[start:end if end != -1 else len(source)]
+    grants = set()
+    statement = r'Action\s*=\s*(\[[^\]]*\]|"[^"]*").*?Resource\s*=\s*(\[[^\]]*\]|[^\n]+)'
+    for actions, resources in re.findall(statement, block, re.DOTALL):
+        for action in re.findall(r'"([^"]+)"', actions):
+            for table in re.findall(r'aws_dynamodb_table\.(\w+)\.arn', resources):
+                grants.add((action, table))
+    return grants
+
+
+class ScopedDynamoDB:
+    """
+    Wraps a low-level DynamoDB client (e.g. moto's, which allows everything) and
+    raises AccessDeniedException for calls a role's policies do not grant, so a
+    handler runs with its deployed permissions. `tables` maps the terraform
+    table names to the table names used in the benchmark.
+    """
+
+    def __init__(self, client, grants, tables):
+        self.client = client
+        self.allowed = {(action.split(':', 1)[1], tables[table]) for action, table in grants
+                        if action.startswith('dynamodb:') and table in tables}
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        operation = self.client.meta.method_to_api_mapping.get(name)
+        if operation is None:
+            return method
+
+        def call(**kwargs):
+            from botocore.exceptions import ClientError  # type: ignore
+            targets = [kwargs['TableName']] if 'TableName' in kwargs else list(kwargs.get('RequestItems', {}))
+            for table in targets:
+                if (operation, table) not in self.allowed:
+                    raise ClientError({'Error': {
+                        'Code': 'AccessDeniedException',
+                        'Message': f'not authorized to perform: dynamodb:{operation} on table {table}',
+                    }}, operation)
+            return method(**kwargs)
+        return call
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = [max(len(str(c)), *(len(str(r[c])) for r in rows)) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def postgres_credentials(dsn):
+    """Turns a libpq DSN into the DB_* secret layout the handlers expect."""
+    from psycopg2.extensions import parse_dsn
+    params = parse_dsn(dsn)
+    return {
+        'DB_HOST': params.get('host', 'localhost'),
+        'DB_PORT': params.get('port', '5432'),
+        'DB_NAME': params.get('dbname', 'postgres'),
+        'DB_USER': params.get('user', 'postgres'),
+        'DB_PASSWORD': params.get('password', ''),
+    }
+
+
+def apply_schema(dsn, reset=False):
+    """Applies db/schema.sql to a local Postgres, optionally dropping the tables first."""
+    import psycopg2
+    with open(os.path.join(REPO_ROOT, 'db', 'schema.sql')) as f:
+        schema = f.read()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            if reset:
+                cur.execute("DROP TABLE IF EXISTS table_versions, token_revocations, tokens, employees CASCADE;")
+            try:
+                cur.execute(schema)
+            except psycopg2.Error:
+                # Local builds without pgcrypto: gen_random_uuid() is built in since PG 13
+                conn.rollback()
+                if reset:
+                    cur.execute("DROP TABLE IF EXISTS table_versions, token_revocations, tokens, employees CASCADE;")
+                cur.execute('\n'.join(
+                    line for line in schema.splitlines() if not line.startswith('CREATE EXTENSION')
+                ))
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,226 @@
+"""
+Cold start of every Lambda handler: import time and first-invocation latency.
+
+Each measurement runs in a fresh interpreter, the way a new container starts:
+
+- import: the handler module is imported under `python -X importtime`; the
+  table shows the wall time, the heaviest top-level imports, and the first
+  and second invocation of a request that needs no AWS service or database
+  (CORS preflight, missing API key, empty SQS batch).
+- request: moto is loaded and the tables, parameters and secrets are set up
+  first (so boto3's own import is not counted here), then the import plus the
+  first real request is timed (GET listings, an SQS record, an authorized
+  key). The Postgres handlers need --dsn.
+
+    python benchmarks/bench_cold_start.py --runs 5 --dsn "host=localhost user=postgres"
+
+With --budget-ms the script exits non-zero when any handler's import or cold
+request takes longer, so it can gate cold-start regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MARK_BEGIN = 'bench-cold-start: begin'
+MARK_END = 'bench-cold-start: end'
+
+EVENTS_TABLE = 'bench-access-events'
+BUCKETS_TABLE = 'bench-access-event-buckets'
+STATE_TABLE = 'bench-token-state'
+API_KEY_PARAMETER = 'bench-api-key'
+
+
+def _http(method, path, query=None):
+    return {
+        'requestContext': {'http': {'method': method}},
+        'rawPath': path,
+        'routeKey': f'{method} {path}',
+        'headers': {},
+        'queryStringParameters': query or {},
+        'body': None,
+    }
+
+
+EVENT_ENV = {
+    'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+    'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+    'TOKEN_STATE_TABLE_NAME': STATE_TABLE,
+}
+
+# name: (function dir, module file, env, request without AWS/database, real first request)
+HANDLERS = {
+    'employee_crud': ('employee_crud', 'employee_crud.py', {}, _http('OPTIONS', '/employee'),
+                      _http('GET', '/employee', {'limit': '50'})),
+    'token_crud': ('token_crud', 'token_crud.py', {}, _http('OPTIONS', '/token'),
+                   _http('GET', '/token', {'limit': '50'})),
+    'access_event_rud': ('access_event_rud', 'access_event_rud.py', EVENT_ENV, _http('OPTIONS', '/events'),
+                         _http('GET', '/events', {'token': 'token-00001', 'limit': '100'})),
+    'event_handler': ('event_handler', 'event_handler.py', EVENT_ENV, {'Records': []},
+                      {'Records': [{'messageId': '1', 'body': json.dumps(
+                          {'token': 'token-00001', 'timestamp': 1700000000000, 'authorized': True})}]}),
+    'custom_auth': ('custom_auth', 'custom-auth.py', {'API_KEY_PARAMETER_NAME': API_KEY_PARAMETER},
+                    {'headers': {}}, {'headers': {'authorization': 'bench-key'}}),
+    'lambda_schema': ('lambda_schema', 'lambda_schema.py', {}, None, {}),
+}
+POSTGRES_HANDLERS = ('employee_crud', 'token_crud', 'lambda_schema')
+
+# ------------------------------ child side ------------------------------
+
+
+def _setup_aws(dsn):
+    """Creates everything the real first requests read, inside moto; returns extra env."""
+    import boto3  # type: ignore
+    # A session of its own, so the handler's clients still load their service models cold
+    session = boto3.session.Session()
+    client = session.client('dynamodb')
+    for name, range_key in ((EVENTS_TABLE, 'timestamp'), (BUCKETS_TABLE, 'bucket')):
+        client.create_table(
+            TableName=name, BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}, {'AttributeName': range_key, 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'token_id', 'AttributeType': 'S'}, {'AttributeName': range_key, 'AttributeType': 'N'}],
+        )
+    client.create_table(
+        TableName=STATE_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'token_id', 'AttributeType': 'S'}],
+    )
+    session.client('ssm').put_parameter(Name=API_KEY_PARAMETER, Value='bench-key', Type='SecureString')
+    if not dsn:
+        return {}
+    from _support import postgres_credentials
+    secret = session.client('secretsmanager').create_secret(
+        Name='bench-db', SecretString=json.dumps(postgres_credentials(dsn)))
+    return {'DB_SECRET_ARN': secret['ARN']}
+
+
+def child(name, mode, dsn):
+    # Sets the boto3 region/credentials defaults before anything creates a client
+    from _support import load_handler
+    function_dir, module_file, env, cheap_event, real_event = HANDLERS[name]
+    if mode == 'request':
+        from moto import mock_aws  # type: ignore
+        mock = mock_aws()
+        mock.start()
+        env = {**env, **_setup_aws(dsn)}
+
+    result = {}
+    sys.stderr.write(MARK_BEGIN + '\n')
+    sys.stderr.flush()
+    start = time.perf_counter()
+    module = load_handler(function_dir, module_file, env)
+    result['import_ms'] = (time.perf_counter() - start) * 1000
+    sys.stderr.flush()
+    sys.stderr.write(MARK_END + '\n')
+    sys.stderr.flush()
+
+    event = real_event if mode == 'request' else cheap_event
+    if event is not None:
+        for label in ('first_ms', 'second_ms'):
+            start = time.perf_counter()
+            response = module.lambda_handler(json.loads(json.dumps(event)), None)
+            result[label] = (time.perf_counter() - start) * 1000
+        result['status'] = response.get('statusCode', response.get('isAuthorized', 'ok')) if isinstance(response, dict) else 'ok'
+    print(json.dumps(result))
+
+# ------------------------------ parent side ------------------------------
+
+
+def _parse_importtime(stderr):
+    """(top-level module, cumulative ms) imported between the markers, heaviest first."""
+    lines = stderr.splitlines()
+    try:
+        section = lines[lines.index(MARK_BEGIN) + 1:lines.index(MARK_END)]
+    except ValueError:
+        return []
+    modules = []
+    for line in section:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, package = line.split('|')
+        if not package[1:].startswith(' '):
+            modules.append((package.strip(), int(cumulative) / 1000.0))
+    return sorted(modules, key=lambda entry: entry[1], reverse=True)
+
+
+def _run_child(name, mode, dsn, importtime):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+              [os.path.abspath(__file__), '--child', name, '--mode', mode]
+    if dsn:
+        command += ['--dsn', dsn]
+    proc = subprocess.run(command, cwd=BENCH_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'{name} ({mode}) failed:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def measure(name, runs, dsn):
+    imports, cheap_first, cheap_second, heavy = [], [], [], {}
+    for _ in range(runs):
+        result, stderr = _run_child(name, 'import', dsn, importtime=True)
+        imports.append(result['import_ms'])
+        if 'first_ms' in result:
+            cheap_first.append(result['first_ms'])
+            cheap_second.append(result['second_ms'])
+        for module, ms in _parse_importtime(stderr):
+            heavy.setdefault(module, []).append(ms)
+
+    cold, warm, statuses = [], [], set()
+    if dsn or name not in POSTGRES_HANDLERS:
+        for _ in range(runs):
+            result, _ = _run_child(name, 'request', dsn, importtime=False)
+            cold.append(result['import_ms'] + result['first_ms'])
+            warm.append(result['second_ms'])
+            statuses.add(str(result['status']))
+
+    def median(samples):
+        return round(statistics.median(samples), 1) if samples else '-'
+
+    top = sorted(((module, statistics.median(ms)) for module, ms in heavy.items()), key=lambda e: e[1], reverse=True)[:3]
+    return {
+        'handler': name,
+        'import_ms': median(imports),
+        'heaviest imports (ms)': ', '.join(f'{module} {ms:.0f}' for module, ms in top) or '-',
+        'no-AWS 1st_ms': median(cheap_first),
+        'no-AWS 2nd_ms': median(cheap_second),
+        'cold request_ms': median(cold),
+        'warm request_ms': median(warm),
+        'request status': ','.join(sorted(statuses)) or '-',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per handler and mode')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN'), help='Postgres for the CRUD and schema handlers')
+    parser.add_argument('--handlers', default=','.join(HANDLERS))
+    parser.add_argument('--budget-ms', type=float, help='fail when an import or cold request takes longer')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', default='import', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.mode, args.dsn)
+        return
+
+    from _support import print_table
+    rows = [measure(name, args.runs, args.dsn) for name in args.handlers.split(',')]
+    print_table(f"Cold start per handler (median of {args.runs} fresh interpreters)", rows)
+    if not args.dsn:
+        print('Postgres handlers were not invoked for real: pass --dsn or set BENCH_PG_DSN')
+
+    if args.budget_ms is not None:
+        over = [
+            row['handler'] for row in rows
+            if any(isinstance(row[column], float) and row[column] > args.budget_ms for column in ('import_ms', 'cold request_ms'))
+        ]
+        if over:
+            sys.exit(f"Over the {args.budget_ms:.0f} ms cold-start budget: {', '.join(over)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Authorizer latency with a local SSM stand-in.
+
+Compares the previous behaviour (one SSM round trip per request) with the
+cached authorizer at cold start, warm, and right after the TTL expires.
+
+    python benchmarks/bench_custom_auth.py --ssm-latency-ms 15 --requests 2000
+"""
+import argparse
+import time
+
+from _support import load_handler, print_table, summarize, timed
+from fakes import FakeSSM
+
+API_KEY = 'bench-api-key-0123456789abcdef'
+
+
+def _event(key):
+    return {'headers': {'authorization': key}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ssm-latency-ms', type=float, default=15.0)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--cold-starts', type=int, default=20)
+    args = parser.parse_args()
+
+    latency = args.ssm_latency_ms / 1000.0
+    env = {'API_KEY_PARAMETER_NAMES': 'dragan-api-key', 'API_KEY_CACHE_TTL_SECONDS': '300'}
+    rows = []
+
+    # Previous behaviour: GetParameter and a plain == on every request
+    ssm = FakeSSM({'dragan-api-key': API_KEY}, latency)
+
+    def legacy(event):
+        expected = ssm.get_parameter(Name='dragan-api-key', WithDecryption=True)['Parameter']['Value']
+        return {'isAuthorized': event['headers']['authorization'] == expected}
+
+    samples = [timed(legacy, _event(API_KEY))[0] for _ in range(min(args.requests, 200))]
+    rows.append({'scenario': 'per-request SSM (old)', **summarize(samples), 'ssm_calls': ssm.calls})
+
+    # Cold start: a fresh module per sample, first request pays the fetch
+    ssm = FakeSSM({'dragan-api-key': API_KEY}, latency)
+    samples = []
+    for _ in range(args.cold_starts):
+        module = load_handler('custom_auth', 'custom-auth.py', env)
+        module.lazy.set_client('ssm', ssm)
+        samples.append(timed(module.lambda_handler, _event(API_KEY), None)[0])
+    rows.append({'scenario': 'cached, cold start', **summarize(samples), 'ssm_calls': ssm.calls})
+
+    # Warm container: keys already cached
+    ssm = FakeSSM({'dragan-api-key': API_KEY}, latency)
+    module = load_handler('custom_auth', 'custom-auth.py', env)
+    module.lazy.set_client('ssm', ssm)
+    module.lambda_handler(_event(API_KEY), None)
+    samples = [timed(module.lambda_handler, _event(API_KEY), None)[0] for _ in range(args.requests)]
+    rows.append({'scenario': 'cached, warm', **summarize(samples), 'ssm_calls': ssm.calls})
+
+    # Expired TTL: stale keys are served while one background refresh runs
+    ssm.calls = 0
+    module.API_KEY_CACHE_TTL_SECONDS = 0.0
+    samples = [timed(module.lambda_handler, _event(API_KEY), None)[0] for _ in range(50)]
+    time.sleep(latency * 2)
+    rows.append({'scenario': 'cached, TTL expired', **summarize(samples), 'ssm_calls': ssm.calls})
+
+    # Rejected keys take the same path as accepted ones
+    module.API_KEY_CACHE_TTL_SECONDS = 300.0
+    ssm.calls = 0
+    samples = [timed(module.lambda_handler, _event('x' * len(API_KEY)), None)[0] for _ in range(args.requests)]
+    rows.append({'scenario': 'cached, invalid key', **summarize(samples), 'ssm_calls': ssm.calls})
+
+    print_table(f"custom-auth latency (SSM latency {args.ssm_latency_ms} ms)", rows)
+
+
+if __name__ == '__main__':
+    main()
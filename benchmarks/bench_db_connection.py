@@ -0,0 +1,78 @@
+"""
+Per-request latency of the Postgres-backed handlers with and without the
+shared warm connection, against a local Postgres.
+
+"connect per request" closes the cached connection after every invocation,
+which is what the handlers did before (connect in the handler, close in
+finally). "warm connection" keeps it across invocations.
+
+    BENCH_PG_DSN="host=localhost user=postgres password=postgres" \
+        python benchmarks/bench_db_connection.py --requests 500
+"""
+import argparse
+import json
+import os
+
+import psycopg2
+
+from _support import apply_schema, load_handler, postgres_credentials, print_table, summarize, timed
+from fakes import FakeSecretsManager
+
+
+def _seed(dsn, employees):
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO employees (first_name, last_name, email) "
+            "SELECT 'Bench', 'User' || g, 'bench' || g || '@example.com' FROM generate_series(1, %s) g "
+            "RETURNING id;",
+            (employees,)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _get_event(path, body):
+    return {
+        'requestContext': {'http': {'method': 'GET'}},
+        'rawPath': path,
+        'body': json.dumps(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN', 'host=localhost user=postgres'))
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--employees', type=int, default=1000)
+    args = parser.parse_args()
+
+    apply_schema(args.dsn, reset=True)
+    employee_ids = _seed(args.dsn, args.employees)
+    secret = postgres_credentials(args.dsn)
+
+    module = load_handler('employee_crud', 'employee_crud.py', {'DB_SECRET_ARN': 'bench-secret'})
+    import db_connection
+    db_connection.lazy.set_client('secretsmanager', FakeSecretsManager(secret))
+
+    rows = []
+    for scenario, reuse in (('connect per request', False), ('warm connection', True)):
+        db_connection.close_db_connection()
+        samples = []
+        for i in range(args.requests):
+            event = _get_event('/employee', {'employee_id': employee_ids[i % len(employee_ids)]})
+            elapsed, result = timed(module.lambda_handler, event, None)
+            assert result['statusCode'] == 200, result
+            samples.append(elapsed)
+            if not reuse:
+                db_connection.close_db_connection()
+        rows.append({'scenario': scenario, **summarize(samples)})
+
+    db_connection.close_db_connection()
+    print_table(f"employee_crud GET /employee by id ({args.requests} requests)", rows)
+
+
+if __name__ == '__main__':
+    main()
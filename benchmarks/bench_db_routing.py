@@ -0,0 +1,146 @@
+"""
+Reader/writer routing of the Postgres-backed handlers against two local Postgres
+instances: a writer and a reader (a streaming replica, or a second plain
+instance standing in for one).
+
+Runs GET /employee listings through employee_crud and reports which endpoint
+served them and how fast, for: no reader configured, a healthy reader, a
+reader that cannot be reached, a reader reporting too much lag, and reads
+right after a write from the same container.
+
+    BENCH_PG_DSN="host=localhost port=5432 user=postgres password=postgres" \\
+    BENCH_PG_READER_DSN="host=localhost port=5433 user=postgres password=postgres" \\
+        python benchmarks/bench_db_routing.py --requests 200
+"""
+import argparse
+import json
+import os
+
+import psycopg2
+
+from _support import apply_schema, load_handler, postgres_credentials, print_table, summarize, timed
+from fakes import FakeSecretsManager
+
+
+def _is_replica(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_is_in_recovery();")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _seed(dsn, employees):
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO employees (first_name, last_name, email) "
+            "SELECT 'Bench', 'User' || g, 'bench' || g || '@example.com' FROM generate_series(1, %s) g;",
+            (employees,)
+        )
+    conn.commit()
+    conn.close()
+
+
+def _request(method, body=None, query=None):
+    return {
+        'requestContext': {'http': {'method': method}},
+        'rawPath': '/employee',
+        'body': json.dumps(body or {}),
+        'queryStringParameters': query or {},
+    }
+
+
+def _run(module, db_connection, requests, write_first=False):
+    served = {db_connection.WRITER: 0, db_connection.READER: 0}
+    route_for = db_connection.route_for
+
+    def counting_route_for(readonly=False, consistent=False):
+        role = route_for(readonly, consistent)
+        if readonly:
+            served[role] += 1
+        return role
+
+    db_connection.route_for = counting_route_for
+    samples = []
+    try:
+        for i in range(requests):
+            if write_first:
+                result = module.lambda_handler(_request('POST', {
+                    'first_name': 'Routing', 'last_name': str(i), 'email': f'routing-{os.getpid()}-{i}@example.com'
+                }), None)
+                assert result['statusCode'] == 201, result
+            elapsed, result = timed(module.lambda_handler, _request('GET', query={'limit': '50'}), None)
+            assert result['statusCode'] == 200, result
+            samples.append(elapsed)
+    finally:
+        db_connection.route_for = route_for
+    return served, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN', 'host=localhost user=postgres'))
+    parser.add_argument('--reader-dsn', default=os.environ.get('BENCH_PG_READER_DSN', 'host=localhost port=5433 user=postgres'))
+    parser.add_argument('--unreachable-port', default='5999', help='a port with no Postgres, for the reader-down case')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--employees', type=int, default=1000)
+    args = parser.parse_args()
+
+    apply_schema(args.dsn, reset=True)
+    _seed(args.dsn, args.employees)
+    if not _is_replica(args.reader_dsn):
+        # Stand-in reader: same schema and rows, but no replication
+        apply_schema(args.reader_dsn, reset=True)
+        _seed(args.reader_dsn, args.employees)
+
+    writer = postgres_credentials(args.dsn)
+    reader = postgres_credentials(args.reader_dsn)
+    with_reader = {**writer, 'DB_READER_HOST': reader['DB_HOST'], 'DB_READER_PORT': reader['DB_PORT']}
+
+    module = load_handler('employee_crud', 'employee_crud.py', {
+        'DB_SECRET_ARN': 'bench-secret',
+        'DB_READ_AFTER_WRITE_SECONDS': '5',
+    })
+    import db_connection
+
+    def configure(secret):
+        db_connection.close_db_connection()
+        db_connection.lazy.set_client('secretsmanager', FakeSecretsManager(secret))
+        db_connection.db_creds = None
+        db_connection._reader_down_until = 0.0
+        db_connection._reader_lag.update(checked_at=None, seconds=None)
+        db_connection._last_write = None
+
+    scenarios = [
+        ('no reader configured', writer, None, False),
+        ('healthy reader', with_reader, None, False),
+        ('reader unreachable', {**with_reader, 'DB_READER_PORT': args.unreachable_port}, None, False),
+        ('reader lagging', with_reader, 60.0, False),
+        ('read after write', with_reader, None, True),
+    ]
+    rows = []
+    lag_probe = db_connection._replica_lag_seconds
+    for name, secret, forced_lag, write_first in scenarios:
+        configure(secret)
+        if forced_lag is not None:
+            db_connection._replica_lag_seconds = lambda conn: forced_lag
+        try:
+            served, samples = _run(module, db_connection, args.requests, write_first)
+        finally:
+            db_connection._replica_lag_seconds = lag_probe
+        rows.append({
+            'scenario': name,
+            'reader': served[db_connection.READER],
+            'writer': served[db_connection.WRITER],
+            **summarize(samples),
+        })
+
+    db_connection.close_db_connection()
+    print_table(f"employee_crud GET /employee listing ({args.requests} requests per scenario)", rows)
+
+
+if __name__ == '__main__':
+    main()
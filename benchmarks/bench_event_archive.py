@@ -0,0 +1,163 @@
+"""
+Hot/cold tiering of the access events (event_archive.py).
+
+Loads a month of synthetic events (a few busy doors and a long tail) that are
+all older than the archive cutoff into a moto DynamoDB table, runs the archive
+job into a local directory and reports the storage of both tiers: DynamoDB
+bytes (100 bytes of overhead per item, the ALL-projection GSI doubling it)
+against the Parquet files. It then reads the history of random tokens over a
+historical range three ways:
+
+  manifest + pushdown  event_archive.query_token_events, as GET /events?tier=all:
+                       only the token's file of each day, row groups skipped
+                       by their token/time statistics
+  pushdown only        the whole archive as one hive-partitioned dataset with
+                       the same filter: every file's footer is read
+  no pushdown          every file read in full and filtered afterwards
+
+    python benchmarks/bench_event_archive.py --events 20000 --tokens 500 --days 30
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from _support import load_handler, percentile, print_table, timed
+
+try:
+    import boto3  # type: ignore
+    from moto import mock_aws  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    raise SystemExit('This benchmark needs boto3, moto and pyarrow (pip install moto pyarrow)')
+
+from bench_event_storage import EVENTS_TABLE, BUCKETS_TABLE, create_tables, item_size
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def workload(events, tokens, first_day, days, seed):
+    """Zipf-like door popularity over `days` whole days starting at `first_day`."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(tokens)]
+    names = [f'token-{rank:05d}' for rank in range(tokens)]
+    rows = {}
+    for token_id in rng.choices(names, weights=weights, k=events):
+        rows[(token_id, first_day + rng.randrange(days * DAY_MS))] = rng.random() < 0.9
+    return rows, names
+
+
+def archive_files(root):
+    files = []
+    for directory, _, names in os.walk(root):
+        files.extend(os.path.join(directory, name) for name in names if name.endswith('.parquet'))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--range-days', type=int, default=7, help='length of each historical query')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='event-archive-')
+    after_days = 90
+    today = int(time.time() * 1000) // DAY_MS * DAY_MS
+    first_day = today - (after_days + args.days) * DAY_MS
+    rows, names = workload(args.events, args.tokens, first_day, args.days, args.seed)
+
+    with mock_aws():
+        client = boto3.client('dynamodb')
+        create_tables(client)
+        env = {
+            'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+            'EVENT_STORAGE_MODE': 'item',
+            'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+            'ARCHIVE_LOCATION': root,
+        }
+        archive = load_handler('access_event_rud', 'event_archive.py', env)
+        time_bucket = sys.modules['event_buckets'].time_bucket
+
+        items = []
+        with boto3.resource('dynamodb').Table(EVENTS_TABLE).batch_writer() as batch:
+            for (token_id, timestamp), authorized in rows.items():
+                item = {'token_id': token_id, 'timestamp': timestamp, 'authorized': authorized,
+                        'time_bucket': time_bucket(token_id, timestamp)}
+                batch.put_item(Item=item)
+                items.append(item)
+        hot_bytes = sum(item_size(item) + 100 for item in items)
+
+        seconds, result = timed(archive.archive, root, after_days, first_day)
+
+    files = archive_files(root)
+    cold_bytes = sum(os.path.getsize(path) for path in files)
+    print_table(f'{len(rows)} events, {args.tokens} tokens, {args.days} days', [
+        {'tier': 'DynamoDB table', 'bytes': hot_bytes, 'bytes/event': round(hot_bytes / len(rows), 1)},
+        {'tier': 'DynamoDB table + GSI', 'bytes': hot_bytes * 2, 'bytes/event': round(hot_bytes * 2 / len(rows), 1)},
+        {'tier': f'Parquet ({len(files)} files)', 'bytes': cold_bytes, 'bytes/event': round(cold_bytes / len(rows), 1)},
+    ])
+    print(f"\nArchive run: {result['rows']} events over {result['days']} days in {seconds:.2f} s "
+          f"(moto DynamoDB), {result['expired']} hot items given a TTL")
+
+    rng = random.Random(args.seed)
+    # _manifest.json is skipped like every file starting with '_'
+    whole = ds.dataset(root, format='parquet', partitioning='hive')
+
+    def pushdown_only(token_id, lower, upper):
+        condition = (ds.field('token_id') == token_id) & (ds.field('timestamp') >= lower) & (ds.field('timestamp') <= upper)
+        return whole.to_table(filter=condition, columns=['token_id', 'timestamp', 'authorized']).num_rows
+
+    def no_pushdown(token_id, lower, upper):
+        matched = 0
+        for path in files:
+            table = pq.read_table(path)
+            mask = pc.and_(pc.equal(table['token_id'], token_id),
+                           pc.and_(pc.greater_equal(table['timestamp'], lower), pc.less_equal(table['timestamp'], upper)))
+            matched += pc.sum(mask).as_py() or 0
+        return matched
+
+    def tiered(token_id, lower, upper):
+        return len(archive.query_token_events(token_id, lower, upper, 10 ** 9)[0])
+
+    queries = []
+    for _ in range(args.queries):
+        lower = first_day + rng.randrange(max(1, args.days - args.range_days + 1)) * DAY_MS
+        queries.append((rng.choice(names), lower, lower + args.range_days * DAY_MS - 1))
+
+    table = []
+    expected = None
+    for name, read in (('manifest + pushdown', tiered), ('pushdown only', pushdown_only), ('no pushdown', no_pushdown)):
+        read(*queries[0])
+        samples, counts = [], []
+        for query in queries:
+            elapsed, count = timed(read, *query)
+            samples.append(elapsed)
+            counts.append(count)
+        if expected is None:
+            expected = counts
+        elif counts != expected:
+            print(f'warning: {name} returned different counts')
+        table.append({
+            'read': name,
+            'files/query': args.range_days if name == 'manifest + pushdown' else len(files),
+            'mean_ms': round(statistics.mean(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p99_ms': round(percentile(samples, 99) * 1000, 3),
+            'events/query': round(statistics.mean(counts), 1),
+        })
+    print_table(f'{args.queries} token histories of {args.range_days} days from the archive', table)
+    shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
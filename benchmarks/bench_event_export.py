@@ -0,0 +1,62 @@
+"""
+Parallel segmented scan export against an in-process DynamoDB stand-in.
+
+Runs event_export.export_events with increasing segment counts and reports
+rows per second and the speedup over a single segment. Scaling is close to
+linear while scan round trips dominate; once NDJSON serialization saturates
+the interpreter it levels off.
+
+    python benchmarks/bench_event_export.py --rows 200000 --scan-latency-ms 20
+"""
+import argparse
+import os
+import tempfile
+
+from _support import load_handler, print_table
+from fakes import FakeDynamoDB
+
+TABLE = 'bench-access-events'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--tokens', type=int, default=2000)
+    parser.add_argument('--scan-latency-ms', type=float, default=50.0)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--segments', default='1,2,4,8,16')
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeDynamoDB(latency=args.scan_latency_ms / 1000.0, page_size=args.page_size)
+    fake.create_table(TABLE)
+    for i in range(args.rows):
+        fake._store(TABLE, {
+            'token_id': {'S': f'token-{i % args.tokens:05d}'},
+            'timestamp': {'N': str(1700000000000 + i)},
+            'authorized': {'BOOL': i % 7 != 0},
+        })
+
+    exporter = load_handler('access_event_rud', 'event_export.py')
+    rows = []
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for segments in (int(s) for s in args.segments.split(',')):
+            destination = os.path.join(tmp, f'export-{segments}.ndjson' + ('.gz' if args.gzip else ''))
+            result = exporter.export_events(TABLE, destination, segments, args.gzip, client=fake)
+            assert result['rows'] == args.rows, result
+            baseline = baseline or result['rows_per_second']
+            rows.append({
+                'segments': segments,
+                'rows': result['rows'],
+                'seconds': result['seconds'],
+                'rows_per_second': result['rows_per_second'],
+                'speedup': round(result['rows_per_second'] / baseline, 2),
+                'file_bytes': os.path.getsize(destination),
+            })
+
+    print_table(f"parallel scan export ({args.rows} rows, scan latency {args.scan_latency_ms} ms/page)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Storage size and read/write units: one item per event vs packed hour buckets.
+
+Feeds the same synthetic workload (a few busy doors and a long tail) through
+the SQS event handler in EVENT_STORAGE_MODE=item and =bucket, then reads the
+busiest tokens back through GET /events. Capacity is priced the way DynamoDB
+bills it: writes per started 1 KB of the item (an UpdateItem on the larger of
+the old and new item), reads per started 4 KB of the items a query touched
+(eventually consistent, half a unit), storage with 100 bytes of overhead per
+item. Needs moto for the update/list_append semantics.
+
+    python benchmarks/bench_event_storage.py --events 20000 --tokens 500
+"""
+import argparse
+import builtins
+import json
+import math
+import random
+from decimal import Decimal
+
+from _support import load_handler, print_table
+
+try:
+    import boto3  # type: ignore
+    from boto3.dynamodb.types import TypeDeserializer  # type: ignore
+    from moto import mock_aws  # type: ignore
+except ImportError:
+    raise SystemExit('This benchmark needs boto3 and moto (pip install moto)')
+
+EVENTS_TABLE = 'bench-access-events'
+BUCKETS_TABLE = 'bench-access-event-buckets'
+HOUR_MS = 3600 * 1000
+
+_deserializer = TypeDeserializer()
+
+
+def value_size(value):
+    """Approximate DynamoDB size of a Python-typed attribute value."""
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, Decimal, float)):
+        digits = len(str(abs(Decimal(value))).replace('.', '').strip('0')) or 1
+        return math.ceil(digits / 2) + 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (list, set)):
+        return 3 + sum(1 + value_size(v) for v in value)
+    if isinstance(value, dict):
+        return 3 + sum(len(k) + 1 + value_size(v) for k, v in value.items())
+    raise TypeError(type(value))
+
+
+def item_size(item, low_level=False):
+    if low_level:
+        item = {k: _deserializer.deserialize(v) for k, v in item.items()}
+    return sum(len(name) + value_size(value) for name, value in item.items())
+
+
+class MeteredClient:
+    """Wraps a low-level DynamoDB client and prices every write call."""
+
+    def __init__(self, client):
+        self.client = client
+        self.write_calls = 0
+        self.wcu = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self.write_calls += 1
+        for requests in RequestItems.values():
+            for request in requests:
+                self.wcu += math.ceil(item_size(request['PutRequest']['Item'], low_level=True) / 1024)
+        return self.client.batch_write_item(RequestItems=RequestItems, **kwargs)
+
+    def update_item(self, TableName, Key, **kwargs):
+        self.write_calls += 1
+        before = self.client.get_item(TableName=TableName, Key=Key).get('Item')
+        try:
+            return self.client.update_item(TableName=TableName, Key=Key, **kwargs)
+        finally:
+            after = self.client.get_item(TableName=TableName, Key=Key).get('Item')
+            largest = max(item_size(item, low_level=True) for item in (before, after) if item) if (before or after) else 0
+            # A failed condition check still consumes at least one unit
+            self.wcu += max(1, math.ceil(largest / 1024))
+
+
+def meter_reads(client):
+    """Patches a resource's client so every query is priced; returns the counters."""
+    counters = {'calls': 0, 'rcu': 0.0}
+    query = client.query
+
+    def metered_query(**kwargs):
+        response = query(**kwargs)
+        counters['calls'] += 1
+        touched = sum(item_size(item) for item in response.get('Items', []))
+        counters['rcu'] += max(1, math.ceil(touched / 4096)) * 0.5
+        return response
+
+    client.query = metered_query
+    return counters
+
+
+def create_tables(client):
+    for name, range_key in ((EVENTS_TABLE, 'timestamp'), (BUCKETS_TABLE, 'bucket')):
+        client.create_table(
+            TableName=name,
+            BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}, {'AttributeName': range_key, 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'token_id', 'AttributeType': 'S'},
+                {'AttributeName': range_key, 'AttributeType': 'N'},
+                {'AttributeName': 'time_bucket', 'AttributeType': 'S'},
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'time_bucket_index',
+                'KeySchema': [{'AttributeName': 'time_bucket', 'KeyType': 'HASH'}, {'AttributeName': range_key, 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'},
+            }],
+        )
+
+
+def workload(events, tokens, hours, seed):
+    """Zipf-like door popularity, arrival order roughly by time."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(tokens)]
+    names = [f'token-{rank:05d}' for rank in range(tokens)]
+    start = 1700000000000 - 1700000000000 % HOUR_MS
+    rows = []
+    for token_id in rng.choices(names, weights=weights, k=events):
+        rows.append((token_id, start + rng.randrange(hours * HOUR_MS), rng.random() < 0.9))
+    rows.sort(key=lambda row: row[1] + rng.randrange(5000))
+    return rows, names, start
+
+
+def table_storage(client, table_name):
+    items = 0
+    size = 0
+    args = {'TableName': table_name}
+    while True:
+        response = client.scan(**args)
+        for item in response['Items']:
+            items += 1
+            size += item_size(item, low_level=True) + 100
+        if 'LastEvaluatedKey' not in response:
+            return items, size
+        args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def run_mode(mode, rows, busiest, start, hours, batch_size, max_events):
+    env = {
+        'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+        'EVENT_STORAGE_MODE': mode,
+        'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+        'PACKED_BUCKET_MAX_EVENTS': str(max_events),
+    }
+    handler = load_handler('event_handler', 'event_handler.py', env)
+    metered = MeteredClient(boto3.client('dynamodb'))
+    handler.lazy.set_client('dynamodb', metered)
+
+    for offset in range(0, len(rows), batch_size):
+        records = [
+            {'messageId': str(offset + i), 'body': json.dumps({'token': token_id, 'timestamp': ts, 'authorized': authorized})}
+            for i, (token_id, ts, authorized) in enumerate(rows[offset:offset + batch_size])
+        ]
+        response = handler.lambda_handler({'Records': records}, None)
+        if response['batchItemFailures']:
+            raise RuntimeError(f'{mode}: {len(response["batchItemFailures"])} failed records')
+
+    reader = load_handler('access_event_rud', 'access_event_rud.py', env)
+    reads = meter_reads(reader.lazy.dynamodb_resource().meta.client)
+    returned = 0
+    for token_id in busiest:
+        cursor = None
+        while True:
+            query = {'token': token_id, 'from': str(start), 'to': str(start + hours * HOUR_MS - 1), 'limit': '1000'}
+            if cursor:
+                query['next'] = cursor
+            response = reader.lambda_handler({
+                'requestContext': {'http': {'method': 'GET'}},
+                'routeKey': 'GET /events',
+                'queryStringParameters': query,
+            }, None)
+            page = json.loads(response['body'])
+            returned += len(page['items'])
+            cursor = page['next']
+            if not cursor:
+                break
+
+    table_name = BUCKETS_TABLE if mode == 'bucket' else EVENTS_TABLE
+    items, size = table_storage(metered.client, table_name)
+    return {
+        'items': items,
+        'bytes': size,
+        'write_calls': metered.write_calls,
+        'wcu': metered.wcu,
+        'read_calls': reads['calls'],
+        'rcu': reads['rcu'],
+        'returned': returned,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--batch-size', type=int, default=10, help='SQS messages per invocation')
+    parser.add_argument('--max-events', type=int, default=2000, help='PACKED_BUCKET_MAX_EVENTS')
+    parser.add_argument('--read-tokens', type=int, default=5, help='busiest tokens read back')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rows, names, start = workload(args.events, args.tokens, args.hours, args.seed)
+    busiest = names[:args.read_tokens]
+
+    results = {}
+    with mock_aws():
+        create_tables(boto3.client('dynamodb'))
+        quiet = builtins.print
+        builtins.print = lambda *a, **k: None  # the handlers log every batch
+        try:
+            for mode in ('item', 'bucket'):
+                results[mode] = run_mode(mode, rows, busiest, start, args.hours, args.batch_size, args.max_events)
+        finally:
+            builtins.print = quiet
+
+    if results['item']['returned'] != results['bucket']['returned']:
+        raise SystemExit('read-back mismatch between layouts')
+
+    rows_out = [
+        {
+            'layout': mode,
+            'items': r['items'],
+            'KiB stored': f"{r['bytes'] / 1024:.1f}",
+            'write calls': r['write_calls'],
+            'WCU': r['wcu'],
+            'WCU/event': f"{r['wcu'] / args.events:.2f}",
+            'read calls': r['read_calls'],
+            'RCU': f"{r['rcu']:.1f}",
+        }
+        for mode, r in results.items()
+    ]
+    print_table(
+        f"{args.events} events, {args.tokens} tokens over {args.hours} h; "
+        f"read back {results['item']['returned']} events of the {args.read_tokens} busiest tokens",
+        rows_out
+    )
+    item, bucket = results['item'], results['bucket']
+    print(f"bucket vs item: storage x{bucket['bytes'] / item['bytes']:.2f}, "
+          f"WCU x{bucket['wcu'] / item['wcu']:.2f}, RCU x{bucket['rcu'] / item['rcu']:.2f} "
+          f"(base table only; the ALL-projection GSI roughly doubles storage and writes for both)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+SQS redelivery storms against the event handler: what duplicate batches cost.
+
+Delivers --batches SQS batches of single-event messages once, then redelivers
+every batch --redeliveries more times (ApproximateReceiveCount 2, 3, ...), each
+delivery landing on one of --containers warm containers at random, the way a
+Lambda error or timeout storm plays out. Runs three configurations on moto
+DynamoDB, with the calls limited to what the event handler's role grants in
+terraform/iam-roles.tf (--storage bucket uses the packed layout):
+
+  overwrite           no LRU, no conditional writes (every delivery is rewritten)
+  conditional         redelivered records use PutItem + attribute_not_exists
+  LRU + conditional   the defaults: repeats seen by the same container are
+                      skipped without I/O, the rest are conditional
+
+Writes are priced the way DynamoDB bills them: one unit per started 1 KB of
+the item, also for a rejected conditional write. Token state accuracy compares
+the events counted into the state items (event_count) with the number of
+distinct events.
+
+    python benchmarks/bench_ingest_redelivery.py --batches 200 --redeliveries 2 --containers 4
+    python benchmarks/bench_ingest_redelivery.py --storage bucket
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import time
+
+from _support import ScopedDynamoDB, load_handler, policy_grants, print_table
+
+try:
+    import boto3  # type: ignore
+    from moto import mock_aws  # type: ignore
+except ImportError:
+    raise SystemExit('This benchmark needs boto3 and moto (pip install moto)')
+
+from bench_event_storage import EVENTS_TABLE, BUCKETS_TABLE, create_tables, item_size
+
+STATE_TABLE = 'bench-token-state'
+# The event handler role's DynamoDB policy, and the tables it names
+HANDLER_POLICY = 'dynamodb_put_policy'
+HANDLER_TABLES = {'access_events': EVENTS_TABLE, 'access_event_buckets': BUCKETS_TABLE, 'token_state': STATE_TABLE}
+CONFIGS = {
+    'overwrite': {'INGEST_DEDUP_CACHE_SIZE': '0', 'INGEST_CONDITIONAL_WRITES': 'never'},
+    'conditional': {'INGEST_DEDUP_CACHE_SIZE': '0', 'INGEST_CONDITIONAL_WRITES': 'redelivered'},
+    'LRU + conditional': {'INGEST_DEDUP_CACHE_SIZE': '20000', 'INGEST_CONDITIONAL_WRITES': 'redelivered'},
+}
+
+
+class WriteMeter:
+    """Wraps a low-level DynamoDB client and counts write calls and units per table."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = {}
+        self.wcu = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _count(self, table_name, units):
+        self.calls[table_name] = self.calls.get(table_name, 0) + 1
+        self.wcu[table_name] = self.wcu.get(table_name, 0) + units
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for table_name, requests in RequestItems.items():
+            self._count(table_name, sum(
+                math.ceil(item_size(request['PutRequest']['Item'], low_level=True) / 1024) for request in requests
+            ))
+        return self.client.batch_write_item(RequestItems=RequestItems, **kwargs)
+
+    def put_item(self, TableName, Item, **kwargs):
+        # A failed condition check is billed like the write would have been
+        self._count(TableName, max(1, math.ceil(item_size(Item, low_level=True) / 1024)))
+        return self.client.put_item(TableName=TableName, Item=Item, **kwargs)
+
+    def update_item(self, TableName, **kwargs):
+        self._count(TableName, 1)
+        return self.client.update_item(TableName=TableName, **kwargs)
+
+
+def deliveries(batches, batch_size, redeliveries, tokens, seed):
+    """Every batch once, then the redeliveries, as (receive count, records)."""
+    rng = random.Random(seed)
+    start = 1700000000000
+    first = []
+    for b in range(batches):
+        first.append([
+            {
+                'messageId': f'msg-{b}-{n}',
+                'body': json.dumps({'token': f'token-{rng.randrange(tokens):04d}',
+                                    'timestamp': start + (b * batch_size + n) * 1000,
+                                    'authorized': rng.random() < 0.9}),
+            }
+            for n in range(batch_size)
+        ])
+    plan = [(1, records) for records in first]
+    for count in range(2, redeliveries + 2):
+        plan.extend((count, records) for records in first)
+    return plan
+
+
+def distinct_events(client, storage):
+    if storage == 'item':
+        return client.scan(TableName=EVENTS_TABLE, Select='COUNT')['Count']
+    from event_packing import unpack_events
+    return sum(
+        len(unpack_events(item['token_id']['S'], item['bucket']['N'], [value['N'] for value in item['events']['L']]))
+        for item in client.scan(TableName=BUCKETS_TABLE)['Items']
+    )
+
+
+def run(name, env, plan, containers, seed, storage='item'):
+    with mock_aws():
+        client = boto3.client('dynamodb')
+        create_tables(client)
+        client.create_table(
+            TableName=STATE_TABLE, BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'token_id', 'AttributeType': 'S'}],
+        )
+        meter = WriteMeter(ScopedDynamoDB(client, policy_grants(HANDLER_POLICY), HANDLER_TABLES))
+        env = {
+            'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+            'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+            'EVENT_STORAGE_MODE': storage,
+            'TOKEN_STATE_TABLE_NAME': STATE_TABLE,
+            **env,
+        }
+        handlers = []
+        for _ in range(containers):
+            handler = load_handler('event_handler', 'event_handler.py', env)
+            handler.lazy.set_client('dynamodb', meter)
+            handlers.append(handler)
+
+        rng = random.Random(seed)
+        totals = {'IngestSkippedMessages': 0, 'IngestSkippedEvents': 0, 'IngestDuplicateEvents': 0}
+        log = io.StringIO()
+        elapsed = 0.0
+        with contextlib.redirect_stdout(log):
+            for count, records in plan:
+                event = {'Records': [{**record, 'attributes': {'ApproximateReceiveCount': str(count)}} for record in records]}
+                started = time.perf_counter()
+                response = rng.choice(handlers).lambda_handler(event, None)
+                elapsed += time.perf_counter() - started
+                if response['batchItemFailures']:
+                    raise RuntimeError(f'{name}: {len(response["batchItemFailures"])} failed records')
+        for line in log.getvalue().splitlines():
+            if line.startswith('{') and 'IngestEvents' in line:
+                record = json.loads(line)
+                for metric in totals:
+                    totals[metric] += record[metric]
+
+        distinct = distinct_events(client, storage)
+        counted = 0
+        for item in client.scan(TableName=STATE_TABLE)['Items']:
+            if item['token_id']['S'].startswith('token-'):
+                counted += int(item.get('event_count', {}).get('N', '0'))
+
+    table = EVENTS_TABLE if storage == 'item' else BUCKETS_TABLE
+    return {
+        'config': name,
+        'event_writes': meter.calls.get(table, 0),
+        'event_wcu': meter.wcu.get(table, 0),
+        'state_writes': meter.calls.get(STATE_TABLE, 0),
+        'skipped_msgs': totals['IngestSkippedMessages'],
+        'skipped_events': totals['IngestSkippedEvents'],
+        'duplicates': totals['IngestDuplicateEvents'],
+        'state_count/events': f'{counted}/{distinct}',
+        'handler_ms': round(elapsed * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--redeliveries', type=int, default=2)
+    parser.add_argument('--containers', type=int, default=4)
+    parser.add_argument('--tokens', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=3)
+    parser.add_argument('--storage', choices=('item', 'bucket'), default='item')
+    args = parser.parse_args()
+
+    plan = deliveries(args.batches, args.batch_size, args.redeliveries, args.tokens, args.seed)
+    rows = [run(name, env, plan, args.containers, args.seed, args.storage) for name, env in CONFIGS.items()]
+    print_table(
+        f'{args.batches} batches of {args.batch_size} events ({args.storage} layout), each redelivered '
+        f'{args.redeliveries}x across {args.containers} containers ({len(plan)} deliveries)', rows
+    )
+
+
+if __name__ == '__main__':
+    main()
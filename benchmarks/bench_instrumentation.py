@@ -0,0 +1,127 @@
+"""
+Overhead of the request instrumentation (instrumentation.py) per invocation.
+
+Times the same handlers bare (the function under @instrumented) and
+instrumented at several METRICS_SAMPLE_RATE values, and the previous
+`print(json.dumps(event))` of every event that DEBUG_EVENT_SAMPLE_RATE now
+makes opt-in. Two handlers are measured: an empty one that only enters every
+stage (the pure cost of the decorator and the stage blocks) and the warm
+authorizer against an in-process SSM stand-in. Log output goes to a counter
+instead of the terminal, so its cost is the encoding, and its size is reported
+per request.
+
+    python benchmarks/bench_instrumentation.py --requests 20000
+"""
+import argparse
+import contextlib
+import json
+import statistics
+import sys
+
+from _support import load_handler, percentile, print_table, timed
+from fakes import FakeSSM
+
+API_KEY = 'bench-api-key-0123456789abcdef'
+
+
+class CountingStream:
+    """stdout stand-in that only counts what is written."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def http_event():
+    """A typical HTTP API v2 event as API Gateway delivers it to the authorizer and the API."""
+    return {
+        'version': '2.0',
+        'routeKey': 'GET /events',
+        'rawPath': '/events',
+        'rawQueryString': 'token=0b7c1f4e-2f1c-4c7e-9d1a-5e0f3a9b8c7d&limit=100',
+        'headers': {
+            'accept': 'application/json', 'accept-encoding': 'gzip, deflate, br',
+            'authorization': API_KEY, 'host': 'api.example.com', 'user-agent': 'Mozilla/5.0 (X11; Linux x86_64)',
+            'x-amzn-trace-id': 'Root=1-65a1b2c3-0123456789abcdef01234567', 'x-forwarded-for': '203.0.113.7',
+            'x-forwarded-port': '443', 'x-forwarded-proto': 'https',
+        },
+        'queryStringParameters': {'token': '0b7c1f4e-2f1c-4c7e-9d1a-5e0f3a9b8c7d', 'limit': '100'},
+        'requestContext': {
+            'accountId': '123456789012', 'apiId': 'abcdef1234', 'domainName': 'api.example.com',
+            'http': {'method': 'GET', 'path': '/events', 'protocol': 'HTTP/1.1', 'sourceIp': '203.0.113.7',
+                     'userAgent': 'Mozilla/5.0 (X11; Linux x86_64)'},
+            'requestId': 'Ab1Cd2Ef3Gh4=', 'routeKey': 'GET /events', 'stage': '$default',
+            'time': '17/Oct/2026:10:00:00 +0000', 'timeEpoch': 1792231200000,
+        },
+        'isBase64Encoded': False,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--sample-rates', default='0,0.1,1')
+    args = parser.parse_args()
+
+    auth = load_handler('custom_auth', 'custom-auth.py', {'API_KEY_PARAMETER_NAMES': 'bench-api-key'})
+    auth.lazy.set_client('ssm', FakeSSM({'bench-api-key': API_KEY}))
+    # The instance the handler module imported (load_handler starts the layer afresh)
+    instrumentation = sys.modules['instrumentation']
+
+    def empty(event, context):
+        for name in instrumentation.STAGES:
+            with instrumentation.stage(name):
+                pass
+        return {'statusCode': 200}
+
+    def legacy_logging(event, context):
+        print(f"Received event: {json.dumps(event)}")
+        return {'statusCode': 200}
+
+    handlers = {
+        'empty, 6 stages': (empty, instrumentation.instrumented()(empty)),
+        'authorizer, warm': (auth.lambda_handler.__wrapped__, auth.lambda_handler),
+    }
+    event = http_event()
+    rows = []
+    stream = CountingStream()
+    with contextlib.redirect_stdout(stream):
+        auth.lambda_handler(event, None)
+
+        def measure(name, variant, fn, rate=None):
+            if rate is not None:
+                instrumentation.METRICS_SAMPLE_RATE = rate
+            for _ in range(100):
+                fn(event, None)
+            stream.bytes = 0
+            samples = [timed(fn, event, None)[0] for _ in range(args.requests)]
+            rows.append({
+                'handler': name,
+                'variant': variant,
+                'mean_us': round(statistics.mean(samples) * 1e6, 2),
+                'p50_us': round(percentile(samples, 50) * 1e6, 2),
+                'p99_us': round(percentile(samples, 99) * 1e6, 2),
+                'log_bytes/req': round(stream.bytes / args.requests, 1),
+            })
+
+        for name, (bare, wrapped) in handlers.items():
+            measure(name, 'bare', bare)
+            for rate in (float(r) for r in args.sample_rates.split(',')):
+                measure(name, f'instrumented, sample rate {rate:g}', wrapped, rate)
+        measure('any handler', 'print(json.dumps(event)) per request (before)', legacy_logging)
+
+    baseline = {row['handler']: row['mean_us'] for row in rows if row['variant'] == 'bare'}
+    for row in rows:
+        bare = baseline.get(row['handler'])
+        row['overhead_us'] = round(row['mean_us'] - bare, 2) if bare is not None else '-'
+    print_table(f'Instrumentation overhead ({args.requests} invocations each)', rows)
+
+
+if __name__ == '__main__':
+    main()
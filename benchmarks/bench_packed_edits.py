@@ -0,0 +1,108 @@
+"""
+Edits after a partial purge in the packed layout (EVENT_STORAGE_MODE=bucket).
+
+Readers keep the value from the highest part of an hour, so an edit must never
+land in a lower part than an older copy of the same event. This fills part 0
+of an hour, edits one of its events (the edit rolls over to part 1), purges
+other events of that hour (which trims part 0), then edits the same event
+again from a fresh container and reads it back through GET /events. Runs on
+moto; exits non-zero when a read returns a stale value.
+
+    python benchmarks/bench_packed_edits.py --part-size 4
+"""
+import argparse
+import builtins
+import json
+import sys
+
+from _support import load_handler, print_table
+
+try:
+    import boto3  # type: ignore
+    from moto import mock_aws  # type: ignore
+except ImportError:
+    raise SystemExit('This benchmark needs boto3 and moto (pip install moto)')
+
+from bench_event_storage import EVENTS_TABLE, BUCKETS_TABLE, HOUR_MS, create_tables
+
+TOKEN = 'token-edits'
+HOUR = 1700000000000 // HOUR_MS * HOUR_MS
+
+
+def request(handler, method, body=None, query=None):
+    response = handler.lambda_handler({
+        'httpMethod': method,
+        'resource': '/events',
+        'body': json.dumps(body) if body else None,
+        'queryStringParameters': query,
+    }, None)
+    if response['statusCode'] >= 300:
+        raise RuntimeError(f'{method} /events: {response["statusCode"]} {response["body"]}')
+    return json.loads(response['body'])
+
+
+def stored_value(handler, timestamp):
+    """`authorized` of one event as GET /events returns it."""
+    listing = request(handler, 'GET', query={'token': TOKEN, 'from': str(timestamp), 'to': str(timestamp)})
+    events = [event for event in listing['items'] if event['timestamp'] == timestamp]
+    return events[0]['authorized'] if events else None
+
+
+def parts(client):
+    return {
+        int(item['bucket']['N']) - HOUR: (len(item.get('events', {}).get('L', [])), 'sealed' in item)
+        for item in client.scan(TableName=BUCKETS_TABLE)['Items']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--part-size', type=int, default=4, help='PACKED_BUCKET_MAX_EVENTS')
+    args = parser.parse_args()
+
+    env = {
+        'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+        'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+        'EVENT_STORAGE_MODE': 'bucket',
+        'PACKED_BUCKET_MAX_EVENTS': str(args.part_size),
+    }
+    edited = HOUR + 1000
+    purged = (HOUR + 2000, HOUR + 1000 * args.part_size - 1000)
+    rows = []
+    with mock_aws():
+        client = boto3.client('dynamodb')
+        create_tables(client)
+        quiet = builtins.print
+        builtins.print = lambda *a, **k: None  # the handlers log every request
+        try:
+            handler = load_handler('access_event_rud', 'access_event_rud.py', env)
+            for n in range(1, args.part_size + 1):
+                request(handler, 'PUT', {'token_id': TOKEN, 'timestamp': HOUR + n * 1000, 'authorized': True})
+            request(handler, 'PUT', {'token_id': TOKEN, 'timestamp': edited, 'authorized': False})
+            rows.append({'step': 'edit rolls over to part 1', 'expected': False,
+                         'read': stored_value(handler, edited), 'parts': parts(client)})
+
+            request(handler, 'DELETE', {'token_id': TOKEN, 'from': purged[0], 'to': purged[1]})
+            rows.append({'step': 'purge trims part 0', 'expected': False,
+                         'read': stored_value(handler, edited), 'parts': parts(client)})
+
+            # A new container does not know which part is open and starts at part 0
+            handler = load_handler('access_event_rud', 'access_event_rud.py', env)
+            request(handler, 'PUT', {'token_id': TOKEN, 'timestamp': edited, 'authorized': True})
+            rows.append({'step': 'edit after the trim', 'expected': True,
+                         'read': stored_value(handler, edited), 'parts': parts(client)})
+        finally:
+            builtins.print = quiet
+
+    for row in rows:
+        row['ok'] = row['read'] == row['expected']
+        row['parts'] = ', '.join(
+            f'{part}: {count}{" sealed" if sealed else ""}' for part, (count, sealed) in sorted(row['parts'].items())
+        )
+    print_table(f'Edits of one event around a partial purge ({args.part_size} events per part)', rows)
+    if not all(row['ok'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Response serialization of a large GET /events page: time and payload size.
+
+Builds a result set shaped like what the boto3 resource returns (numbers as
+Decimal, the internal time_bucket attribute included) and renders it as a
+listing page the old way (recursive decimal_to_native, then json.dumps) and
+through serialization.render with the standard library encoder, with orjson
+(when installed), as NDJSON, and with gzip/br content coding.
+
+    python benchmarks/bench_serialization.py --events 10000 --repeat 30
+"""
+import argparse
+import base64
+import decimal
+import json
+import random
+
+from _support import print_table, summarize, timed
+import serialization
+
+
+def decimal_to_native(obj):
+    """The per-item conversion access_event_rud used before serialization.render."""
+    if isinstance(obj, list):
+        return [decimal_to_native(i) for i in obj]
+    elif isinstance(obj, dict):
+        return {k: decimal_to_native(v) for k, v in obj.items()}
+    elif isinstance(obj, decimal.Decimal):
+        if obj % 1 == 0:
+            return int(obj)
+        else:
+            return float(obj)
+    else:
+        return obj
+
+
+def legacy_render(items, next_cursor):
+    records = [{k: v for k, v in decimal_to_native(item).items() if k != 'time_bucket'} for item in items]
+    return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'items': records, 'next': next_cursor})}
+
+
+def current_render(items, next_cursor, request):
+    records = [{k: v for k, v in item.items() if k != 'time_bucket'} for item in items]
+    return serialization.render({
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': serialization.page(records, next_cursor),
+    }, request)
+
+
+def result_set(events, tokens, seed):
+    rng = random.Random(seed)
+    start = 1700000000000
+    return [
+        {
+            'token_id': f'{rng.randrange(tokens):08x}-2f1c-4c7e-9d1a-{rng.randrange(16 ** 12):012x}',
+            'timestamp': decimal.Decimal(start + i * 937),
+            'authorized': rng.random() < 0.9,
+            'time_bucket': f'2023-11-14#{rng.randrange(4)}',
+        }
+        for i in range(events)
+    ]
+
+
+def payload_bytes(response):
+    body = response['body']
+    return len(base64.b64decode(body)) if response.get('isBase64Encoded') else len(body.encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--tokens', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    items = result_set(args.events, args.tokens, args.seed)
+    cursor = 'eyJ0b2tlbl9pZCI6ImFiYyIsInRpbWVzdGFtcCI6MTcwMDAwMDAwMDAwMH0'
+    plain = {'headers': {}}
+    orjson = serialization.orjson
+
+    variants = [('legacy decimal_to_native + json.dumps', None, lambda: legacy_render(items, cursor))]
+    variants.append(('render, stdlib json', False, lambda: current_render(items, cursor, plain)))
+    if orjson is not None:
+        variants.append(('render, orjson', True, lambda: current_render(items, cursor, plain)))
+    else:
+        print('orjson is not installed; skipping the orjson rows')
+    fast = orjson is not None
+    variants.append(('render NDJSON', fast, lambda: current_render(items, cursor, {'headers': {'Accept': serialization.NDJSON_TYPE}})))
+    variants.append(('render + gzip', fast, lambda: current_render(items, cursor, {'headers': {'Accept-Encoding': 'gzip'}})))
+    if serialization.brotli is not None:
+        variants.append(('render + br', fast, lambda: current_render(items, cursor, {'headers': {'Accept-Encoding': 'br'}})))
+    else:
+        print('brotli is not installed; skipping the br row')
+
+    reference = json.loads(legacy_render(items, cursor)['body'])
+    rows = []
+    for name, use_orjson, render in variants:
+        serialization.orjson = orjson if use_orjson else None
+        try:
+            response = render()
+            if name == 'render, stdlib json' or name == 'render, orjson':
+                # Same document as before, only faster to produce
+                assert json.loads(response['body']) == reference
+            samples = [timed(render)[0] for _ in range(args.repeat)]
+        finally:
+            serialization.orjson = orjson
+        stats = summarize(samples)
+        rows.append({
+            'variant': name,
+            'p50_ms': stats['p50_ms'],
+            'p95_ms': stats['p95_ms'],
+            'bytes': payload_bytes(response),
+            'encoding': response['headers'].get('Content-Encoding', '-'),
+        })
+
+    baseline = rows[0]['p50_ms']
+    for row in rows:
+        row['speedup'] = f"x{baseline / row['p50_ms']:.1f}" if row['p50_ms'] else '-'
+    print_table(f"{args.events}-event GET /events page, {args.repeat} runs each", rows)
+
+
+if __name__ == '__main__':
+    main()
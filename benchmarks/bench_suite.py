@@ -0,0 +1,429 @@
+"""
+End-to-end load test of every Lambda handler against local stand-ins.
+
+Drives each handler's lambda_handler with synthetic SQS batches and API
+Gateway v2 (HTTP API) events and reports throughput and p50/p95/p99 latency
+per batch size, table size and concurrency level:
+
+- event_handler: SQS batches of --batch-sizes messages
+- access_event_rud: GET /events for one token, --event-table-sizes events stored
+- employee_crud: GET /employee listing and by id, --pg-table-sizes employees
+- token_crud: GET /token listing and POST /token, --pg-table-sizes tokens
+- custom_auth: authorize a valid API key
+
+Concurrency is modelled the way Lambda scales out: every concurrent worker is
+a process of its own (a container) with a warm handler, one request at a time.
+DynamoDB is moto's in-process backend (seeded once, then shared with the
+workers by fork), SSM and Secrets Manager are the stand-ins from fakes.py, and
+the Postgres handlers run against a real local database (--dsn; skipped
+without one). --aws-latency-ms adds a fixed delay to every AWS call to
+approximate the network round trip.
+
+    python benchmarks/bench_suite.py --dsn "host=localhost user=postgres" --output results.json
+    python benchmarks/bench_suite.py --dsn "..." --compare results.json
+
+Results are saved as JSON (--output) with the run's parameters and git
+commit; --compare prints the change against a previous file.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from _support import REPO_ROOT, apply_schema, load_handler, postgres_credentials, print_table, summarize
+from fakes import FakeSecretsManager, FakeSSM
+
+try:
+    from moto import mock_aws  # type: ignore
+except ImportError:
+    raise SystemExit('This benchmark needs boto3 and moto (pip install moto)')
+
+EVENTS_TABLE = 'bench-access-events'
+BUCKETS_TABLE = 'bench-access-event-buckets'
+STATE_TABLE = 'bench-token-state'
+EVENT_TOKENS = 50
+EVENT_START_MS = 1700000000000
+API_KEY = 'bench-api-key-0123456789abcdef'
+
+EVENT_ENV = {
+    'DYNAMODB_TABLE_NAME': EVENTS_TABLE,
+    'EVENT_BUCKET_TABLE_NAME': BUCKETS_TABLE,
+    'TOKEN_STATE_TABLE_NAME': STATE_TABLE,
+    'EVENT_STORAGE_MODE': 'item',
+}
+
+
+def _http(method, path, query=None, body=None):
+    return {
+        'requestContext': {'http': {'method': method}},
+        'rawPath': path,
+        'routeKey': f'{method} {path}',
+        'headers': {},
+        'queryStringParameters': query or {},
+        'body': json.dumps(body) if body is not None else None,
+    }
+
+
+def _token(n):
+    return f'bench-token-{n % EVENT_TOKENS:05d}'
+
+# ------------------------------ stand-ins and data ------------------------------
+
+
+def _add_aws_latency(latency):
+    """Sleeps before every boto3 call made through the default session."""
+    import boto3  # type: ignore
+    if latency:
+        boto3.setup_default_session()
+        boto3.DEFAULT_SESSION.events.register('before-call', lambda **kwargs: time.sleep(latency))
+
+
+def _seed_events(size):
+    """(Re)creates the DynamoDB tables in moto with `size` events over EVENT_TOKENS tokens."""
+    import boto3  # type: ignore
+    client = boto3.session.Session().client('dynamodb')
+    for name in client.list_tables()['TableNames']:
+        client.delete_table(TableName=name)
+    for name, range_key in ((EVENTS_TABLE, 'timestamp'), (BUCKETS_TABLE, 'bucket')):
+        client.create_table(
+            TableName=name, BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}, {'AttributeName': range_key, 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'token_id', 'AttributeType': 'S'}, {'AttributeName': range_key, 'AttributeType': 'N'}],
+        )
+    client.create_table(
+        TableName=STATE_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'token_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'token_id', 'AttributeType': 'S'}],
+    )
+    for offset in range(0, size, 25):
+        client.batch_write_item(RequestItems={EVENTS_TABLE: [
+            {'PutRequest': {'Item': {
+                'token_id': {'S': _token(n)},
+                'timestamp': {'N': str(EVENT_START_MS + n * 1000)},
+                'authorized': {'BOOL': n % 10 != 0},
+            }}}
+            for n in range(offset, min(offset + 25, size))
+        ]})
+
+
+def _seed_postgres(dsn, size):
+    """Resets the schema with `size` employees holding one token each; returns the employee ids."""
+    import psycopg2
+    apply_schema(dsn, reset=True)
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO employees (first_name, last_name, email) "
+            "SELECT 'Bench', 'User' || g, 'bench' || g || '@example.com' FROM generate_series(1, %s) g "
+            "RETURNING id;",
+            (size,)
+        )
+        ids = [str(row[0]) for row in cur.fetchall()]
+        cur.execute("INSERT INTO tokens (employee_id) SELECT id FROM employees;")
+        cur.execute("ANALYZE employees; ANALYZE tokens;")
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _postgres_handler(function_dir, module_file, dsn, latency):
+    module = load_handler(function_dir, module_file, {'DB_SECRET_ARN': 'bench-secret'})
+    module.lazy.set_client('secretsmanager', FakeSecretsManager(postgres_credentials(dsn), latency))
+    return module
+
+# ------------------------------ scenarios ------------------------------
+# Each scenario returns, inside a worker process, a function that sends request
+# number i and returns how many items it handled (SQS messages, listed rows).
+
+
+def _sqs_batch(worker, i, size):
+    return {'Records': [
+        {
+            'messageId': f'{worker}-{i}-{n}',
+            'body': json.dumps({'token': _token(worker * 7 + n), 'timestamp': EVENT_START_MS + (worker * 10 ** 7 + i) * 16 + n,
+                                'authorized': True}),
+        }
+        for n in range(size)
+    ]}
+
+
+def event_ingest(worker, params, context):
+    handler = load_handler('event_handler', 'event_handler.py', EVENT_ENV)
+    size = params['batch_size']
+
+    def send(i):
+        response = handler.lambda_handler(_sqs_batch(worker, i, size), None)
+        if response['batchItemFailures']:
+            raise RuntimeError(f"{len(response['batchItemFailures'])} failed messages")
+        return size
+    return send
+
+
+def event_listing(worker, params, context):
+    handler = load_handler('access_event_rud', 'access_event_rud.py', EVENT_ENV)
+
+    def send(i):
+        response = handler.lambda_handler(_http('GET', '/events', {'token': _token(worker + i), 'limit': '100'}), None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"status {response['statusCode']}")
+        return len(json.loads(response['body'])['items'])
+    return send
+
+
+def employee_listing(worker, params, context):
+    handler = _postgres_handler('employee_crud', 'employee_crud.py', context['dsn'], context['latency'])
+
+    def send(i):
+        response = handler.lambda_handler(_http('GET', '/employee', {'limit': '50'}), None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"status {response['statusCode']}")
+        return len(json.loads(response['body'])['items'])
+    return send
+
+
+def employee_by_id(worker, params, context):
+    handler = _postgres_handler('employee_crud', 'employee_crud.py', context['dsn'], context['latency'])
+    ids = context['employee_ids']
+
+    def send(i):
+        employee_id = ids[(worker * 7919 + i) % len(ids)]
+        response = handler.lambda_handler(_http('GET', '/employee', {'employee_id': employee_id}), None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"status {response['statusCode']}")
+        return 1
+    return send
+
+
+def token_listing(worker, params, context):
+    handler = _postgres_handler('token_crud', 'token_crud.py', context['dsn'], context['latency'])
+
+    def send(i):
+        response = handler.lambda_handler(_http('GET', '/token', {'limit': '50'}), None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"status {response['statusCode']}")
+        return len(json.loads(response['body'])['items'])
+    return send
+
+
+def token_issue(worker, params, context):
+    handler = _postgres_handler('token_crud', 'token_crud.py', context['dsn'], context['latency'])
+    ids = context['employee_ids']
+
+    def send(i):
+        employee_id = ids[(worker * 7919 + i) % len(ids)]
+        response = handler.lambda_handler(_http('POST', '/token', body={'employee_id': employee_id}), None)
+        if response['statusCode'] != 201:
+            raise RuntimeError(f"status {response['statusCode']}")
+        return 1
+    return send
+
+
+def authorize(worker, params, context):
+    handler = load_handler('custom_auth', 'custom-auth.py', {'API_KEY_PARAMETER_NAMES': 'bench-api-key'})
+    handler.lazy.set_client('ssm', FakeSSM({'bench-api-key': API_KEY}, context['latency']))
+
+    def send(i):
+        if not handler.lambda_handler({'headers': {'authorization': API_KEY}}, None)['isAuthorized']:
+            raise RuntimeError('valid key rejected')
+        return 1
+    return send
+
+
+# name: (handler, workload, data set it needs)
+SCENARIOS = {
+    'sqs-ingest': ('event_handler', event_ingest, None),
+    'get-events': ('access_event_rud', event_listing, 'events'),
+    'list-employees': ('employee_crud', employee_listing, 'postgres'),
+    'get-employee': ('employee_crud', employee_by_id, 'postgres'),
+    'list-tokens': ('token_crud', token_listing, 'postgres'),
+    'issue-token': ('token_crud', token_issue, 'postgres'),
+    'authorize': ('custom_auth', authorize, None),
+}
+
+# ------------------------------ runner ------------------------------
+
+
+def _worker(scenario, worker, params, context, requests, warmup, barrier, results):
+    # The handlers print a line per invocation (and EMF metrics); keep the table readable
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        _add_aws_latency(context['latency'])
+        send = SCENARIOS[scenario][1](worker, params, context)
+        for i in range(warmup):
+            send(-1 - i)
+        barrier.wait()
+        samples, items, errors = [], 0, 0
+        started = time.time()
+        for i in range(requests):
+            start = time.perf_counter()
+            try:
+                items += send(i)
+            except Exception:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+        results.put({'samples': samples, 'items': items, 'errors': errors, 'started': started, 'finished': time.time()})
+    except Exception as e:
+        barrier.abort()
+        results.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def run_cell(scenario, params, concurrency, context, requests, warmup):
+    """Runs one scenario at one concurrency level in `concurrency` forked workers."""
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(concurrency)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker, args=(scenario, n, params, context, requests, warmup, barrier, results))
+        for n in range(concurrency)
+    ]
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    failed = [outcome['error'] for outcome in outcomes if 'error' in outcome]
+    if failed:
+        raise RuntimeError(f'{scenario} {params}: {failed[0]}')
+
+    samples = [sample for outcome in outcomes for sample in outcome['samples']]
+    elapsed = max(o['finished'] for o in outcomes) - min(o['started'] for o in outcomes)
+    stats = summarize(samples)
+    return {
+        'scenario': scenario,
+        'handler': SCENARIOS[scenario][0],
+        **params,
+        'concurrency': concurrency,
+        'requests': stats['count'],
+        'errors': sum(o['errors'] for o in outcomes),
+        'req_per_s': round(stats['count'] / elapsed, 1) if elapsed else 0.0,
+        'items_per_s': round(sum(o['items'] for o in outcomes) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': stats['p50_ms'],
+        'p95_ms': stats['p95_ms'],
+        'p99_ms': stats['p99_ms'],
+    }
+
+
+def _cells(args):
+    """(scenario, params, data set size) in the order they run; sizes are grouped to seed once each."""
+    cells = []
+    for scenario in args.scenarios.split(','):
+        _, _, data = SCENARIOS[scenario]
+        if scenario == 'sqs-ingest':
+            cells += [(scenario, {'batch_size': size}, ('events', 0)) for size in args.batch_sizes]
+        elif data == 'events':
+            cells += [(scenario, {'table_size': size}, ('events', size)) for size in args.event_table_sizes]
+        elif data == 'postgres':
+            cells += [(scenario, {'table_size': size}, ('postgres', size)) for size in args.pg_table_sizes]
+        else:
+            cells.append((scenario, {}, None))
+    return sorted(cells, key=lambda cell: cell[2] or ('', 0))
+
+
+def _key(row):
+    return (row['scenario'], row.get('batch_size'), row.get('table_size'), row['concurrency'])
+
+
+def compare(rows, parameters, previous_path):
+    with open(previous_path) as f:
+        earlier = json.load(f)
+    previous = {_key(row): row for row in earlier['results']}
+    changes = []
+    for row in rows:
+        before = previous.get(_key(row))
+        if not before:
+            continue
+        changes.append({
+            'scenario': row['scenario'],
+            'size': row.get('batch_size', row.get('table_size', '-')),
+            'concurrency': row['concurrency'],
+            'req_per_s': f"{before['req_per_s']} -> {row['req_per_s']}",
+            'p50_ms': f"{before['p50_ms']} -> {row['p50_ms']}",
+            'p99_ms': f"{before['p99_ms']} -> {row['p99_ms']}",
+            'throughput': f"x{row['req_per_s'] / before['req_per_s']:.2f}" if before['req_per_s'] else '-',
+        })
+    print_table(f"Compared with {previous_path} (commit {earlier.get('commit') or '?'})", changes)
+    differing = sorted(name for name in ('requests', 'warmup', 'aws_latency_ms')
+                       if earlier['parameters'].get(name) != parameters.get(name))
+    if differing:
+        print(f"Runs used different {', '.join(differing)}; the numbers are not directly comparable")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=_sizes, default=[1, 4], help='comma-separated worker counts')
+    parser.add_argument('--batch-sizes', type=_sizes, default=[1, 5, 10], help='SQS messages per invocation')
+    parser.add_argument('--event-table-sizes', type=_sizes, default=[1000, 10000])
+    parser.add_argument('--pg-table-sizes', type=_sizes, default=[1000, 10000])
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per worker')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per worker first')
+    parser.add_argument('--aws-latency-ms', type=float, default=0.0)
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_PG_DSN'), help='Postgres for the CRUD handlers')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+
+    context = {'dsn': args.dsn, 'latency': args.aws_latency_ms / 1000.0}
+    mock = mock_aws()
+    mock.start()
+    rows, seeded, skipped = [], None, set()
+    try:
+        for scenario, params, data in _cells(args):
+            if data and data[0] == 'postgres' and not args.dsn:
+                skipped.add(scenario)
+                continue
+            if data and data != seeded:
+                if data[0] == 'events':
+                    _seed_events(data[1])
+                else:
+                    context['employee_ids'] = _seed_postgres(args.dsn, data[1])
+                seeded = data
+            for concurrency in args.concurrency:
+                rows.append(run_cell(scenario, params, concurrency, context, args.requests, args.warmup))
+    finally:
+        mock.stop()
+
+    columns = ('scenario', 'handler', 'batch_size', 'table_size', 'concurrency', 'requests', 'errors',
+               'req_per_s', 'items_per_s', 'p50_ms', 'p95_ms', 'p99_ms')
+    print_table(
+        f'Handlers end to end ({args.requests} requests per worker, {args.aws_latency_ms:g} ms per AWS call)',
+        [{column: row.get(column, '-') for column in columns} for row in rows]
+    )
+    if skipped:
+        print(f"Skipped without --dsn/BENCH_PG_DSN: {', '.join(sorted(skipped))}")
+
+    parameters = {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'dsn')}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'cpus': os.cpu_count(),
+                'parameters': parameters,
+                'results': rows,
+            }, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.compare:
+        compare(rows, parameters, args.compare)
+
+
+if __name__ == '__main__':
+    main()
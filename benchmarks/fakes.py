@@ -0,0 +1,135 @@
+"""
+In-process stand-ins for the AWS APIs the Lambdas call. Each fake implements
+only the calls the handlers make, with an optional fixed latency per call to
+approximate a network round trip.
+"""
+import bisect
+import json
+import threading
+import time
+import zlib
+
+
+class FakeSSM:
+    """SSM client stand-in serving parameters from a dict."""
+
+    def __init__(self, parameters, latency=0.0):
+        self.parameters = dict(parameters)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_parameter(self, Name, WithDecryption=False):
+        self._call()
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def get_parameters(self, Names, WithDecryption=False):
+        self._call()
+        return {
+            'Parameters': [{'Name': n, 'Value': self.parameters[n]} for n in Names if n in self.parameters],
+            'InvalidParameters': [n for n in Names if n not in self.parameters],
+        }
+
+
+def _key_value(attribute):
+    (kind, raw), = attribute.items()
+    return int(raw) if kind == 'N' else raw
+
+
+class FakeDynamoDB:
+    """
+    Low-level DynamoDB client stand-in. Items are stored in the wire format
+    ({'S': ...}, {'N': ...}); pages are capped at `page_size` items instead of
+    1 MB, and every call sleeps for `latency` seconds.
+    """
+
+    def __init__(self, latency=0.0, page_size=1000):
+        self.latency = latency
+        self.page_size = page_size
+        self.tables = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def create_table(self, name, hash_key='token_id', range_key='timestamp'):
+        self.tables[name] = {'hash_key': hash_key, 'range_key': range_key, 'items': {}, 'segments': {}}
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _key(self, table, item):
+        hash_value = _key_value(item[table['hash_key']])
+        if table['range_key']:
+            return (hash_value, _key_value(item[table['range_key']]))
+        return (hash_value,)
+
+    def _store(self, table_name, item):
+        table = self.tables[table_name]
+        with self._lock:
+            table['items'][self._key(table, item)] = item
+            table['segments'].clear()
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._call('PutItem')
+        self._store(TableName, Item)
+        return {}
+
+    def batch_write_item(self, RequestItems):
+        self._call('BatchWriteItem')
+        for table_name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise ValueError('Too many items requested for the BatchWriteItem call')
+            table = self.tables[table_name]
+            for request in requests:
+                if 'PutRequest' in request:
+                    self._store(table_name, request['PutRequest']['Item'])
+                else:
+                    with self._lock:
+                        table['items'].pop(self._key(table, request['DeleteRequest']['Key']), None)
+                        table['segments'].clear()
+        return {'UnprocessedItems': {}}
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, Limit=None, **kwargs):
+        self._call('Scan')
+        table = self.tables[TableName]
+        with self._lock:
+            # Sorted key lists per segment are cached until the next write
+            if TotalSegments not in table['segments']:
+                buckets = [[] for _ in range(TotalSegments)]
+                for key in sorted(table['items']):
+                    buckets[zlib.crc32(str(key[0]).encode('utf-8')) % TotalSegments].append(key)
+                table['segments'][TotalSegments] = buckets
+            keys = table['segments'][TotalSegments][Segment]
+        position = bisect.bisect_right(keys, self._key(table, ExclusiveStartKey)) if ExclusiveStartKey else 0
+        page_size = min(Limit or self.page_size, self.page_size)
+        page = keys[position:position + page_size]
+        response = {'Items': [table['items'][key] for key in page], 'Count': len(page)}
+        if len(keys) > position + page_size:
+            last = table['items'][page[-1]]
+            response['LastEvaluatedKey'] = {
+                name: last[name] for name in (table['hash_key'], table['range_key']) if name
+            }
+        return response
+
+
+class FakeSecretsManager:
+    """Secrets Manager client stand-in returning one JSON secret."""
+
+    def __init__(self, secret, latency=0.0):
+        self.secret = secret
+        self.latency = latency
+        self.calls = 0
+
+    def get_secret_value(self, SecretId):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {'SecretString': json.dumps(self.secret)}
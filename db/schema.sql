@@ -18,4 +18,66 @@ CREATE TABLE IF NOT EXISTS tokens (
 
 -- Add indexes for common lookup patterns to improve performance
 CREATE INDEX IF NOT EXISTS idx_employees_email ON employees (email);
-CREATE INDEX IF NOT EXISTS idx_tokens_employee_id ON tokens (employee_id);
\ No newline at end of file
+
+-- Keyset pagination of the employee listing (newest first)
+CREATE INDEX IF NOT EXISTS idx_employees_created_at_id ON employees (created_at DESC, id DESC);
+
+-- Case-insensitive prefix search on name/email (lower(col) LIKE 'abc%')
+CREATE INDEX IF NOT EXISTS idx_employees_first_name_prefix ON employees (lower(first_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_employees_last_name_prefix ON employees (lower(last_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_employees_email_prefix ON employees (lower(email) text_pattern_ops);
+
+-- Log of revoked (deleted) tokens, read incrementally by the ingest token cache
+CREATE TABLE IF NOT EXISTS token_revocations (
+    token_id UUID NOT NULL,
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_tokens_issued_at ON tokens (issued_at);
+CREATE INDEX IF NOT EXISTS idx_token_revocations_revoked_at ON token_revocations (revoked_at);
+
+-- Token listing per employee, newest first; also covers the employee_id lookups
+-- (foreign key cascade, batch revocation), so the single-column index is dropped
+CREATE INDEX IF NOT EXISTS idx_tokens_employee_issued_at ON tokens (employee_id, issued_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_tokens_employee_id;
+
+-- Statement-level so batch revocations and employee cascades log in one insert
+CREATE OR REPLACE FUNCTION log_token_revocations() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO token_revocations (token_id) SELECT id FROM revoked_tokens;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tokens_revocations ON tokens;
+CREATE TRIGGER trg_tokens_revocations
+    AFTER DELETE ON tokens
+    REFERENCING OLD TABLE AS revoked_tokens
+    FOR EACH STATEMENT EXECUTE FUNCTION log_token_revocations();
+
+-- Change counters behind the ETags of the employee and token listings. Bumped
+-- once per writing statement, so a GET can tell in one primary-key lookup
+-- whether anything it would read has changed.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions (table_name) VALUES ('employees'), ('tokens') ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_employees_version ON employees;
+CREATE TRIGGER trg_employees_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employees
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS trg_tokens_version ON tokens;
+CREATE TRIGGER trg_tokens_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tokens
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { employeeService } from '../../services/api';
+import LoadMoreButton from '../UI/LoadMoreButton';
 import type { Employee, CreateTokenRequest } from '../../types';
 
 interface TokenFormProps {
@@ -14,23 +15,54 @@ const TokenForm: React.FC<TokenFormProps> = ({
   isLoading = false,
 }) => {
   const [employees, setEmployees] = useState<Employee[]>([]);
+  // Cursor of the next page of matching employees; null on the last page
+  const [next, setNext] = useState<string | null>(null);
+  const [search, setSearch] = useState('');
   const [selectedEmployeeId, setSelectedEmployeeId] = useState('');
   const [loadingEmployees, setLoadingEmployees] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
+  // The server matches `search` as a name/email prefix, so only one page is loaded per query
   useEffect(() => {
+    // Drops the answer of a search that has been typed over
+    let cancelled = false;
     const fetchEmployees = async () => {
       try {
-        const data = await employeeService.getAll();
-        setEmployees(data);
+        setLoadingEmployees(true);
+        const page = await employeeService.getPage(null, search.trim());
+        if (!cancelled) {
+          setEmployees(page.items);
+          setNext(page.next);
+        }
       } catch (error) {
         console.error('Error fetching employees:', error);
       } finally {
-        setLoadingEmployees(false);
+        if (!cancelled) {
+          setLoadingEmployees(false);
+        }
       }
     };
 
     fetchEmployees();
-  }, []);
+    return () => {
+      cancelled = true;
+    };
+  }, [search]);
+
+  const handleLoadMore = async () => {
+    if (!next) return;
+
+    try {
+      setLoadingMore(true);
+      const page = await employeeService.getPage(next, search.trim());
+      setEmployees((loaded) => [...loaded, ...page.items]);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching employees:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault();
@@ -45,6 +77,13 @@ const TokenForm: React.FC<TokenFormProps> = ({
         <label className="block text-sm font-medium text-gray-700 mb-1">
           Select Employee
         </label>
+        <input
+          type="text"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          placeholder="Search by name or email"
+          className="w-full px-3 py-2 mb-2 border border-gray-300 rounded-md shadow-sm focus:ring-2 focus:ring-blue-500 focus:border-blue-500"
+        />
         {loadingEmployees ? (
           <div className="w-full px-3 py-2 border border-gray-300 rounded-md bg-gray-50">
             Loading employees...
@@ -64,6 +103,9 @@ const TokenForm: React.FC<TokenFormProps> = ({
             ))}
           </select>
         )}
+        {!loadingEmployees && next && (
+          <LoadMoreButton onClick={handleLoadMore} isLoading={loadingMore} label="Load more employees" />
+        )}
       </div>
 
       <div className="flex justify-end space-x-3 pt-4">
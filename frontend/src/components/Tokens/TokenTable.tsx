@@ -1,7 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { Edit2, Trash2, Copy } from 'lucide-react';
-import { employeeService } from '../../services/api';
-import type { Token, Employee } from '../../types';
+import type { Token } from '../../types';
 
 interface TokenTableProps {
   tokens: Token[];
@@ -16,30 +15,10 @@ const TokenTable: React.FC<TokenTableProps> = ({
   onDelete,
   isLoading = false,
 }) => {
-  const [employees, setEmployees] = useState<Employee[]>([]);
+  const getEmployeeName = (token: Token) => {
+    const firstName = token.first_name || '';
+    const lastName = token.last_name || '';
 
-  useEffect(() => {
-    const fetchEmployees = async () => {
-      try {
-        const data = await employeeService.getAll();
-        setEmployees(data);
-      } catch (error) {
-        console.error('Error fetching employees:', error);
-      }
-    };
-
-    fetchEmployees();
-  }, []);
-
-  const getEmployeeName = (employeeId: string) => {
-    if (!employeeId) return 'Unknown';
-    
-    const employee = employees.find(emp => emp?.id === employeeId);
-    if (!employee) return 'Unknown';
-    
-    const firstName = employee.first_name || '';
-    const lastName = employee.last_name || '';
-    
     return firstName || lastName ? `${firstName} ${lastName}`.trim() : 'Unknown';
   };
 
@@ -85,7 +64,6 @@ const TokenTable: React.FC<TokenTableProps> = ({
           {tokens.map((token) => {
             // Safe access to token properties with fallbacks
             const tokenId = token?.id || '';
-            const employeeId = token?.employee_id || '';
             const issuedAt = token?.issued_at;
             
             return (
@@ -108,7 +86,7 @@ const TokenTable: React.FC<TokenTableProps> = ({
                 </td>
                 <td className="px-6 py-4 whitespace-nowrap">
                   <div className="text-sm text-gray-900">
-                    {getEmployeeName(employeeId)}
+                    {getEmployeeName(token)}
                   </div>
                 </td>
                 <td className="px-6 py-4 whitespace-nowrap">
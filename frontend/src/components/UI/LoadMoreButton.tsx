@@ -0,0 +1,29 @@
+import React from 'react';
+
+interface LoadMoreButtonProps {
+  onClick: () => void;
+  isLoading?: boolean;
+  label?: string;
+}
+
+// Fetches the next page of a paginated listing
+const LoadMoreButton: React.FC<LoadMoreButtonProps> = ({
+  onClick,
+  isLoading = false,
+  label = 'Load more',
+}) => {
+  return (
+    <div className="flex justify-center py-4">
+      <button
+        type="button"
+        onClick={onClick}
+        disabled={isLoading}
+        className="px-4 py-2 text-sm font-medium text-gray-700 bg-white border border-gray-300 rounded-md hover:bg-gray-50 focus:ring-2 focus:ring-gray-500 disabled:opacity-50 disabled:cursor-not-allowed transition-colors duration-200"
+      >
+        {isLoading ? 'Loading...' : label}
+      </button>
+    </div>
+  );
+};
+
+export default LoadMoreButton;
@@ -5,11 +5,15 @@ import EmployeeTable from '../components/Employees/EmployeeTable';
 import EmployeeForm from '../components/Employees/EmployeeForm';
 import Modal from '../components/UI/Modal';
 import LoadingSpinner from '../components/UI/LoadingSpinner';
+import LoadMoreButton from '../components/UI/LoadMoreButton';
 import type { Employee, CreateEmployeeRequest } from '../types';
 
 const Employees: React.FC = () => {
   const [employees, setEmployees] = useState<Employee[]>([]);
+  // Cursor of the next page of employees; null on the last page
+  const [next, setNext] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [submitting, setSubmitting] = useState(false);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [editingEmployee, setEditingEmployee] = useState<Employee | null>(null);
@@ -18,11 +22,13 @@ const Employees: React.FC = () => {
     fetchEmployees();
   }, []);
 
+  // Starts over at the first page
   const fetchEmployees = async () => {
     try {
       setLoading(true);
-      const data = await employeeService.getAll();
-      setEmployees(data);
+      const page = await employeeService.getPage();
+      setEmployees(page.items);
+      setNext(page.next);
     } catch (error) {
       console.error('Error fetching employees:', error);
     } finally {
@@ -30,6 +36,21 @@ const Employees: React.FC = () => {
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!next) return;
+
+    try {
+      setLoadingMore(true);
+      const page = await employeeService.getPage(next);
+      setEmployees((loaded) => [...loaded, ...page.items]);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching employees:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleCreate = async (data: CreateEmployeeRequest) => {
     try {
       setSubmitting(true);
@@ -114,12 +135,15 @@ const Employees: React.FC = () => {
       {loading ? (
         <LoadingSpinner />
       ) : (
-        <EmployeeTable
-          employees={employees}
-          onEdit={handleEdit}
-          onDelete={handleDelete}
-          isLoading={loading}
-        />
+        <div>
+          <EmployeeTable
+            employees={employees}
+            onEdit={handleEdit}
+            onDelete={handleDelete}
+            isLoading={loading}
+          />
+          {next && <LoadMoreButton onClick={handleLoadMore} isLoading={loadingMore} />}
+        </div>
       )}
 
       <Modal
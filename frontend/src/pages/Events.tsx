@@ -1,57 +1,111 @@
 
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect } from 'react';
 import { tokenService, eventService } from '../services/api';
 import EventTable from '../components/Events/EventTable';
 import LoadingSpinner from '../components/UI/LoadingSpinner';
+import LoadMoreButton from '../components/UI/LoadMoreButton';
 import type { Token, Event } from '../types';
 
 const Events: React.FC = () => {
   const [tokens, setTokens] = useState<Token[]>([]);
-  const [allEvents, setAllEvents] = useState<Event[]>([]);
+  // Cursor of the next page of tokens for the picker; null on the last page
+  const [tokensNext, setTokensNext] = useState<string | null>(null);
+  const [loadingTokens, setLoadingTokens] = useState(false);
+  const [events, setEvents] = useState<Event[]>([]);
+  // Cursor of the selected token's next page of events; null on the last page
+  const [eventsNext, setEventsNext] = useState<string | null>(null);
   const [selectedToken, setSelectedToken] = useState<string>('');
   const [loading, setLoading] = useState(true);
+  const [loadingEvents, setLoadingEvents] = useState(false);
 
   useEffect(() => {
-    // Fetches all required data in parallel when the component first loads
-    const fetchAllData = async () => {
+    const fetchTokens = async () => {
       try {
         setLoading(true);
-        const [tokensData, eventsData] = await Promise.all([
-          tokenService.getAll(),
-          eventService.getAll(),
-        ]);
-        setTokens(tokensData);
-        setAllEvents(eventsData);
+        const page = await tokenService.getPage();
+        setTokens(page.items);
+        setTokensNext(page.next);
       } catch (error) {
-        console.error('Error fetching data:', error);
+        console.error('Error fetching tokens:', error);
       } finally {
         setLoading(false);
       }
     };
 
-    fetchAllData();
+    fetchTokens();
   }, []);
 
-  // useMemo efficiently recalculates the filtered list only when the source data changes
-  const filteredEvents = useMemo(() => {
+  // The server filters by token and returns the newest events first, one page at a time
+  useEffect(() => {
+    setEvents([]);
+    setEventsNext(null);
     if (!selectedToken) {
-      return [];
+      return;
     }
-    // Filter all events to find ones that match the selected token
-    const sorted = allEvents
-      .filter(event => event.token_id === selectedToken)
-      .sort((a, b) => Number(b.timestamp) - Number(a.timestamp)); // Sort by newest first
-    return sorted;
-  }, [selectedToken, allEvents]);
 
+    // Drops the answer of a token that is no longer selected
+    let cancelled = false;
+    const fetchFirstPage = async () => {
+      try {
+        setLoadingEvents(true);
+        const page = await eventService.getByToken(selectedToken);
+        if (!cancelled) {
+          setEvents(page.items);
+          setEventsNext(page.next);
+        }
+      } catch (error) {
+        console.error('Error fetching events:', error);
+      } finally {
+        if (!cancelled) {
+          setLoadingEvents(false);
+        }
+      }
+    };
+
+    fetchFirstPage();
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedToken]);
+
+  const handleLoadMoreTokens = async () => {
+    if (!tokensNext) return;
 
-  const handleDeleteEvent = async (eventId: string) => {
+    try {
+      setLoadingTokens(true);
+      const page = await tokenService.getPage(tokensNext);
+      setTokens((loaded) => [...loaded, ...page.items]);
+      setTokensNext(page.next);
+    } catch (error) {
+      console.error('Error fetching tokens:', error);
+    } finally {
+      setLoadingTokens(false);
+    }
+  };
+
+  const handleLoadMore = async () => {
+    if (!eventsNext) return;
+
+    try {
+      setLoadingEvents(true);
+      const page = await eventService.getByToken(selectedToken, eventsNext);
+      setEvents((loaded) => [...loaded, ...page.items]);
+      setEventsNext(page.next);
+    } catch (error) {
+      console.error('Error fetching events:', error);
+    } finally {
+      setLoadingEvents(false);
+    }
+  };
+
+  const handleDeleteEvent = async (token_id: string, timestamp: string) => {
     if (confirm('Are you sure you want to delete this event?')) {
       try {
-        await eventService.delete(eventId);
-        // Refetch all events to ensure the UI is consistent
-        const updatedEvents = await eventService.getAll();
-        setAllEvents(updatedEvents);
+        await eventService.delete(token_id, timestamp);
+        // Drop it from the loaded pages instead of reloading them all
+        setEvents((loaded) => loaded.filter(
+          (event) => !(event.token_id === token_id && String(event.timestamp) === String(timestamp))
+        ));
       } catch (error) {
         console.error('Error deleting event:', error);
       }
@@ -88,15 +142,23 @@ const Events: React.FC = () => {
                   </option>
                 ))}
               </select>
+              {tokensNext && (
+                <LoadMoreButton onClick={handleLoadMoreTokens} isLoading={loadingTokens} label="Load more tokens" />
+              )}
             </div>
           </div>
 
           {selectedToken && (
-            <EventTable
-              events={filteredEvents}
-              onDelete={handleDeleteEvent}
-              isLoading={false} // The main page loading is already handled
-            />
+            <div>
+              <EventTable
+                events={events}
+                onDelete={handleDeleteEvent}
+                isLoading={loadingEvents && events.length === 0}
+              />
+              {eventsNext && (
+                <LoadMoreButton onClick={handleLoadMore} isLoading={loadingEvents} />
+              )}
+            </div>
           )}
 
           {!selectedToken && tokens.length > 0 && (
@@ -5,11 +5,15 @@ import TokenTable from '../components/Tokens/TokenTable';
 import TokenForm from '../components/Tokens/TokenForm';
 import Modal from '../components/UI/Modal';
 import LoadingSpinner from '../components/UI/LoadingSpinner';
+import LoadMoreButton from '../components/UI/LoadMoreButton';
 import type { Token, CreateTokenRequest } from '../types';
 
 const Tokens: React.FC = () => {
   const [tokens, setTokens] = useState<Token[]>([]);
+  // Cursor of the next page of tokens; null on the last page
+  const [next, setNext] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [submitting, setSubmitting] = useState(false);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [editingToken, setEditingToken] = useState<Token | null>(null);
@@ -18,11 +22,13 @@ const Tokens: React.FC = () => {
     fetchTokens();
   }, []);
 
+  // Starts over at the first page
   const fetchTokens = async () => {
     try {
       setLoading(true);
-      const data = await tokenService.getAll();
-      setTokens(data);
+      const page = await tokenService.getPage();
+      setTokens(page.items);
+      setNext(page.next);
     } catch (error) {
       console.error('Error fetching tokens:', error);
     } finally {
@@ -30,6 +36,21 @@ const Tokens: React.FC = () => {
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!next) return;
+
+    try {
+      setLoadingMore(true);
+      const page = await tokenService.getPage(next);
+      setTokens((loaded) => [...loaded, ...page.items]);
+      setNext(page.next);
+    } catch (error) {
+      console.error('Error fetching tokens:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleCreate = async (data: CreateTokenRequest) => {
     try {
       setSubmitting(true);
@@ -109,12 +130,15 @@ const Tokens: React.FC = () => {
       {loading ? (
         <LoadingSpinner />
       ) : (
-        <TokenTable
-          tokens={tokens}
-          onEdit={handleEdit}
-          onDelete={handleDelete}
-          isLoading={loading}
-        />
+        <div>
+          <TokenTable
+            tokens={tokens}
+            onEdit={handleEdit}
+            onDelete={handleDelete}
+            isLoading={loading}
+          />
+          {next && <LoadMoreButton onClick={handleLoadMore} isLoading={loadingMore} />}
+        </div>
       )}
 
       <Modal
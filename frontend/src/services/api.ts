@@ -4,6 +4,9 @@ import type {
   Employee, 
   Token, 
   Event, 
+  Page,
+  EventStats,
+  TokenStateResponse,
   CreateEmployeeRequest, 
   UpdateEmployeeRequest,
   DeleteEmployeeRequest,
@@ -36,26 +39,31 @@ const getAuthHeaders = async () => {
   }
 };
 
+// One page of a listing; pass the returned `next` back to get the following page
+const fetchPage = async <T>(path: string, params: URLSearchParams, next?: string | null): Promise<Page<T>> => {
+  const headers = await getAuthHeaders();
+  const query = new URLSearchParams(params);
+  if (next) {
+    query.set('next', next);
+  }
+  const response = await get({
+    apiName: API_NAME,
+    path: `${path}?${query.toString()}`,
+    options: {
+      headers
+    }
+  }).response;
+  return (await response.body.json()) as unknown as Page<T>;
+};
+
 // Employee API
+// Newest first, one page per call; `search` is a name/email prefix
 export const employeeService = {
-  async getAll(): Promise<Employee[]> {
+  async getPage(next?: string | null, search?: string): Promise<Page<Employee>> {
     try {
-      console.log('Fetching employees...');
-      const headers = await getAuthHeaders();
-      console.log('Request headers:', headers);
-      
-      const response = await get({
-        apiName: API_NAME,
-        path: '/employee',
-        options: {
-          headers
-        }
-      }).response;
-      
-      console.log('Response received');
-      const data = await response.body.json();
-      console.log('Employees data:', data);
-      return data as Employee[];
+      const params = new URLSearchParams();
+      if (search) params.set('search', search);
+      return await fetchPage<Employee>('/employee', params, next);
     } catch (error) {
       console.error('Error fetching employees:', error);
       throw error;
@@ -118,19 +126,11 @@ export const employeeService = {
 };
 
 // Token API
+// Newest first, one page per call
 export const tokenService = {
-  async getAll(): Promise<Token[]> {
+  async getPage(next?: string | null): Promise<Page<Token>> {
     try {
-      const headers = await getAuthHeaders();
-      const response = await get({
-        apiName: API_NAME,
-        path: '/token',
-        options: {
-          headers
-        }
-      }).response;
-      const data = await response.body.json();
-      return data as Token[];
+      return await fetchPage<Token>('/token', new URLSearchParams(), next);
     } catch (error) {
       console.error('Error fetching tokens:', error);
       throw error;
@@ -197,21 +197,72 @@ export const tokenService = {
 };
 
 // Event API
+// Event listings are newest first, one page per call
 export const eventService = {
-  async getByToken(token: string): Promise<Event[]> {
+  async getPage(next?: string | null): Promise<Page<Event>> {
+    try {
+      return await fetchPage<Event>('/events', new URLSearchParams(), next);
+    } catch (error) {
+      console.error('Error fetching events:', error);
+      throw error;
+    }
+  },
+
+  async getByToken(token: string, next?: string | null): Promise<Page<Event>> {
+    try {
+      return await fetchPage<Event>('/events', new URLSearchParams({ token }), next);
+    } catch (error) {
+      console.error('Error fetching events:', error);
+      throw error;
+    }
+  },
+
+  // Several badges (or a team) in one listing, merged by timestamp on the server
+  async getByTokens(tokens: string[], next?: string | null): Promise<Page<Event>> {
+    try {
+      return await fetchPage<Event>('/events', new URLSearchParams({ token: tokens.join(',') }), next);
+    } catch (error) {
+      console.error('Error fetching events:', error);
+      throw error;
+    }
+  },
+
+  async getStats(granularity: 'hour' | 'day', from?: number, to?: number, token?: string): Promise<EventStats> {
     try {
       const headers = await getAuthHeaders();
+      const params = new URLSearchParams({ granularity });
+      if (from !== undefined) params.set('from', String(from));
+      if (to !== undefined) params.set('to', String(to));
+      if (token) params.set('token', token);
       const response = await get({
         apiName: API_NAME,
-        path: `/events?token=${token}`,
+        path: `/events/stats?${params.toString()}`,
         options: {
           headers
         }
       }).response;
-      const data = await response.body.json();
-      return data as Event[];
+      return (await response.body.json()) as unknown as EventStats;
     } catch (error) {
-      console.error('Error fetching events:', error);
+      console.error('Error fetching event statistics:', error);
+      throw error;
+    }
+  },
+
+  // Last-seen state of up to 100 tokens in one request
+  async getStates(tokens: string[]): Promise<TokenStateResponse> {
+    try {
+      const headers = await getAuthHeaders();
+      const params = new URLSearchParams({ token: tokens.join(',') });
+      const response = await get({
+        apiName: API_NAME,
+        path: `/events/state?${params.toString()}`,
+        options: {
+          headers
+        }
+      }).response;
+      return (await response.body.json()) as unknown as TokenStateResponse;
+    } catch (error) {
+      console.error('Error fetching token state:', error);
       throw error;
     }
   },
@@ -10,6 +10,10 @@ export interface Token {
   id: string;
   employee_id: string;
   issued_at?: string;
+  // Joined from employees by the GET /token listing
+  first_name?: string;
+  last_name?: string;
+  email?: string;
 }
 
 export interface Event {
@@ -18,6 +22,51 @@ export interface Event {
   timestamp: string;
 }
 
+// Paginated listing: pass `next` back to get the following page
+export interface Page<T> {
+  items: T[];
+  next: string | null;
+}
+
+export interface EventCounts {
+  start: number;
+  authorized: number;
+  denied: number;
+}
+
+export interface TokenEventStats {
+  token_id: string;
+  authorized: number;
+  denied: number;
+  buckets: EventCounts[];
+}
+
+export interface TokenState {
+  token_id: string;
+  last_timestamp: number;
+  last_authorized: boolean;
+  // Counts over the last `window_days` UTC days, not lifetime totals
+  allowed_count: number;
+  denied_count: number;
+  window_days: number;
+  event_count?: number;
+}
+
+export interface TokenStateResponse {
+  items: TokenState[];
+  missing: string[];
+}
+
+export interface EventStats {
+  granularity: 'hour' | 'day';
+  from: number;
+  to: number;
+  authorized: number;
+  denied: number;
+  buckets: EventCounts[];
+  tokens: TokenEventStats[];
+}
+
 export interface CreateEmployeeRequest {
   first_name: string;
   last_name: string;
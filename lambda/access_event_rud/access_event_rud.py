@@ -1,46 +1,131 @@
+import base64
+import heapq
 import json
 import os
-import boto3 #type: ignore
-import decimal
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from boto3.dynamodb.conditions import Key #type: ignore
+from event_buckets import TIME_BUCKET_INDEX, EVENT_BUCKET_SHARDS, DAY_MS, day_start, day_buckets, time_bucket
+from event_packing import packing_enabled
+from etags import etag_headers, etag_matches, if_none_match, make_etag
+from serialization import dumps, page, render
+from instrumentation import instrumented, parse_json, stage
+from token_counters import rolling_state
+import event_archive
+import event_purge
+import event_stats
+import event_versions
+import lazy
+import packed_events
 
-def _response(status, body):
-    return {
-        'statusCode': status,
-        'headers': {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "https://dragan.stilltesting.xyz",  # Or "*", but best to use your frontend origin
-            "Access-Control-Allow-Headers": "Content-Type,Authorization",
-            "Access-Control-Allow-Methods": "OPTIONS,GET,POST,PUT,DELETE"
-        },
-        'body': json.dumps(body)
-    }
+# Event records as returned by GET /events, without the internal index and
+# archive TTL attributes; Decimals are left to the response encoder
+def event_record(item):
+    return {k: v for k, v in item.items() if k not in ('time_bucket', 'expires_at')}
 
-# Convert DynamoDB Decimals to int/float
-def decimal_to_native(obj):
-    if isinstance(obj, list):
-        return [decimal_to_native(i) for i in obj]
-    elif isinstance(obj, dict):
-        return {k: decimal_to_native(v) for k, v in obj.items()}
-    elif isinstance(obj, decimal.Decimal):
-        if obj % 1 == 0:
-            return int(obj)
-        else:
-            return float(obj)
-    else:
-        return obj
-
-# Setup DynamoDB Table Resource
-dynamodb = boto3.resource('dynamodb')
+# Tables and clients come from lazy: built on first use rather than at import,
+# so a CORS preflight starts without loading any service model
 table_name = os.environ['DYNAMODB_TABLE_NAME']
-table = dynamodb.Table(table_name)
+# EVENT_STORAGE_MODE=bucket: events live packed per token and hour in this table
+event_bucket_table_name = os.environ['EVENT_BUCKET_TABLE_NAME'] if packing_enabled() else None
+
+# Purges above event_purge.PURGE_SYNC_MAX_ITEMS run as a job in the event purge Lambda
+event_jobs_table_name = os.environ.get('EVENT_JOBS_TABLE_NAME')
+purge_function_name = os.environ.get('PURGE_FUNCTION_NAME')
+
+# Per-token "last seen" state maintained by the event handler
+token_state_table_name = os.environ.get('TOKEN_STATE_TABLE_NAME')
+# BatchGetItem reads at most 100 keys per call, so GET /events/state is one call
+MAX_STATE_TOKENS = 100
+BATCH_GET_MAX_ATTEMPTS = int(os.environ.get('BATCH_GET_MAX_ATTEMPTS', '5'))
+BATCH_GET_BASE_DELAY = float(os.environ.get('BATCH_GET_BASE_DELAY', '0.05'))
+
+# Page size for GET /events; each response carries at most this many events
+DEFAULT_PAGE_LIMIT = int(os.environ.get('EVENTS_DEFAULT_PAGE_LIMIT', '100'))
+MAX_PAGE_LIMIT = int(os.environ.get('EVENTS_MAX_PAGE_LIMIT', '1000'))
+
+# GET /events?token=a,b,c: per-token queries run concurrently and are merged by timestamp
+MAX_QUERY_TOKENS = int(os.environ.get('EVENTS_MAX_QUERY_TOKENS', '50'))
+_token_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('EVENTS_QUERY_WORKERS', '10')))
+
+# GET /events?tier=all also reads the Parquet archive of events older than
+# ARCHIVE_AFTER_DAYS (see event_archive.py); the default tier=hot reads DynamoDB only
+TIERS = ('hot', 'all')
+
+# How far back GET /events walks the time buckets when no `from` is given
+RECENT_LOOKBACK_DAYS = int(os.environ.get('EVENTS_RECENT_LOOKBACK_DAYS', '90'))
+# Days after today it starts from when no `to` is given: readers with a skewed
+# clock report future timestamps, which land in a later day bucket
+RECENT_FUTURE_DAYS = int(os.environ.get('EVENTS_FUTURE_SKEW_DAYS', '1'))
+
+# The shards of a day bucket are queried in parallel; boto3 resources are not
+# thread-safe, so lazy.table() gives every pool thread its own Table
+_shard_pool = ThreadPoolExecutor(max_workers=EVENT_BUCKET_SHARDS)
 
+# Opaque pagination cursor: URL-safe base64 of the LastEvaluatedKey
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(dumps(last_evaluated_key)).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+        if not isinstance(key, dict) or not isinstance(key.get('token_id'), str) or not isinstance(key.get('timestamp'), int):
+            raise ValueError
+        return key
+    except Exception:
+        raise ValueError('Invalid pagination cursor')
+
+def _parse_limit(value):
+    if value is None:
+        return DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_LIMIT)
+
+def _time_range(attribute, start, end):
+    """Inclusive from/to condition on a Key, or None when unbounded."""
+    if start is not None and end is not None:
+        return attribute.between(start, end)
+    if start is not None:
+        return attribute.gte(start)
+    if end is not None:
+        return attribute.lte(end)
+    return None
+
+def _parse_tier(value):
+    if value is None:
+        return 'hot'
+    if value not in TIERS:
+        raise ValueError(f"tier must be one of: {', '.join(TIERS)}")
+    if value != 'hot' and not event_archive.ARCHIVE_LOCATION:
+        raise ValueError('No event archive is configured')
+    return value
+
+def _parse_time(value, name):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a numeric timestamp')
+
+@instrumented()
 def lambda_handler(event, context):
-    print(f"Received event: {json.dumps(event)}")
+    return render(_handle(event), event)
 
+def _handle(event):
     if 'requestContext' in event and 'http' in event['requestContext']:
         method = event['requestContext']['http']['method']
-        route_key = event['routeContext']['routeKey']
+        route_key = event.get('routeKey') or f"{method} {event.get('rawPath')}"
     else:
         method = event.get('httpMethod')
         route_key = f"{method} {event.get('resource')}"
@@ -53,62 +138,466 @@ def lambda_handler(event, context):
     body = event.get('body')
     if body:
         try:
-            body = json.loads(body)
+            body = parse_json(body)
         except Exception as e:
             return _response(400, {'message': f'Invalid JSON body: {str(e)}'})
     else:
         body = {}
 
+    # The routes are DynamoDB round trips almost entirely; time them as a whole
     if method == 'GET':
-        return handle_get(route_key, body, query_params)
+        with stage('query'):
+            return handle_get(route_key, body, query_params, if_none_match(event))
+    elif route_key == 'POST /events/query':
+        with stage('query'):
+            return handle_multi_token_query(body.get('token_ids'), body, query_params, if_none_match(event))
     elif method == 'PUT':
-        return handle_put(body)
+        with stage('write'):
+            return handle_put(body)
     elif method == 'DELETE':
-        return handle_delete(body)
+        with stage('write'):
+            return handle_delete(body, query_params)
     else:
         return _response(405, {'message': 'Method Not Allowed'})
 
-def handle_get(route_key, body, query_params):
+def handle_get(route_key, body, query_params, cached_etags=frozenset()):
     if route_key == "GET /events":
         token_id = query_params.get('token') or body.get('token_id')
         timestamp = query_params.get('timestamp') or body.get('timestamp')
 
+        if token_id and ',' in token_id:
+            return handle_multi_token_query(token_id.split(','), body, query_params, cached_etags)
+
         if token_id and timestamp is not None:
             try:
-                response = table.get_item(
-                    Key={
-                        'token_id': token_id,
-                        'timestamp': int(timestamp)
-                    }
-                )
-                item = response.get('Item')
+                if event_bucket_table_name:
+                    item = packed_events.get_event(lazy.table(event_bucket_table_name), token_id, int(timestamp))
+                else:
+                    response = lazy.table(table_name).get_item(
+                        Key={
+                            'token_id': token_id,
+                            'timestamp': int(timestamp)
+                        }
+                    )
+                    item = response.get('Item')
                 if item:
-                    return _response(200, decimal_to_native(item))
+                    return _response(200, event_record(item))
                 else:
                     return _response(404, {'message': 'Event not found'})
             except Exception as e:
                 return _response(500, {'message': f'Error retrieving event: {str(e)}'})
 
+        try:
+            limit = _parse_limit(query_params.get('limit') or body.get('limit'))
+            start = _parse_time(query_params.get('from') or body.get('from'), 'from')
+            end = _parse_time(query_params.get('to') or body.get('to'), 'to')
+            tier = _parse_tier(query_params.get('tier') or body.get('tier'))
+            cursor = query_params.get('next') or body.get('next')
+            start_key = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return _response(400, {'message': str(e)})
+
+        if start_key and token_id and start_key['token_id'] != token_id:
+            return _response(400, {'message': 'Invalid pagination cursor'})
+        if tier != 'hot' and not token_id:
+            return _response(400, {'message': f'tier={tier} needs a token'})
+
+        etag = _events_etag([token_id] if token_id else None, limit, start, end, tier, cursor)
+        if etag and etag_matches(cached_etags, etag):
+            return _response(304, None, etag_headers(etag))
+        headers = etag_headers(etag) if etag else None
+
+        page_args = {'Limit': limit}
+        if start_key:
+            page_args['ExclusiveStartKey'] = start_key
+
+        if tier != 'hot':
+            try:
+                items, next_cursor = _multi_token_events([token_id], limit, start, end, start_key, _tiered_page)
+            except Exception as e:
+                return _response(500, {'message': f'Error retrieving archived events for token_id {token_id}: {str(e)}'})
+
+            return _response(200, page([event_record(item) for item in items], next_cursor), headers)
+
+        elif token_id and event_bucket_table_name:
+            try:
+                items, last_event = packed_events.query_token_events(lazy.table(event_bucket_table_name), token_id, start, end, limit, start_key)
+            except Exception as e:
+                return _response(500, {'message': f'Error retrieving events for token_id {token_id}: {str(e)}'})
+
+            return _response(200, page([event_record(item) for item in items], encode_cursor(last_event)), headers)
+
         elif token_id:
+            key_condition = Key('token_id').eq(token_id)
+            time_condition = _time_range(Key('timestamp'), start, end)
+            if time_condition is not None:
+                key_condition = key_condition & time_condition
+
             try:
-                response = table.query(
-                    KeyConditionExpression=Key('token_id').eq(token_id)
-                )
-                items = decimal_to_native(response.get('Items', []))
-                return _response(200, items)
+                response = lazy.table(table_name).query(KeyConditionExpression=key_condition, ScanIndexForward=False, **page_args)
             except Exception as e:
                 return _response(500, {'message': f'Error retrieving events for token_id {token_id}: {str(e)}'})
 
         else:
             try:
-                response = table.scan()
-                items = decimal_to_native(response.get('Items', []))
-                return _response(200, items)
+                items, next_cursor = _recent_events(limit, start, end, start_key)
             except Exception as e:
                 return _response(500, {'message': f'Error retrieving all events: {str(e)}'})
+
+            return _response(200, page([event_record(item) for item in items], next_cursor), headers)
+
+        return _response(200, page(
+            [event_record(item) for item in response.get('Items', [])],
+            encode_cursor(response.get('LastEvaluatedKey'))
+        ), headers)
+    elif route_key == "GET /events/stats":
+        return handle_get_stats(body, query_params)
+    elif route_key == "GET /events/state":
+        return handle_get_state(body, query_params)
+    elif route_key == "GET /events/purge":
+        return handle_get_purge(body, query_params)
     else:
         return _response(404, {'message': 'GET route not supported'})
 
+def handle_multi_token_query(requested, body, query_params, cached_etags=frozenset()):
+    """Events of several tokens, newest first, as one page with a shared cursor."""
+    if not isinstance(requested, list):
+        return _response(400, {'message': 'token_ids must be a list'})
+    token_ids = list(dict.fromkeys(str(token_id).strip() for token_id in requested if str(token_id).strip()))
+    if not token_ids:
+        return _response(400, {'message': 'token (comma-separated) or token_ids is required'})
+    if len(token_ids) > MAX_QUERY_TOKENS:
+        return _response(400, {'message': f'At most {MAX_QUERY_TOKENS} tokens per request'})
+
+    try:
+        limit = _parse_limit(query_params.get('limit') or body.get('limit'))
+        start = _parse_time(query_params.get('from') or body.get('from'), 'from')
+        end = _parse_time(query_params.get('to') or body.get('to'), 'to')
+        tier = _parse_tier(query_params.get('tier') or body.get('tier'))
+        cursor = query_params.get('next') or body.get('next')
+        start_key = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return _response(400, {'message': str(e)})
+
+    if start_key and start_key['token_id'] not in token_ids:
+        return _response(400, {'message': 'Invalid pagination cursor'})
+
+    etag = _events_etag(token_ids, limit, start, end, tier, cursor)
+    if etag and etag_matches(cached_etags, etag):
+        return _response(304, None, etag_headers(etag))
+
+    try:
+        read_page = _tiered_page if tier != 'hot' else _token_page
+        items, next_cursor = _multi_token_events(token_ids, limit, start, end, start_key, read_page)
+    except Exception as e:
+        return _response(500, {'message': f'Error retrieving events for {len(token_ids)} tokens: {str(e)}'})
+
+    return _response(200, page([event_record(item) for item in items], next_cursor),
+                     etag_headers(etag) if etag else None)
+
+def _events_etag(token_ids, *params):
+    """
+    ETag of a GET /events listing, from the change markers of the listed tokens
+    or, for the cross-token listing (token_ids None), the all-events marker.
+    One BatchGetItem instead of the listing's queries; None without a state table.
+    """
+    if not token_state_table_name:
+        return None
+    keys = token_ids or [event_versions.ALL_EVENTS_MARKER]
+    try:
+        states = _batch_get_states(keys)
+    except Exception as e:
+        print(f"Could not read change markers, answering without an ETag: {e}")
+        return None
+    return make_etag([event_versions.marker(states.get(key)) for key in keys], *params)
+
+def _token_page(token_id, lower, upper, limit):
+    """
+    Up to `limit` events of one token in [lower, upper], newest first, and
+    whether the token has more. Runs on the token pool with its own Table.
+    """
+    if event_bucket_table_name:
+        events, more = packed_events.query_token_events(
+            lazy.table(event_bucket_table_name), token_id, lower, upper, limit, None
+        )
+        return events, more is not None
+
+    args = {
+        'KeyConditionExpression': Key('token_id').eq(token_id) & Key('timestamp').between(lower, upper),
+        'ScanIndexForward': False,
+        'Limit': limit,
+    }
+    items = []
+    while True:
+        response = lazy.table(table_name).query(**args)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items, False
+        if len(items) >= limit:
+            return items[:limit], True
+        args['ExclusiveStartKey'] = last_key
+        args['Limit'] = limit - len(items)
+
+def _archived_page(token_id, lower, upper, limit):
+    """
+    The token's events in an archived span: the archive merged with what the
+    table still holds there, newest first, one event per timestamp. The table
+    has archived items that TTL has not deleted yet, and events that arrived
+    after their day was archived, which exist nowhere else.
+    """
+    archived, archived_more = event_archive.query_token_events(token_id, lower, upper, limit)
+    hot, hot_more = _token_page(token_id, lower, upper, limit)
+    # A source that was cut off may still hold events above the older events of
+    # the other one, so the page ends at the last event read from such a source
+    cutoff = max([events[-1]['timestamp'] for events, more in ((archived, archived_more), (hot, hot_more)) if more],
+                 default=lower)
+    events = {}
+    for event in heapq.merge(hot, archived, key=lambda event: event['timestamp'], reverse=True):
+        if event['timestamp'] < cutoff:
+            break
+        events.setdefault(event['timestamp'], event)
+    items = list(events.values())
+    if len(items) > limit:
+        return items[:limit], True
+    return items, archived_more or hot_more
+
+def _tiered_page(token_id, lower, upper, limit):
+    """
+    _token_page across both tiers: the token's archived days are read from the
+    archive and the table, the days around them from the table, newest first.
+    """
+    first, end = event_archive.archived_range(token_id)
+    segments = (
+        (_token_page, max(lower, end), upper),
+        (_archived_page, max(lower, first), min(upper, end - 1)),
+        (_token_page, lower, min(upper, first - 1)),
+    )
+    items = []
+    for read, low, high in segments:
+        if low > high:
+            continue
+        # A full page still needs one event of the next segment to know whether there are more
+        events, more = read(token_id, low, high, max(limit - len(items), 1))
+        if len(items) >= limit:
+            if events:
+                return items, True
+            continue
+        items.extend(events)
+        if more:
+            return items, True
+    return items, False
+
+def _multi_token_events(token_ids, limit, start, end, cursor, read_page=_token_page):
+    """
+    Queries every token concurrently and k-way merges the sorted partitions by
+    (timestamp, token_id), newest first like the cross-token listing. The cursor
+    is the last event returned; each token resumes right after it in that
+    order. Returns (items, next cursor).
+    """
+    lower = start if start is not None else 0
+    futures = []
+    for token_id in token_ids:
+        upper = end if end is not None else 2 ** 53
+        if cursor:
+            # Ties on the cursor timestamp continue with the tokens that sort before it
+            upper = min(upper, cursor['timestamp'] - (0 if token_id < cursor['token_id'] else 1))
+        if lower <= upper:
+            futures.append(_token_pool.submit(read_page, token_id, lower, upper, limit))
+
+    pages = [future.result() for future in futures]
+    merged = heapq.merge(
+        *(items for items, _ in pages),
+        key=lambda item: (item['timestamp'], item['token_id']),
+        reverse=True
+    )
+    items = [item for _, item in zip(range(limit + 1), merged)]
+
+    if len(items) > limit or (len(items) == limit and any(more for _, more in pages)):
+        items = items[:limit]
+        last = items[-1]
+        return items, encode_cursor({'token_id': last['token_id'], 'timestamp': last['timestamp']})
+    return items, None
+
+def _before_cursor(item, cursor):
+    return (item['timestamp'], item['token_id']) < (cursor['timestamp'], cursor['token_id'])
+
+def _query_shard(bucket, lower, upper, cursor, needed):
+    """
+    Newest events of one bucket shard with timestamp in [lower, upper] that sort
+    after the cursor. Reads about `needed` items, plus any that tie on the last
+    timestamp so the merged page cannot split a tie.
+    """
+    args = {
+        'IndexName': TIME_BUCKET_INDEX,
+        'KeyConditionExpression': Key('time_bucket').eq(bucket) & Key('timestamp').between(lower, upper),
+        'ScanIndexForward': False,
+        'Limit': needed,
+    }
+    items = []
+    while True:
+        response = lazy.table(table_name).query(**args)
+        for item in response.get('Items', []):
+            if len(items) >= needed and item['timestamp'] < items[-1]['timestamp']:
+                return items
+            if cursor is None or _before_cursor(item, cursor):
+                items.append(item)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        args['ExclusiveStartKey'] = last_key
+
+def _read_shard(bucket, lower, upper, cursor, needed):
+    if event_bucket_table_name:
+        return packed_events.query_shard(
+            lazy.table(event_bucket_table_name), bucket, lower, upper, cursor, needed, _before_cursor
+        )
+    return _query_shard(bucket, lower, upper, cursor, needed)
+
+def _recent_events(limit, start, end, cursor):
+    """
+    Newest events across all tokens, newest first, from the time_bucket_index:
+    one UTC day at a time, all shards of a day in parallel, stopping as soon as
+    the page is full. Returns (items, next cursor). A page that stays short
+    reads every day down to `lower`: one query per shard and day.
+    """
+    if end is not None:
+        upper = end
+    else:
+        upper = day_start(int(time.time() * 1000)) + (RECENT_FUTURE_DAYS + 1) * DAY_MS - 1
+    if cursor:
+        upper = min(upper, cursor['timestamp'])
+    lower = start if start is not None else day_start(upper) - (RECENT_LOOKBACK_DAYS - 1) * DAY_MS
+    if lower > upper:
+        return [], None
+
+    items = []
+    day = day_start(upper)
+    while day >= day_start(lower) and len(items) < limit:
+        needed = limit - len(items)
+        futures = [
+            _shard_pool.submit(_read_shard, bucket, max(lower, day), min(upper, day + DAY_MS - 1), cursor, needed)
+            for bucket in day_buckets(day)
+        ]
+        day_items = [item for future in futures for item in future.result()]
+        day_items.sort(key=lambda item: (item['timestamp'], item['token_id']), reverse=True)
+        items.extend(day_items[:needed])
+        day -= DAY_MS
+
+    if len(items) < limit:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor({'token_id': last['token_id'], 'timestamp': last['timestamp']})
+
+def _archived_before(token_id, start, end):
+    """
+    End of the archived range (epoch ms) when [start, end] reaches into it, else
+    None. Stats and edits only see the hot tier, so they refuse such ranges.
+    """
+    if not event_archive.ARCHIVE_LOCATION:
+        return None
+    first, stop = event_archive.archived_range(token_id)
+    if first < stop and start < stop and end >= first:
+        return stop
+    return None
+
+def _day_label(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+def handle_get_stats(body, query_params):
+    try:
+        start = _parse_time(query_params.get('from') or body.get('from'), 'from')
+        end = _parse_time(query_params.get('to') or body.get('to'), 'to')
+        granularity = query_params.get('granularity') or body.get('granularity') or event_stats.DEFAULT_GRANULARITY
+        token_id = query_params.get('token') or body.get('token_id')
+        if granularity in event_stats.GRANULARITIES:
+            first, stop = event_stats.bucket_range(granularity, start, end, int(time.time() * 1000))
+            archived = _archived_before(token_id, first, stop - 1)
+            if archived is not None:
+                return _response(400, {
+                    'message': f'Stats cover the hot tier only; events before {_day_label(archived)} are archived'
+                })
+        version, cached = _stats_version(token_id)
+        result = event_stats.compute_stats(
+            lazy.table(table_name),
+            granularity=granularity,
+            start=start,
+            end=end,
+            token_id=token_id,
+            event_pages=(lambda token, first, stop: packed_events.event_pages(lazy.table(event_bucket_table_name), token, first, stop))
+            if event_bucket_table_name else None,
+            version=version,
+            cached=cached
+        )
+    except ValueError as e:
+        return _response(400, {'message': str(e)})
+    except Exception as e:
+        return _response(500, {'message': f'Error computing event statistics: {str(e)}'})
+
+    return _response(200, result)
+
+def _stats_version(token_id):
+    """
+    (version, cached) for the stats bucket cache: the edit_version of the
+    token's state item and of the all-events marker, which every PUT and
+    DELETE bumps, so edits made by other containers are noticed. Without a
+    state table the cache relies on its TTL; when the markers cannot be read
+    it is bypassed.
+    """
+    if not token_state_table_name:
+        return None, True
+    keys = ([token_id] if token_id else []) + [event_versions.ALL_EVENTS_MARKER]
+    try:
+        states = _batch_get_states(keys)
+    except Exception as e:
+        print(f"Could not read change markers, computing stats without the cache: {e}")
+        return None, False
+    return [str(states.get(key, {}).get('edit_version')) for key in keys], True
+
+def handle_get_state(body, query_params):
+    if not token_state_table_name:
+        return _response(500, {'message': 'TOKEN_STATE_TABLE_NAME is not configured'})
+
+    if query_params.get('token'):
+        requested = query_params['token'].split(',')
+    else:
+        requested = body.get('token_ids') or []
+    if not isinstance(requested, list):
+        return _response(400, {'message': 'token_ids must be a list'})
+    token_ids = list(dict.fromkeys(str(token_id).strip() for token_id in requested if str(token_id).strip()))
+    if not token_ids:
+        return _response(400, {'message': 'token (comma-separated) or token_ids is required'})
+    if len(token_ids) > MAX_STATE_TOKENS:
+        return _response(400, {'message': f'At most {MAX_STATE_TOKENS} tokens per request'})
+
+    try:
+        states = _batch_get_states(token_ids)
+    except Exception as e:
+        return _response(500, {'message': f'Error retrieving token state: {str(e)}'})
+
+    # An item holding only an edit_version (an event edited before any was ingested) has no state yet
+    now_ms = int(time.time() * 1000)
+    states = {token_id: rolling_state(state, now_ms) for token_id, state in states.items() if 'last_timestamp' in state}
+    return _response(200, {
+        'items': [states[token_id] for token_id in token_ids if token_id in states],
+        'missing': [token_id for token_id in token_ids if token_id not in states]
+    })
+
+def _batch_get_states(token_ids):
+    """Reads the state items for up to 100 tokens, re-requesting UnprocessedKeys with backoff."""
+    states = {}
+    request = {token_state_table_name: {'Keys': [{'token_id': token_id} for token_id in token_ids]}}
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(random.uniform(0, BATCH_GET_BASE_DELAY * (2 ** attempt)))
+        response = lazy.dynamodb_resource().batch_get_item(RequestItems=request)
+        for item in response.get('Responses', {}).get(token_state_table_name, []):
+            states[item['token_id']] = item
+        request = response.get('UnprocessedKeys') or {}
+        if not request:
+            return states
+    raise RuntimeError(f'BatchGetItem left keys unprocessed after {BATCH_GET_MAX_ATTEMPTS} attempts')
+
 def handle_put(body):
     token_id = body.get('token_id')
     timestamp = body.get('timestamp')
@@ -116,47 +605,114 @@ def handle_put(body):
 
     if not token_id or timestamp is None or authorized is None:
         return _response(400, {'message': 'token_id, timestamp, and authorized are required in the request body'})
+    try:
+        timestamp = _parse_time(timestamp, 'timestamp')
+        archived = _archived_before(token_id, timestamp, timestamp)
+    except ValueError as e:
+        return _response(400, {'message': str(e)})
+    except Exception as e:
+        return _response(500, {'message': f'Error reading the archive manifest: {str(e)}'})
+    if archived is not None:
+        return _response(400, {'message': f'Events before {_day_label(archived)} are archived and cannot be edited'})
 
     item = {
         'token_id': token_id,
-        'timestamp': int(timestamp),
+        'timestamp': timestamp,
         'authorized': bool(authorized)
     }
+    bucket = time_bucket(token_id, item['timestamp'])
+    if bucket:
+        item['time_bucket'] = bucket
 
     try:
-        table.put_item(Item=item)
-        return _response(200, {'message': 'Event stored successfully', 'item': item})
+        if event_bucket_table_name:
+            packed_events.put_event(lazy.client('dynamodb'), event_bucket_table_name, token_id, item['timestamp'], item['authorized'])
+        else:
+            lazy.table(table_name).put_item(Item=item)
+        event_stats.invalidate(token_id)
     except Exception as e:
         return _response(500, {'message': f'Failed to store event: {str(e)}'})
 
-def handle_delete(body):
-    token_id = body.get('token_id')
+    if token_state_table_name:
+        try:
+            event_versions.bump(lazy.table(token_state_table_name), token_id)
+        except Exception as e:
+            # The event is stored; cached listings catch up with the next ingested event
+            print(f"Failed to bump change markers for token {token_id}: {e}")
+    return _response(200, {'message': 'Event stored successfully', 'item': event_record(item)})
+
+def handle_delete(body, query_params):
+    token_id = query_params.get('token') or body.get('token_id')
 
     if not token_id:
         return _response(400, {'message': 'token_id is required in the request body'})
 
     try:
-        events = table.query(
-            KeyConditionExpression=Key('token_id').eq(token_id)
-        ).get('Items', [])
-
-        with table.batch_writer() as batch:
-            for event_item in events:
-                batch.delete_item(
-                    Key={
-                        'token_id': token_id,
-                        'timestamp': event_item['timestamp']
-                    }
-                )
-
-        return _response(200, {'message': f'Deleted {len(events)} events for token_id {token_id}'})
+        timestamp = _parse_time(query_params.get('timestamp') or body.get('timestamp'), 'timestamp')
+        if timestamp is not None:
+            start = end = timestamp
+        else:
+            start = _parse_time(query_params.get('from') or body.get('from'), 'from')
+            end = _parse_time(query_params.get('to') or body.get('to'), 'to')
+    except ValueError as e:
+        return _response(400, {'message': str(e)})
+    if start is not None and end is not None and start > end:
+        return _response(400, {'message': 'from must not be after to'})
+
+    try:
+        # Read keys until the purge is known to be small enough to run inline
+        pages, stored, last_key = [], 0, None
+        for items, last_key in event_purge.key_pages(lazy.client('dynamodb'), token_id, start, end):
+            pages.append(items)
+            stored += len(items)
+            if stored > event_purge.PURGE_SYNC_MAX_ITEMS:
+                break
+
+        if stored > event_purge.PURGE_SYNC_MAX_ITEMS and purge_function_name and event_jobs_table_name:
+            job = event_purge.create_job(lazy.table(event_jobs_table_name), token_id, start, end)
+            event_purge.start_job(lazy.client('lambda'), purge_function_name, job['job_id'])
+            return _response(202, {
+                'message': f'Purge of token_id {token_id} started',
+                **event_purge.public_job(job)
+            })
+
+        deleted = sum(event_purge.delete_page(lazy.client('dynamodb'), token_id, start, end, items) for items in pages)
+        if last_key:
+            # No job runner configured; finish the purge in this request
+            more, _ = event_purge.purge(lazy.client('dynamodb'), token_id, start, end, exclusive_start_key=last_key)
+            deleted += more
+        archive_deleted = event_purge.purge_archive(token_id, start, end)
+        event_stats.invalidate(token_id)
+        event_purge.finish_purge(token_id, start, end)
+
+        return _response(200, {
+            'message': f'Deleted {deleted} events for token_id {token_id}',
+            'deleted': deleted,
+            'archive_deleted': archive_deleted
+        })
     except Exception as e:
         return _response(500, {'message': f'Failed to delete events for token_id {token_id}: {str(e)}'})
 
-def _response(status, body):
+def handle_get_purge(body, query_params):
+    job_id = query_params.get('job_id') or body.get('job_id')
+    if not job_id:
+        return _response(400, {'message': 'job_id is required'})
+    if not event_jobs_table_name:
+        return _response(500, {'message': 'EVENT_JOBS_TABLE_NAME is not configured'})
+
+    try:
+        job = lazy.table(event_jobs_table_name).get_item(Key={'job_id': job_id}).get('Item')
+    except Exception as e:
+        return _response(500, {'message': f'Error retrieving purge job: {str(e)}'})
+    if not job:
+        return _response(404, {'message': 'Purge job not found'})
+    return _response(200, event_purge.public_job(job))
+
+def _response(status, body, headers=None):
+    """Unrendered response; lambda_handler serializes the body once via serialization.render."""
     return {
         'statusCode': status,
-        'headers': { "Content-Type": "application/json" },
-        'body': json.dumps(body)
+        'headers': { "Content-Type": "application/json", **(headers or {}) },
+        'body': body
     }
 
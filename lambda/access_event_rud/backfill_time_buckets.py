@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import boto3 #type: ignore
+from botocore.exceptions import ClientError #type: ignore
+from event_buckets import time_bucket
+
+# One-off backfill of `time_bucket` on events written before the
+# time_bucket_index GSI existed; without it they are only reachable by token.
+# Parallel-scans for items missing the attribute and sets it with UpdateItem.
+
+DEFAULT_SEGMENTS = int(os.environ.get('BACKFILL_SEGMENTS', '8'))
+
+def _backfill_segment(client, table_name, segment, total_segments):
+    updated = 0
+    args = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ProjectionExpression': 'token_id, #ts',
+        'FilterExpression': 'attribute_not_exists(time_bucket)',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'},
+    }
+    while True:
+        response = client.scan(**args)
+        for item in response.get('Items', []):
+            bucket = time_bucket(item['token_id']['S'], int(item['timestamp']['N']))
+            if not bucket:
+                continue
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key={'token_id': item['token_id'], 'timestamp': item['timestamp']},
+                    UpdateExpression='SET time_bucket = :bucket',
+                    # Do not resurrect events deleted while the backfill runs
+                    ConditionExpression='attribute_exists(token_id)',
+                    ExpressionAttributeValues={':bucket': {'S': bucket}}
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return updated
+        args['ExclusiveStartKey'] = last_key
+
+def backfill(table_name, segments=DEFAULT_SEGMENTS, client=None):
+    """Sets time_bucket on every event that lacks it; returns the number of updated items."""
+    client = client or boto3.client('dynamodb')
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        futures = [
+            pool.submit(_backfill_segment, client, table_name, segment, segments)
+            for segment in range(segments)
+        ]
+        return sum(future.result() for future in futures)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill time_bucket on existing access events.')
+    parser.add_argument('--table', default=os.environ.get('DYNAMODB_TABLE_NAME'))
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS)
+    args = parser.parse_args()
+    if not args.table:
+        sys.exit('--table or DYNAMODB_TABLE_NAME is required')
+
+    print(json.dumps({'updated': backfill(args.table, args.segments)}))
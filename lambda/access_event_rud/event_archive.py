@@ -0,0 +1,417 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from boto3.dynamodb.conditions import Key #type: ignore
+from botocore.exceptions import ClientError #type: ignore
+from event_buckets import TIME_BUCKET_INDEX, EVENT_BUCKET_SHARDS, DAY_MS, day_start, day_buckets, token_shard
+from event_packing import packing_enabled
+import lazy
+import packed_events
+
+# Cold tier of the access events. A scheduled run moves every whole UTC day
+# older than ARCHIVE_AFTER_DAYS out of DynamoDB into Parquet files, one per day
+# and write shard (the partitions of the time_bucket_index):
+#
+#   <ARCHIVE_LOCATION>/day=2024-01-15/shard=2/events.parquet
+#   <ARCHIVE_LOCATION>/_manifest.json
+#
+# Rows are sorted by (token_id, timestamp) and zstd-compressed, so the row-group
+# statistics let a reader skip everything but one token's rows. The manifest
+# lists the archived days and shards: GET /events?tier=all opens only the
+# token's file of each day in range, without listing the store. A shard's hot
+# items get `expires_at` once the shard is in the manifest, and DynamoDB TTL
+# deletes them in the background. A token purge rewrites the token's file of
+# each archived day in range without its rows. pyarrow is imported on first use.
+
+# Local directory or s3://bucket/prefix; unset disables the archive
+ARCHIVE_LOCATION = os.environ.get('ARCHIVE_LOCATION')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+# Where the first run starts when it is not given a `from`
+ARCHIVE_INITIAL_LOOKBACK_DAYS = int(os.environ.get('ARCHIVE_INITIAL_LOOKBACK_DAYS', '365'))
+ARCHIVE_COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+ARCHIVE_ROW_GROUP_ROWS = int(os.environ.get('ARCHIVE_ROW_GROUP_ROWS', '16384'))
+# Readers pick up new runs after this long
+ARCHIVE_MANIFEST_TTL_SECONDS = float(os.environ.get('ARCHIVE_MANIFEST_TTL_SECONDS', '60'))
+# A run hands over to a fresh invocation when less time than this is left
+JOB_MIN_REMAINING_MS = int(os.environ.get('ARCHIVE_JOB_MIN_REMAINING_MS', '120000'))
+# Day files opened together while a page is filled
+READ_DAYS_PER_BATCH = 8
+# Times a purged file is read back and rewritten if another writer put rows back
+PURGE_REWRITE_ATTEMPTS = 3
+# UpdateItem calls in flight at once while archived items get their TTL
+ARCHIVE_EXPIRE_WORKERS = int(os.environ.get('ARCHIVE_EXPIRE_WORKERS', '16'))
+
+MANIFEST = '_manifest.json'
+COLUMNS = ('token_id', 'timestamp', 'authorized', 'token_valid')
+
+# The shards of a day are read and written in parallel
+_pool = ThreadPoolExecutor(max_workers=EVENT_BUCKET_SHARDS)
+# Separate, as _expire runs on _pool and waits for these
+_expire_pool = ThreadPoolExecutor(max_workers=ARCHIVE_EXPIRE_WORKERS)
+
+# location -> (read at, manifest), for the readers
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def _label(day):
+    return datetime.fromtimestamp(day / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def _day(label):
+    return int(datetime.strptime(label, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+@functools.lru_cache(maxsize=None)
+def _filesystem(location):
+    """(pyarrow filesystem, root path) of a local directory or s3://bucket/prefix."""
+    from pyarrow import fs #type: ignore
+    if location.startswith('s3://'):
+        options = {'region': os.environ.get('AWS_REGION', 'us-east-1')}
+        endpoint = os.environ.get('ARCHIVE_S3_ENDPOINT_URL')
+        if endpoint:
+            parsed = urlparse(endpoint)
+            options.update(endpoint_override=parsed.netloc, scheme=parsed.scheme or 'https')
+        return fs.S3FileSystem(**options), location[len('s3://'):].rstrip('/')
+    return fs.LocalFileSystem(), os.path.abspath(location)
+
+
+def _make_dirs(filesystem, path):
+    """Creates a local directory; object stores have no directories to create."""
+    if filesystem.type_name == 'local':
+        filesystem.create_dir(path, recursive=True)
+
+
+def _partition(root, day, shard):
+    return f'{root}/day={_label(day)}/shard={shard}/events.parquet'
+
+
+def read_manifest(filesystem, root):
+    try:
+        with filesystem.open_input_stream(f'{root}/{MANIFEST}') as stream:
+            return json.loads(stream.read())
+    except FileNotFoundError:
+        return {'version': 1, 'archived_from': None, 'archived_through': None, 'days': {}}
+
+
+def _write_manifest(filesystem, root, manifest):
+    """Writes a temporary object and moves it over the manifest, so readers never see half of one."""
+    _make_dirs(filesystem, root)
+    staging = f'{root}/{MANIFEST}.tmp'
+    with filesystem.open_output_stream(staging) as stream:
+        stream.write(json.dumps(manifest, sort_keys=True).encode('utf-8'))
+    filesystem.move(staging, f'{root}/{MANIFEST}')
+
+
+def manifest(location=None):
+    """The archive manifest, cached per container for ARCHIVE_MANIFEST_TTL_SECONDS."""
+    location = location or ARCHIVE_LOCATION
+    now = time.monotonic()
+    with _manifests_lock:
+        entry = _manifests.get(location)
+    if entry and now - entry[0] < ARCHIVE_MANIFEST_TTL_SECONDS:
+        return entry[1]
+    value = read_manifest(*_filesystem(location))
+    with _manifests_lock:
+        _manifests[location] = (now, value)
+    return value
+
+
+def archived_range(token_id=None, location=None):
+    """
+    [start, end) in epoch ms of the token's events that live in the archive;
+    (0, 0) before the first run. A day that is only partly archived counts
+    when the token's shard is done, or without a token when any shard is.
+    """
+    current = manifest(location)
+    start, end = current.get('archived_from'), current.get('archived_through')
+    if start is None:
+        return 0, 0
+    entry = current['days'].get(_label(end))
+    if entry and (str(token_shard(token_id, entry['shards'])) in entry['rows'] if token_id else entry['rows']):
+        end += DAY_MS
+    return start, end
+
+
+# ------------------------------ reads ------------------------------
+
+def _record(row):
+    if row.get('token_valid') is None:
+        row.pop('token_valid', None)
+    return row
+
+
+def query_token_events(token_id, lower, upper, limit, location=None):
+    """
+    Archived events of one token in [lower, upper], newest first: up to `limit`
+    and whether there are more. Only the token's file of each day in range is
+    opened, a few days at a time until the page is full; within a file the
+    token/time filter skips the row groups that cannot match.
+    """
+    from pyarrow import dataset as ds #type: ignore
+    location = location or ARCHIVE_LOCATION
+    filesystem, root = _filesystem(location)
+    current = manifest(location)
+
+    paths = []
+    for label in sorted(current['days'], reverse=True):
+        day = _day(label)
+        if day + DAY_MS <= lower or day > upper:
+            continue
+        entry = current['days'][label]
+        shard = token_shard(token_id, entry['shards'])
+        if entry['rows'].get(str(shard)):
+            paths.append(_partition(root, day, shard))
+
+    condition = (ds.field('token_id') == token_id) & (ds.field('timestamp') >= lower) & (ds.field('timestamp') <= upper)
+    events = []
+    for offset in range(0, len(paths), READ_DAYS_PER_BATCH):
+        dataset = ds.dataset(paths[offset:offset + READ_DAYS_PER_BATCH], format='parquet', filesystem=filesystem)
+        table = dataset.to_table(filter=condition).sort_by([('timestamp', 'descending')])
+        events.extend(_record(row) for row in table.to_pylist())
+        if len(events) > limit:
+            return events[:limit], True
+    return events, False
+
+
+# ------------------------------ purge ------------------------------
+
+def _purge_file(filesystem, path, token_id, low, high):
+    """
+    Rewrites one day/shard file without the token's rows in [low, high];
+    returns how many there were. The file is read back after each write: a
+    concurrent purge of another token in the same file may have written back
+    rows from its own copy, which are then removed again.
+    """
+    import pyarrow.compute as pc #type: ignore
+    import pyarrow.parquet as pq #type: ignore
+    removed = None
+    for _ in range(PURGE_REWRITE_ATTEMPTS + 1):
+        table = pq.read_table(path, filesystem=filesystem)
+        match = pc.and_(
+            pc.equal(table['token_id'], token_id),
+            pc.and_(pc.greater_equal(table['timestamp'], low), pc.less_equal(table['timestamp'], high))
+        )
+        count = pc.sum(pc.cast(match, 'int64')).as_py() or 0
+        if removed is None:
+            removed = count
+        if not count:
+            return removed
+        _write_table(filesystem, path, table.filter(pc.invert(match)))
+    raise RuntimeError(f'{path} kept changing while the events of token {token_id} were removed')
+
+
+def purge_token(token_id, start, end, location=None):
+    """
+    Removes the token's archived events in [start, end] (either bound may be
+    None) by rewriting its file of each archived day in range; returns the
+    number of rows removed. The manifest keeps the row counts of the run that
+    wrote the files.
+    """
+    location = location or ARCHIVE_LOCATION
+    filesystem, root = _filesystem(location)
+    current = read_manifest(filesystem, root)
+    low = start if start is not None else 0
+    high = end if end is not None else 2 ** 63 - 1
+
+    paths = []
+    for label, entry in current['days'].items():
+        day = _day(label)
+        if day + DAY_MS <= low or day > high:
+            continue
+        shard = token_shard(token_id, entry['shards'])
+        if entry['rows'].get(str(shard)):
+            paths.append(_partition(root, day, shard))
+    return sum(_pool.map(lambda path: _purge_file(filesystem, path, token_id, low, high), paths))
+
+
+# ------------------------------ archival ------------------------------
+
+def _hot_table_name():
+    return os.environ['EVENT_BUCKET_TABLE_NAME'] if packing_enabled() else os.environ['DYNAMODB_TABLE_NAME']
+
+
+def _shard_items(table_name, bucket):
+    """Every item of one time_bucket_index partition (a day and shard)."""
+    table = lazy.table(table_name)
+    args = {'IndexName': TIME_BUCKET_INDEX, 'KeyConditionExpression': Key('time_bucket').eq(bucket)}
+    items = []
+    while True:
+        response = table.query(**args)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        args['ExclusiveStartKey'] = last_key
+
+
+def _write_table(filesystem, path, table):
+    """Writes a temporary file and moves it into place, so readers never see half of one."""
+    import pyarrow.parquet as pq #type: ignore
+    _make_dirs(filesystem, path.rsplit('/', 1)[0])
+    staging = f'{path}.tmp'
+    pq.write_table(
+        table, staging, filesystem=filesystem, compression=ARCHIVE_COMPRESSION,
+        row_group_size=ARCHIVE_ROW_GROUP_ROWS, use_dictionary=['token_id']
+    )
+    filesystem.move(staging, path)
+
+
+def _write_partition(filesystem, root, day, shard, events):
+    import pyarrow as pa #type: ignore
+    events.sort(key=lambda event: (event['token_id'], int(event['timestamp'])))
+    table = pa.table({
+        'token_id': pa.array([event['token_id'] for event in events], pa.string()),
+        'timestamp': pa.array([int(event['timestamp']) for event in events], pa.int64()),
+        'authorized': pa.array([bool(event.get('authorized')) for event in events], pa.bool_()),
+        'token_valid': pa.array([event.get('token_valid') for event in events], pa.bool_()),
+    })
+    _write_table(filesystem, _partition(root, day, shard), table)
+
+
+def _archive_shard(table_name, filesystem, root, day, shard):
+    """Writes the Parquet file of one day and shard; returns (hot items, events archived)."""
+    items = _shard_items(table_name, day_buckets(day)[shard])
+    if packing_enabled():
+        events = packed_events.decode_items(items)
+    else:
+        events = [{name: item[name] for name in COLUMNS if name in item} for item in items]
+    if events:
+        _write_partition(filesystem, root, day, shard, events)
+    return items, len(events)
+
+
+def _expire_item(table, key, expires_at, event_count=None):
+    # Do not resurrect items deleted since the shard was read, nor expire a
+    # packed item that an event was appended to since (it is not archived)
+    condition, values = 'attribute_exists(token_id)', {':expires_at': expires_at}
+    if event_count is not None:
+        condition += ' AND event_count = :seen'
+        values[':seen'] = event_count
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET expires_at = :expires_at',
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values
+        )
+        return 1
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return 0
+
+
+def _expire(table_name, items, expires_at):
+    """
+    Sets the TTL attribute on archived items in place, so writes that landed
+    after the shard was read are kept; returns the number of items updated.
+    """
+    table = lazy.table(table_name)
+    if packing_enabled():
+        return sum(_expire_pool.map(
+            lambda item: _expire_item(
+                table, {'token_id': item['token_id'], 'bucket': item['bucket']}, expires_at, item['event_count']
+            ),
+            items
+        ))
+    return sum(_expire_pool.map(
+        lambda item: _expire_item(table, {'token_id': item['token_id'], 'timestamp': item['timestamp']}, expires_at),
+        items
+    ))
+
+
+def archive(location, after_days=ARCHIVE_AFTER_DAYS, start=None, deadline=None):
+    """
+    Archives every whole day older than `after_days` that is not archived yet,
+    oldest first. A first run starts at `start` (epoch ms), by default
+    ARCHIVE_INITIAL_LOOKBACK_DAYS before that cutoff. Stops between days once
+    `deadline` (time.monotonic()) has passed. A shard is recorded in the
+    manifest before its hot items expire, so an interrupted run loses nothing
+    and the next one carries on where it stopped.
+    """
+    filesystem, root = _filesystem(location)
+    current = read_manifest(filesystem, root)
+    cutoff = day_start(int(time.time() * 1000)) - after_days * DAY_MS
+    if current['archived_through'] is None:
+        first = day_start(int(start)) if start is not None else cutoff - ARCHIVE_INITIAL_LOOKBACK_DAYS * DAY_MS
+        current['archived_from'] = current['archived_through'] = first
+        _write_manifest(filesystem, root, current)
+
+    table_name = _hot_table_name()
+    expires_at = int(time.time())
+    days = rows = expired = 0
+    day = current['archived_through']
+    while day < cutoff:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        label = _label(day)
+        entry = current['days'].setdefault(label, {'shards': EVENT_BUCKET_SHARDS, 'rows': {}})
+        futures = {
+            shard: _pool.submit(_archive_shard, table_name, filesystem, root, day, shard)
+            for shard in range(entry['shards']) if str(shard) not in entry['rows']
+        }
+        expiring = []
+        for shard, future in futures.items():
+            items, count = future.result()
+            entry['rows'][str(shard)] = count
+            _write_manifest(filesystem, root, current)
+            rows += count
+            if items:
+                expiring.append(_pool.submit(_expire, table_name, items, expires_at))
+        expired += sum(future.result() for future in expiring)
+
+        if not any(entry['rows'].values()):
+            del current['days'][label]
+        day += DAY_MS
+        current['archived_through'] = day
+        _write_manifest(filesystem, root, current)
+        days += 1
+
+    return {
+        'location': location,
+        'archived_from': current['archived_from'],
+        'archived_through': current['archived_through'],
+        'days': days,
+        'rows': rows,
+        'expired': expired,
+        'done': day >= cutoff,
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled entry point (EventBridge, daily). {"from": <epoch ms>} sets where a
+    first run starts; a run that does not catch up before the timeout continues
+    in a new invocation.
+    """
+    if not ARCHIVE_LOCATION:
+        raise RuntimeError('ARCHIVE_LOCATION is not set')
+    deadline = time.monotonic() + max(0, context.get_remaining_time_in_millis() - JOB_MIN_REMAINING_MS) / 1000.0
+    result = archive(ARCHIVE_LOCATION, start=(event or {}).get('from'), deadline=deadline)
+    print(f"Archive run: {json.dumps(result)}")
+    if not result['done']:
+        lazy.client('lambda').invoke(FunctionName=context.function_name, InvocationType='Event', Payload=json.dumps({}))
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Move access events older than a cutoff into Parquet archives.')
+    parser.add_argument('location', nargs='?', default=ARCHIVE_LOCATION, help='local directory or s3://bucket/prefix')
+    parser.add_argument('--after-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--from', dest='start', type=int, help='first day of a first run (epoch ms)')
+    args = parser.parse_args()
+    if not args.location:
+        sys.exit('location or ARCHIVE_LOCATION is required')
+    if not os.environ.get('DYNAMODB_TABLE_NAME'):
+        sys.exit('DYNAMODB_TABLE_NAME is required')
+
+    print(json.dumps(archive(args.location, args.after_days, args.start), indent=2))
@@ -0,0 +1,224 @@
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from serialization import ndjson
+import lazy
+
+# Full export of the access events table using a DynamoDB parallel scan.
+# Every segment is scanned by its own worker; pages are serialized to NDJSON in
+# the workers and streamed through a bounded queue to a single writer, so memory
+# stays flat no matter how large the table is.
+
+DEFAULT_SEGMENTS = int(os.environ.get('EXPORT_SEGMENTS', '8'))
+MAX_SEGMENTS = 64
+# Bounded hand-off between scanning workers and the writer (in pages)
+QUEUE_DEPTH = int(os.environ.get('EXPORT_QUEUE_DEPTH', '32'))
+# S3 multipart parts must be at least 5 MiB (except the last one)
+S3_PART_SIZE = 8 * 1024 * 1024
+
+_DONE = object()
+
+def _to_native(value):
+    """Converts a low-level DynamoDB attribute value to a JSON-ready value."""
+    (kind, raw), = value.items()
+    if kind == 'S' or kind == 'BOOL':
+        return raw
+    if kind == 'N':
+        return int(raw) if raw.lstrip('-').isdigit() else float(raw)
+    if kind == 'NULL':
+        return None
+    if kind == 'L':
+        return [_to_native(v) for v in raw]
+    if kind == 'M':
+        return {k: _to_native(v) for k, v in raw.items()}
+    if kind in ('SS', 'NS'):
+        return [_to_native({kind[0]: v}) for v in raw]
+    raise ValueError(f'Unsupported attribute type: {kind}')
+
+def _serialize_page(items):
+    return ndjson({k: _to_native(v) for k, v in item.items()} for item in items)
+
+class _S3MultipartWriter:
+    """File-like sink that uploads to s3://bucket/key in multipart chunks."""
+
+    def __init__(self, s3, bucket, key, content_type):
+        self.s3, self.bucket, self.key = s3, bucket, key
+        self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+        self.parts = []
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer.extend(data)
+        if len(self.buffer) >= S3_PART_SIZE:
+            self._flush_part()
+        return len(data)
+
+    def _flush_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._flush_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def _open_destination(destination, compress):
+    """Returns (raw sink, writable stream) for a local path or an s3:// URL."""
+    if destination.startswith('s3://'):
+        bucket, _, key = destination[len('s3://'):].partition('/')
+        if not bucket or not key:
+            raise ValueError('S3 destination must look like s3://bucket/key')
+        endpoint = os.environ.get('EXPORT_S3_ENDPOINT_URL')
+        if endpoint:
+            # S3-compatible store other than S3: a client of its own for that endpoint
+            import boto3 #type: ignore
+            s3 = boto3.client('s3', endpoint_url=endpoint)
+        else:
+            s3 = lazy.client('s3')
+        content_type = 'application/gzip' if compress else 'application/x-ndjson'
+        sink = _S3MultipartWriter(s3, bucket, key, content_type)
+    else:
+        sink = open(destination, 'wb')
+    stream = gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6) if compress else sink
+    return sink, stream
+
+def _scan_segment(client, table_name, segment, total_segments, out_queue, stop, page_limit):
+    rows = 0
+    args = {'TableName': table_name, 'Segment': segment, 'TotalSegments': total_segments}
+    if page_limit:
+        args['Limit'] = page_limit
+    try:
+        while not stop.is_set():
+            response = client.scan(**args)
+            items = response.get('Items', [])
+            if items:
+                out_queue.put((len(items), _serialize_page(items)))
+                rows += len(items)
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            args['ExclusiveStartKey'] = last_key
+    finally:
+        out_queue.put(_DONE)
+    return rows
+
+def export_events(table_name, destination, segments=DEFAULT_SEGMENTS, compress=False, client=None, page_limit=None):
+    """
+    Parallel-scans `table_name` with `segments` workers and streams every item
+    as NDJSON (gzip when `compress`) to a local path or s3://bucket/key.
+    Returns row counts and throughput.
+    """
+    if not 1 <= segments <= MAX_SEGMENTS:
+        raise ValueError(f'segments must be between 1 and {MAX_SEGMENTS}')
+    client = client or lazy.client('dynamodb')
+
+    out_queue = queue.Queue(maxsize=QUEUE_DEPTH)
+    stop = threading.Event()
+    sink, stream = _open_destination(destination, compress)
+    started = time.perf_counter()
+    rows = 0
+    bytes_written = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as pool:
+            futures = [
+                pool.submit(_scan_segment, client, table_name, segment, segments, out_queue, stop, page_limit)
+                for segment in range(segments)
+            ]
+            remaining = len(futures)
+            try:
+                while remaining:
+                    entry = out_queue.get()
+                    if entry is _DONE:
+                        remaining -= 1
+                        continue
+                    count, payload = entry
+                    stream.write(payload)
+                    rows += count
+                    bytes_written += len(payload)
+            except BaseException:
+                stop.set()
+                # Keep draining so workers blocked on a full queue can finish
+                while remaining:
+                    if out_queue.get() is _DONE:
+                        remaining -= 1
+                raise
+
+            segment_rows = [future.result() for future in futures]
+
+        if stream is not sink:
+            stream.close()
+        sink.close()
+    except BaseException:
+        if isinstance(sink, _S3MultipartWriter):
+            sink.abort()
+        else:
+            sink.close()
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        'destination': destination,
+        'format': 'ndjson.gz' if compress else 'ndjson',
+        'segments': segments,
+        'rows': rows,
+        'segment_rows': segment_rows,
+        'uncompressed_bytes': bytes_written,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+
+def lambda_handler(event, context):
+    """
+    Standalone export entry point. Expects:
+        {"destination": "s3://bucket/key.ndjson.gz", "segments": 8, "compress": true}
+    """
+    table_name = os.environ['DYNAMODB_TABLE_NAME']
+    destination = event.get('destination') or os.environ.get('EXPORT_DESTINATION')
+    if not destination:
+        return {'statusCode': 400, 'body': json.dumps({'message': 'destination is required'})}
+
+    try:
+        segments = int(event.get('segments', DEFAULT_SEGMENTS))
+        result = export_events(table_name, destination, segments, bool(event.get('compress', True)))
+    except ValueError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
+    except Exception as e:
+        print(f"Export failed: {e}")
+        return {'statusCode': 500, 'body': json.dumps({'message': f'Export failed: {str(e)}'})}
+
+    print(f"Export finished: {json.dumps(result)}")
+    return {'statusCode': 200, 'body': json.dumps(result)}
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export the access events table as NDJSON.')
+    parser.add_argument('destination', help='local path or s3://bucket/key')
+    parser.add_argument('--table', default=os.environ.get('DYNAMODB_TABLE_NAME'))
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args()
+    if not args.table:
+        sys.exit('--table or DYNAMODB_TABLE_NAME is required')
+
+    print(json.dumps(export_events(args.table, args.destination, args.segments, args.gzip), indent=2))
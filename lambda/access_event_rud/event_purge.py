@@ -0,0 +1,262 @@
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import event_archive
+from event_packing import PACKED_BUCKET_MS, packing_enabled, sort_key_range, split_sort_key, unpack_timestamp
+import event_versions
+import lazy
+import packed_events
+
+# Deletes the stored history of one token, optionally only the events in
+# [start, end]. Keys are read page by page with consistent keys-only queries and
+# deleted by a bounded pool of BatchWriteItem workers. The deleted count is the
+# number of distinct events those reads found; BatchWriteItem does not say
+# whether a key still existed, so a concurrent delete of the same events is
+# counted by both. DELETE /events runs small purges
+# inline; larger ones become a job in the jobs table that lambda_handler below
+# works through, continuing in a new invocation before it runs out of time.
+# Archived events are removed from the Parquet files as a last step and
+# counted separately, as an event may still be in both tiers until its TTL.
+
+PURGE_WORKERS = int(os.environ.get('PURGE_WORKERS', '8'))
+# Above this many stored items DELETE /events hands the purge to a job
+PURGE_SYNC_MAX_ITEMS = int(os.environ.get('PURGE_SYNC_MAX_ITEMS', '5000'))
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ATTEMPTS = int(os.environ.get('BATCH_WRITE_MAX_ATTEMPTS', '8'))
+BATCH_WRITE_BASE_DELAY = float(os.environ.get('BATCH_WRITE_BASE_DELAY', '0.05'))
+# A job hands over to a fresh invocation when less time than this is left
+JOB_MIN_REMAINING_MS = int(os.environ.get('PURGE_JOB_MIN_REMAINING_MS', '60000'))
+JOB_TTL_SECONDS = 7 * 24 * 3600
+MAX_TIMESTAMP = 2 ** 53
+
+_pool = ThreadPoolExecutor(max_workers=PURGE_WORKERS)
+
+def _target(token_id, start, end):
+    """(table name, query arguments) of the keys-only query over the purge range."""
+    low = start if start is not None else 0
+    high = end if end is not None else MAX_TIMESTAMP
+    if packing_enabled():
+        table_name = os.environ['EVENT_BUCKET_TABLE_NAME']
+        low, high = sort_key_range(low, high)
+        # The packed values are read too: event_count also counts repeated
+        # and edited events, which are one event each
+        projection, names = 'token_id, #sk, #events', {'#sk': 'bucket', '#events': 'events'}
+    else:
+        table_name, sort_key = os.environ['DYNAMODB_TABLE_NAME'], 'timestamp'
+        projection, names = 'token_id, #sk', {'#sk': 'timestamp'}
+    return table_name, {
+        'TableName': table_name,
+        'KeyConditionExpression': 'token_id = :token AND #sk BETWEEN :low AND :high',
+        'ProjectionExpression': projection,
+        'ExpressionAttributeNames': names,
+        'ConsistentRead': True,
+        'ExpressionAttributeValues': {
+            ':token': {'S': token_id},
+            ':low': {'N': str(low)},
+            ':high': {'N': str(high)},
+        },
+    }
+
+def key_pages(client, token_id, start, end, exclusive_start_key=None):
+    """Yields (keys-only items, LastEvaluatedKey) for every page of the purge range."""
+    _, args = _target(token_id, start, end)
+    if exclusive_start_key:
+        args['ExclusiveStartKey'] = exclusive_start_key
+    while True:
+        response = client.query(**args)
+        last_key = response.get('LastEvaluatedKey')
+        yield response.get('Items', []), last_key
+        if not last_key:
+            return
+        args['ExclusiveStartKey'] = last_key
+
+def _delete_chunk(client, table_name, keys):
+    """Deletes up to 25 keys, re-sending UnprocessedItems with exponential backoff."""
+    requests = [{'DeleteRequest': {'Key': key}} for key in keys]
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(random.uniform(0, BATCH_WRITE_BASE_DELAY * (2 ** attempt)))
+        response = client.batch_write_item(RequestItems={table_name: requests})
+        requests = (response.get('UnprocessedItems') or {}).get(table_name, [])
+        if not requests:
+            return
+    raise RuntimeError(f'{len(requests)} deletes still unprocessed after {BATCH_WRITE_MAX_ATTEMPTS} attempts')
+
+def _delete_events(client, table_name, items):
+    _delete_chunk(client, table_name, items)
+    return len(items)
+
+def _delete_buckets(client, table_name, items):
+    """Deletes up to 25 bucket items; returns the timestamps of the events they held."""
+    _delete_chunk(client, table_name, [{'token_id': item['token_id'], 'bucket': item['bucket']} for item in items])
+    timestamps = set()
+    for item in items:
+        hour, _ = split_sort_key(item['bucket']['N'])
+        timestamps.update(unpack_timestamp(hour, value['N']) for value in item.get('events', {}).get('L', []))
+    return timestamps
+
+def delete_page(client, token_id, start, end, items):
+    """
+    Deletes one page of keys on the worker pool; returns the number of events
+    removed. In bucket mode, items of an hour that only partly overlaps the
+    range are trimmed instead of deleted, and an event stored in several
+    values or parts of its hour counts once.
+    """
+    table_name, _ = _target(token_id, start, end)
+    low = start if start is not None else 0
+    high = end if end is not None else MAX_TIMESTAMP
+    futures = []
+    if packing_enabled():
+        whole = []
+        for item in items:
+            hour, _ = split_sort_key(item['bucket']['N'])
+            if hour < low or hour + PACKED_BUCKET_MS - 1 > high:
+                futures.append(_pool.submit(
+                    packed_events.trim_bucket, client, table_name, token_id, int(item['bucket']['N']), low, high
+                ))
+            else:
+                whole.append(item)
+        for offset in range(0, len(whole), BATCH_WRITE_MAX_ITEMS):
+            futures.append(_pool.submit(_delete_buckets, client, table_name, whole[offset:offset + BATCH_WRITE_MAX_ITEMS]))
+        return len(set().union(*(future.result() for future in futures)))
+    else:
+        for offset in range(0, len(items), BATCH_WRITE_MAX_ITEMS):
+            futures.append(_pool.submit(_delete_events, client, table_name, items[offset:offset + BATCH_WRITE_MAX_ITEMS]))
+    return sum(future.result() for future in futures)
+
+def purge(client, token_id, start, end, exclusive_start_key=None, deadline=None, progress=None):
+    """
+    Deletes the token's events in [start, end] (either bound may be None).
+    Stops after the first page that ends past `deadline` (time.monotonic()).
+    Returns (events deleted, LastEvaluatedKey to continue from, or None when done).
+    """
+    deleted = 0
+    for items, last_key in key_pages(client, token_id, start, end, exclusive_start_key):
+        deleted += delete_page(client, token_id, start, end, items)
+        if progress:
+            progress(deleted, last_key)
+        if last_key and deadline is not None and time.monotonic() >= deadline:
+            return deleted, last_key
+    return deleted, None
+
+def purge_archive(token_id, start, end):
+    """Removes the token's events in [start, end] from the archive, if there is one; returns the rows removed."""
+    if not event_archive.ARCHIVE_LOCATION:
+        return 0
+    return event_archive.purge_token(token_id, start, end)
+
+def finish_purge(token_id, start, end):
+    """
+    Drops the token's last-seen state once its whole history is gone, and moves
+    the change markers so cached GET /events listings are read again.
+    """
+    state_table_name = os.environ.get('TOKEN_STATE_TABLE_NAME')
+    if not state_table_name:
+        return
+    state_table = lazy.table(state_table_name)
+    if start is None and end is None:
+        state_table.delete_item(Key={'token_id': token_id})
+        event_versions.bump(state_table)
+    else:
+        event_versions.bump(state_table, token_id)
+
+# ------------------------------ jobs ------------------------------
+
+def create_job(jobs_table, token_id, start, end):
+    now = int(time.time())
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'kind': 'purge',
+        'token_id': token_id,
+        'status': 'queued',
+        'deleted': 0,
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': now + JOB_TTL_SECONDS,
+    }
+    if start is not None:
+        job['from'] = start
+    if end is not None:
+        job['to'] = end
+    jobs_table.put_item(Item=job)
+    return job
+
+def start_job(lambda_client, function_name, job_id):
+    lambda_client.invoke(FunctionName=function_name, InvocationType='Event', Payload=json.dumps({'job_id': job_id}))
+
+def public_job(job):
+    """Job record as returned by GET /events/purge."""
+    return {k: v for k, v in job.items() if k not in ('resume_key', 'expires_at')}
+
+def _update_job(jobs_table, job_id, **fields):
+    fields['updated_at'] = int(time.time())
+    names = {f'#{name}': name for name in fields}
+    jobs_table.update_item(
+        Key={'job_id': job_id},
+        UpdateExpression='SET ' + ', '.join(f'#{name} = :{name}' for name in fields),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={f':{name}': value for name, value in fields.items()}
+    )
+
+def run_job(job_id, remaining_ms, function_name, client=None, jobs_table=None, lambda_client=None):
+    """Works through one purge job until it is done or the invocation is about to time out."""
+    client = client or lazy.client('dynamodb')
+    jobs_table = jobs_table or lazy.table(os.environ['EVENT_JOBS_TABLE_NAME'])
+    job = jobs_table.get_item(Key={'job_id': job_id}, ConsistentRead=True).get('Item')
+    if not job or job['status'] in ('done', 'failed'):
+        return job
+
+    token_id = job['token_id']
+    start = int(job['from']) if 'from' in job else None
+    end = int(job['to']) if 'to' in job else None
+    resume_key = json.loads(job['resume_key']) if job.get('resume_key') else None
+    already = int(job['deleted'])
+    deadline = time.monotonic() + max(0, remaining_ms - JOB_MIN_REMAINING_MS) / 1000.0
+
+    def progress(deleted, last_key):
+        _update_job(jobs_table, job_id, status='running', deleted=already + deleted,
+                    resume_key=json.dumps(last_key) if last_key else '')
+
+    try:
+        deleted, last_key = purge(client, token_id, start, end, resume_key, deadline, progress)
+        if last_key:
+            start_job(lambda_client or lazy.client('lambda'), function_name, job_id)
+            return {**job, 'status': 'running', 'deleted': already + deleted}
+        archive_deleted = purge_archive(token_id, start, end)
+        finish_purge(token_id, start, end)
+        _update_job(jobs_table, job_id, status='done', deleted=already + deleted, archive_deleted=archive_deleted)
+        return {**job, 'status': 'done', 'deleted': already + deleted, 'archive_deleted': archive_deleted}
+    except Exception as e:
+        print(f"Purge job {job_id} failed: {e}")
+        # Not re-raised: an automatic async retry would only find the failed job
+        _update_job(jobs_table, job_id, status='failed', error=str(e))
+        return {**job, 'status': 'failed', 'error': str(e)}
+
+def lambda_handler(event, context):
+    """
+    Purge job entry point, invoked asynchronously by DELETE /events and by
+    itself to continue. Expects {"job_id": "..."}.
+    """
+    job = run_job(event['job_id'], context.get_remaining_time_in_millis(), context.function_name)
+    print(f"Purge job {event['job_id']}: {json.dumps(public_job(job), default=str) if job else 'not found'}")
+    return {'job_id': event['job_id'], 'status': job['status'] if job else 'missing'}
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Delete the stored access events of one token.')
+    parser.add_argument('token_id')
+    parser.add_argument('--from', dest='start', type=int)
+    parser.add_argument('--to', dest='end', type=int)
+    args = parser.parse_args()
+    if not os.environ.get('DYNAMODB_TABLE_NAME'):
+        sys.exit('DYNAMODB_TABLE_NAME is required')
+
+    deleted, _ = purge(lazy.client('dynamodb'), args.token_id, args.start, args.end)
+    archive_deleted = purge_archive(args.token_id, args.start, args.end)
+    finish_purge(args.token_id, args.start, args.end)
+    print(json.dumps({'deleted': deleted, 'archive_deleted': archive_deleted}))
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from boto3.dynamodb.conditions import Key #type: ignore
+from event_buckets import TIME_BUCKET_INDEX, DAY_MS, day_start, day_buckets
+
+# Authorized/denied counts per token and per time bucket for GET /events/stats.
+# Query pages are folded into the counters as they arrive, so only the
+# aggregates are held in memory. Buckets that are over (plus a grace period for
+# late SQS deliveries) are cached per container; a repeated dashboard load only
+# reads the events of the buckets that are still open or not cached yet. Each
+# cached bucket carries the edit version it was counted under (the token's and
+# the cross-token edit_version, see event_versions), so a PUT or DELETE made
+# by another container makes the cached buckets miss on their next read.
+
+# Event timestamps are epoch milliseconds; buckets are aligned to UTC
+GRANULARITIES = {
+    'hour': 3600 * 1000,
+    'day': 24 * 3600 * 1000,
+}
+DEFAULT_GRANULARITY = 'hour'
+# Default range when `from` is omitted, in buckets
+DEFAULT_BUCKETS = {'hour': 24, 'day': 30}
+MAX_BUCKETS = int(os.environ.get('EVENT_STATS_MAX_BUCKETS', '1000'))
+# A bucket is only cached once its end is this far in the past
+STATS_CLOSE_GRACE_MS = int(float(os.environ.get('EVENT_STATS_CLOSE_GRACE_SECONDS', '300')) * 1000)
+# Cached buckets are recomputed after this long (covers events delivered after the grace period)
+STATS_CACHE_TTL_SECONDS = float(os.environ.get('EVENT_STATS_CACHE_TTL_SECONDS', '3600'))
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get('EVENT_STATS_CACHE_MAX_ENTRIES', '20000'))
+
+# (token or None, granularity, bucket start) -> (cached_at, version, {token_id: [authorized, denied]})
+_bucket_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key, now, version):
+    with _cache_lock:
+        entry = _bucket_cache.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] >= STATS_CACHE_TTL_SECONDS or entry[1] != version:
+            del _bucket_cache[key]
+            return None
+        _bucket_cache.move_to_end(key)
+        return entry[2]
+
+
+def _cache_put(key, counts, now, version):
+    with _cache_lock:
+        _bucket_cache[key] = (now, version, counts)
+        _bucket_cache.move_to_end(key)
+        while len(_bucket_cache) > STATS_CACHE_MAX_ENTRIES:
+            _bucket_cache.popitem(last=False)
+
+
+def invalidate(token_id=None):
+    """Drops cached buckets for one token (and the all-token buckets), or everything."""
+    with _cache_lock:
+        if token_id is None:
+            _bucket_cache.clear()
+            return
+        for key in [key for key in _bucket_cache if key[0] is None or key[0] == token_id]:
+            del _bucket_cache[key]
+
+
+def bucket_range(granularity, start, end, now_ms):
+    """
+    Aligns an inclusive [start, end] millisecond range to whole buckets and
+    returns (first bucket start, end exclusive).
+    """
+    size = GRANULARITIES[granularity]
+    if end is None:
+        end = now_ms
+    if start is None:
+        start = end - (DEFAULT_BUCKETS[granularity] - 1) * size
+    if start > end:
+        raise ValueError('from must not be after to')
+
+    first = start - start % size
+    stop = end - end % size + size
+    if (stop - first) // size > MAX_BUCKETS:
+        raise ValueError(f'range covers more than {MAX_BUCKETS} {granularity} buckets')
+    return first, stop
+
+
+def _query_pages(table, args):
+    while True:
+        response = table.query(**args)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        args['ExclusiveStartKey'] = last_key
+
+
+def _event_pages(table, token_id, start, end):
+    """
+    Yields pages of events with timestamp in [start, end), projecting only what
+    is counted. Without a token, the time_bucket_index is read day by day and
+    shard by shard, so only the events in range are read instead of the table.
+    """
+    last = end - 1
+    if token_id:
+        yield from _query_pages(table, {
+            'KeyConditionExpression': Key('token_id').eq(token_id) & Key('timestamp').between(start, last),
+            'ProjectionExpression': '#ts, authorized',
+            'ExpressionAttributeNames': {'#ts': 'timestamp'},
+        })
+        return
+
+    day = day_start(start)
+    while day <= last:
+        for bucket in day_buckets(day):
+            yield from _query_pages(table, {
+                'IndexName': TIME_BUCKET_INDEX,
+                'KeyConditionExpression': Key('time_bucket').eq(bucket) & Key('timestamp').between(max(start, day), min(last, day + DAY_MS - 1)),
+                'ProjectionExpression': 'token_id, #ts, authorized',
+                'ExpressionAttributeNames': {'#ts': 'timestamp'},
+            })
+        day += DAY_MS
+
+
+def compute_stats(table, granularity=DEFAULT_GRANULARITY, start=None, end=None, token_id=None, now_ms=None,
+                  event_pages=None, version=None, cached=True):
+    """
+    Returns authorized/denied counts per bucket and per token for the buckets
+    covering [start, end] (epoch ms, inclusive), optionally for a single token.
+    `event_pages(token_id, start, end)` overrides how events are read. Cached
+    buckets are only used when they were counted under the same `version`;
+    `cached=False` reads every bucket from the table and caches none.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    size = GRANULARITIES[granularity]
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    now = time.monotonic()
+    first, stop = bucket_range(granularity, start, end, now_ms)
+
+    # bucket start -> {token_id: [authorized, denied]}
+    buckets = {}
+    # The subset of `buckets` that has to be read from the table
+    fresh = {}
+    for bucket_start in range(first, stop, size):
+        counts = _cache_get((token_id, granularity, bucket_start), now, version) if cached else None
+        if counts is None:
+            counts = fresh[bucket_start] = {}
+        buckets[bucket_start] = counts
+    missing = list(fresh)
+
+    scanned = 0
+    if missing:
+        # One pass over the span of uncached buckets; events that fall into
+        # cached buckets inside that span are skipped
+        pages = event_pages or (lambda token, first_ms, stop_ms: _event_pages(table, token, first_ms, stop_ms))
+        for page in pages(token_id, missing[0], missing[-1] + size):
+            for item in page:
+                timestamp = int(item['timestamp'])
+                counts = fresh.get(timestamp - timestamp % size)
+                if counts is None:
+                    continue
+                event_token = token_id or item['token_id']
+                pair = counts.get(event_token)
+                if pair is None:
+                    pair = counts[event_token] = [0, 0]
+                pair[0 if item.get('authorized') else 1] += 1
+            scanned += len(page)
+
+        closed_before = now_ms - STATS_CLOSE_GRACE_MS
+        for bucket_start in missing:
+            if cached and bucket_start + size <= closed_before:
+                _cache_put((token_id, granularity, bucket_start), fresh[bucket_start], now, version)
+
+    bucket_rows = []
+    tokens = {}
+    for bucket_start in range(first, stop, size):
+        authorized = denied = 0
+        for event_token, (token_authorized, token_denied) in buckets[bucket_start].items():
+            authorized += token_authorized
+            denied += token_denied
+            entry = tokens.get(event_token)
+            if entry is None:
+                entry = tokens[event_token] = {'token_id': event_token, 'authorized': 0, 'denied': 0, 'buckets': []}
+            entry['authorized'] += token_authorized
+            entry['denied'] += token_denied
+            entry['buckets'].append({'start': bucket_start, 'authorized': token_authorized, 'denied': token_denied})
+        bucket_rows.append({'start': bucket_start, 'authorized': authorized, 'denied': denied})
+
+    return {
+        'granularity': granularity,
+        'from': first,
+        'to': stop - 1,
+        'authorized': sum(row['authorized'] for row in bucket_rows),
+        'denied': sum(row['denied'] for row in bucket_rows),
+        'buckets': bucket_rows,
+        'tokens': sorted(tokens.values(), key=lambda entry: entry['authorized'] + entry['denied'], reverse=True),
+        'computed_buckets': len(missing),
+        'cached_buckets': len(bucket_rows) - len(missing),
+        'scanned_events': scanned,
+    }
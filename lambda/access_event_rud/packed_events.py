@@ -0,0 +1,206 @@
+from boto3.dynamodb.conditions import Key #type: ignore
+from botocore.exceptions import ClientError #type: ignore
+from event_buckets import TIME_BUCKET_INDEX, DAY_MS, day_start, day_buckets
+from event_packing import append_events, bucket_start, pack_event, sort_key_range, split_sort_key, unpack_events, unpack_timestamp
+
+# Read/write helpers for the packed bucket table (EVENT_STORAGE_MODE=bucket).
+# Everything returned here is decoded into the per-event record shape, so the
+# GET /events responses look the same in both storage modes. `bucket` is a
+# DynamoDB reserved word, so projections name it through a placeholder.
+
+_NAMES = {'#b': 'bucket', '#events': 'events'}
+
+
+def _bucket_range(start, end):
+    low, high = sort_key_range(start, end)
+    return Key('bucket').between(low, high)
+
+
+def _merge_hour(items):
+    """
+    Decoded events of the bucket items of one hour. A re-delivered or edited
+    event can sit in several parts; the value in the highest part wins.
+    """
+    latest = {}
+    for item in items:
+        _, part = split_sort_key(item['bucket'])
+        for event in unpack_events(item['token_id'], item['bucket'], item.get('events', [])):
+            key = (event['token_id'], event['timestamp'])
+            if key not in latest or part >= latest[key][0]:
+                latest[key] = (part, event)
+    return [event for _, event in latest.values()]
+
+
+def decode_items(items):
+    """Decoded events of bucket items of any tokens and hours, in no particular order."""
+    hours = {}
+    for item in items:
+        hour, _ = split_sort_key(item['bucket'])
+        hours.setdefault(hour, []).append(item)
+    return [event for hour_items in hours.values() for event in _merge_hour(hour_items)]
+
+
+def _hours(bucket_table, args):
+    """Runs a paginated query and yields (hour, decoded events) per hour of consecutive items."""
+    hour, items = None, []
+    while True:
+        response = bucket_table.query(**args)
+        for item in response.get('Items', []):
+            item_hour, _ = split_sort_key(item['bucket'])
+            if item_hour != hour and items:
+                yield hour, _merge_hour(items)
+                items = []
+            hour = item_hour
+            items.append(item)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        args['ExclusiveStartKey'] = last_key
+    if items:
+        yield hour, _merge_hour(items)
+
+
+def _token_buckets(bucket_table, token_id, start, end, newest_first=False):
+    """Yields the decoded events of one token one hour bucket at a time, oldest first unless `newest_first`."""
+    args = {
+        'KeyConditionExpression': Key('token_id').eq(token_id) & _bucket_range(start, end),
+        'ProjectionExpression': 'token_id, #b, #events',
+        'ExpressionAttributeNames': _NAMES,
+        'ScanIndexForward': not newest_first,
+    }
+    for _, events in _hours(bucket_table, args):
+        yield sorted(events, key=lambda event: event['timestamp'], reverse=newest_first)
+
+
+def get_event(bucket_table, token_id, timestamp):
+    for events in _token_buckets(bucket_table, token_id, timestamp, timestamp):
+        for event in events:
+            if event['timestamp'] == timestamp:
+                return event
+    return None
+
+
+def query_token_events(bucket_table, token_id, start, end, limit, cursor):
+    """
+    Events of one token in [start, end], newest first, after the cursor event.
+    Returns (events, cursor of the last event when the page is full).
+    """
+    lower = start if start is not None else 0
+    upper = end if end is not None else 2 ** 53
+    if cursor:
+        upper = min(upper, cursor['timestamp'] - 1)
+    if lower > upper:
+        return [], None
+
+    events = []
+    for bucket_events in _token_buckets(bucket_table, token_id, lower, upper, newest_first=True):
+        for event in bucket_events:
+            if lower <= event['timestamp'] <= upper:
+                events.append(event)
+                if len(events) == limit:
+                    return events, {'token_id': token_id, 'timestamp': event['timestamp']}
+    return events, None
+
+
+def query_shard(bucket_table, time_bucket, lower, upper, cursor, needed, before_cursor):
+    """
+    Newest events of one time_bucket_index shard in [lower, upper] that sort
+    after the cursor. Reads whole hours until at least `needed` events are found.
+    """
+    args = {
+        'IndexName': TIME_BUCKET_INDEX,
+        'KeyConditionExpression': Key('time_bucket').eq(time_bucket) & _bucket_range(lower, upper),
+        'ScanIndexForward': False,
+    }
+    events = []
+    for _, hour_events in _hours(bucket_table, args):
+        events.extend(
+            event for event in hour_events
+            if lower <= event['timestamp'] <= upper and (cursor is None or before_cursor(event, cursor))
+        )
+        if len(events) >= needed:
+            break
+    return events
+
+
+def event_pages(bucket_table, token_id, start, end):
+    """
+    Pages of decoded events with timestamp in [start, end), for the statistics.
+    Without a token, the time_bucket_index is read day by day instead of scanning.
+    """
+    last = end - 1
+    if token_id:
+        for events in _token_buckets(bucket_table, token_id, start, last):
+            yield [event for event in events if start <= event['timestamp'] <= last]
+        return
+
+    day = day_start(start)
+    while day <= last:
+        for shard in day_buckets(day):
+            args = {
+                'IndexName': TIME_BUCKET_INDEX,
+                'KeyConditionExpression': Key('time_bucket').eq(shard) & _bucket_range(max(start, day), min(last, day + DAY_MS - 1)),
+            }
+            for _, events in _hours(bucket_table, args):
+                yield [event for event in events if start <= event['timestamp'] <= last]
+        day += DAY_MS
+
+
+def put_event(client, table_name, token_id, timestamp, authorized):
+    """
+    Appends one event (or a corrected value for an existing timestamp) to its
+    bucket. Needs a low-level client: the resource's client expects Python values.
+    """
+    append_events(client, table_name, token_id, bucket_start(timestamp), [pack_event(timestamp, authorized)])
+
+
+def trim_bucket(client, table_name, token_id, sort_key, start, end, attempts=5):
+    """
+    Removes the events in [start, end] from one bucket item that only partly
+    overlaps a purge range; returns the timestamps of the removed events. The
+    write is conditional on event_count, so an append that lands in between is
+    not lost: the item is simply read again. The trimmed item is sealed and
+    kept even when empty, so later appends and edits go to a higher part and
+    are not shadowed by older copies there.
+    """
+    key = {'token_id': {'S': token_id}, 'bucket': {'N': str(sort_key)}}
+    hour, _ = split_sort_key(sort_key)
+    for _ in range(attempts):
+        item = client.get_item(
+            TableName=table_name,
+            Key=key,
+            ConsistentRead=True,
+            ProjectionExpression='#events, event_count',
+            ExpressionAttributeNames={'#events': 'events'}
+        ).get('Item')
+        if not item:
+            return set()
+        values = item.get('events', {}).get('L', [])
+        kept, removed = [], set()
+        for value in values:
+            timestamp = unpack_timestamp(hour, value['N'])
+            if start <= timestamp <= end:
+                removed.add(timestamp)
+            else:
+                kept.append(value)
+        if not removed:
+            return removed
+        try:
+            client.update_item(
+                TableName=table_name,
+                Key=key,
+                UpdateExpression='SET #events = :kept, event_count = :count, sealed = :sealed',
+                ConditionExpression='event_count = :seen',
+                ExpressionAttributeNames={'#events': 'events'},
+                ExpressionAttributeValues={
+                    ':kept': {'L': kept},
+                    ':count': {'N': str(len(kept))},
+                    ':sealed': {'BOOL': True},
+                    ':seen': item['event_count'],
+                }
+            )
+            return removed
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    raise RuntimeError(f'Bucket {sort_key} of token {token_id} kept changing while it was trimmed')
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+import lazy
+from instrumentation import stage
+
+# =================================================================================
+# GLOBAL SETUP
+# =================================================================================
+# Shared by the Postgres-backed Lambdas (deployed as the common layer). One warm
+# connection is kept per container and reused across invocations instead of
+# paying a TCP + TLS + auth handshake on every request.
+
+logger = logging.getLogger()
+
+# Loaded on first use, so CORS preflights never pay for it
+psycopg2 = lazy.lazy_import('psycopg2')
+db_secret_arn = os.environ.get('DB_SECRET_ARN')
+db_creds = None
+
+# Optional RDS Proxy / pgbouncer endpoint; falls back to DB_PROXY_HOST in the
+# secret, then to DB_HOST
+DB_PROXY_HOST = os.environ.get('DB_PROXY_HOST')
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+# A connection idle for longer than this is pinged before it is reused
+DB_HEALTHCHECK_IDLE_SECONDS = float(os.environ.get('DB_HEALTHCHECK_IDLE_SECONDS', '30'))
+# Connections are recycled after this age so credential rotation and failovers are picked up
+DB_MAX_CONNECTION_AGE = float(os.environ.get('DB_MAX_CONNECTION_AGE', '3600'))
+
+# Read-only sessions go to the Aurora reader endpoint (DB_READER_HOST, from the
+# environment or the secret) unless it is unreachable or lagging. Without a
+# reader host every session uses the writer.
+DB_READER_HOST = os.environ.get('DB_READER_HOST')
+DB_READER_CONNECT_TIMEOUT = int(os.environ.get('DB_READER_CONNECT_TIMEOUT', '2'))
+# Replica lag above which reads go to the writer, and how often it is measured
+DB_READER_MAX_LAG_SECONDS = float(os.environ.get('DB_READER_MAX_LAG_SECONDS', '5'))
+DB_READER_LAG_CHECK_SECONDS = float(os.environ.get('DB_READER_LAG_CHECK_SECONDS', '5'))
+# After a failed reader connect, reads stay on the writer this long before retrying
+DB_READER_RETRY_SECONDS = float(os.environ.get('DB_READER_RETRY_SECONDS', '30'))
+# Reads this soon after a write from the same container go to the writer
+DB_READ_AFTER_WRITE_SECONDS = float(os.environ.get('DB_READ_AFTER_WRITE_SECONDS', '5'))
+
+WRITER = 'writer'
+READER = 'reader'
+
+# role -> {'conn', 'connected_at', 'last_used'}; one warm connection per role
+_connections = {}
+_reader_down_until = 0.0
+_reader_lag = {'checked_at': None, 'seconds': None}
+_last_write = None
+_lag_sql = None
+
+# Aurora reports the lag of every instance; a streaming replica compares its
+# receive/replay position and the last replayed commit. The first query that
+# works on the server is remembered.
+_LAG_QUERIES = (
+    "SELECT replica_lag_in_msec / 1000.0 FROM aurora_replica_status() "
+    "WHERE server_id = aurora_db_instance_identifier();",
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END;",
+)
+
+# =================================================================================
+# HELPERS
+# =================================================================================
+
+def get_db_credentials():
+    """Fetches DB credentials from Secrets Manager, caching them globally."""
+    global db_creds
+    if db_creds:
+        return db_creds
+    if not db_secret_arn:
+        raise ValueError("DB_SECRET_ARN environment variable is not set.")
+    try:
+        logger.info("Fetching database credentials from Secrets Manager.")
+        with stage('credentials'):
+            secret_response = lazy.client('secretsmanager').get_secret_value(SecretId=db_secret_arn)
+        db_creds = json.loads(secret_response['SecretString'])
+        return db_creds
+    except Exception as e:
+        logger.error(f"Failed to retrieve database credentials: {e}")
+        raise
+
+def _reader_host(creds):
+    return DB_READER_HOST or creds.get('DB_READER_HOST')
+
+def _connect(role=WRITER):
+    creds = get_db_credentials()
+    if role == READER:
+        host = _reader_host(creds)
+        port = creds.get('DB_READER_PORT') or creds['DB_PORT']
+        timeout = DB_READER_CONNECT_TIMEOUT
+    else:
+        host = DB_PROXY_HOST or creds.get('DB_PROXY_HOST') or creds['DB_HOST']
+        port = creds['DB_PORT']
+        timeout = DB_CONNECT_TIMEOUT
+    logger.info(f"Opening {role} database connection to {host}.")
+    with stage('connect'):
+        return psycopg2.connect(
+            host=host,
+            port=port,
+            dbname=creds['DB_NAME'],
+            user=creds['DB_USER'],
+            password=creds['DB_PASSWORD'],
+            connect_timeout=timeout,
+            application_name=os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'access-control'),
+            # Detect connections dropped while the container was frozen
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3
+        )
+
+def _is_healthy(entry, now):
+    conn = entry['conn']
+    if conn.closed:
+        return False
+    if now - entry['connected_at'] > DB_MAX_CONNECTION_AGE:
+        return False
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if now - entry['last_used'] < DB_HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        logger.warning(f"Discarding unhealthy database connection: {e}")
+        return False
+
+def close_db_connection(role=None):
+    """Closes the cached connection(s); the next request opens a fresh one."""
+    for name in ([role] if role else list(_connections)):
+        entry = _connections.pop(name, None)
+        if entry is None:
+            continue
+        try:
+            entry['conn'].close()
+        except psycopg2.Error:
+            pass
+
+def get_db_connection(role=WRITER):
+    """Returns the warm connection of a role for this container, reconnecting if it is unhealthy."""
+    now = time.monotonic()
+    entry = _connections.get(role)
+    if entry is not None and not _is_healthy(entry, now):
+        close_db_connection(role)
+        entry = None
+    if entry is None:
+        entry = _connections[role] = {'conn': _connect(role), 'connected_at': now, 'last_used': now}
+    return entry['conn']
+
+def _replica_lag_seconds(conn):
+    """Replication lag of the reader in seconds, or None when it cannot be measured."""
+    global _lag_sql
+    for sql in ([_lag_sql] if _lag_sql else _LAG_QUERIES):
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                row = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error:
+            conn.rollback()
+            continue
+        _lag_sql = sql
+        return float(row[0]) if row and row[0] is not None else 0.0
+    return None
+
+def _mark_reader_down(error):
+    global _reader_down_until
+    logger.warning(f"Reader unavailable, using the writer for {DB_READER_RETRY_SECONDS:.0f}s: {error}")
+    _reader_down_until = time.monotonic() + DB_READER_RETRY_SECONDS
+
+def _reader_connection(now):
+    """The reader connection if it is reachable and close enough to the writer, else None."""
+    if now < _reader_down_until or not _reader_host(get_db_credentials()):
+        return None
+    try:
+        conn = get_db_connection(READER)
+    except psycopg2.Error as e:
+        _mark_reader_down(e)
+        return None
+
+    checked_at = _reader_lag['checked_at']
+    if checked_at is None or now - checked_at >= DB_READER_LAG_CHECK_SECONDS:
+        _reader_lag['seconds'] = _replica_lag_seconds(conn)
+        _reader_lag['checked_at'] = now
+    lag = _reader_lag['seconds']
+    if lag is None or lag > DB_READER_MAX_LAG_SECONDS:
+        logger.warning(f"Reader lag {lag} s is above {DB_READER_MAX_LAG_SECONDS} s; reading from the writer.")
+        return None
+    return conn
+
+def route_for(readonly=False, consistent=False):
+    """
+    Role that serves a session: the reader for read-only sessions, unless the
+    caller needs its own writes (consistent, or a write from this container
+    moments ago) or the reader is unavailable or lagging.
+    """
+    if not readonly or consistent:
+        return WRITER
+    now = time.monotonic()
+    if _last_write is not None and now - _last_write < DB_READ_AFTER_WRITE_SECONDS:
+        return WRITER
+    return READER if _reader_connection(now) is not None else WRITER
+
+def wants_consistent_read(event):
+    """True when a request asks to see the latest writes (X-Consistent-Read header or ?consistent=true)."""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    query_params = event.get('queryStringParameters') or {}
+    value = headers.get('x-consistent-read') or query_params.get('consistent') or ''
+    return value.lower() in ('1', 'true', 'yes')
+
+@contextmanager
+def db_session(readonly=False, consistent=False):
+    """
+    Yields a warm connection for one request: the writer, or the reader for
+    read-only sessions (see route_for). Handlers commit explicitly; anything
+    left uncommitted (early returns, errors) is rolled back so the next
+    invocation starts from a clean connection. Broken connections are dropped.
+    """
+    global _last_write
+    role = route_for(readonly, consistent)
+    conn = get_db_connection(role)
+    try:
+        with stage('query'):
+            yield conn
+    except Exception as e:
+        if role == READER and isinstance(e, psycopg2.OperationalError):
+            # Lost the reader mid-request; later reads use the writer for a while
+            _mark_reader_down(e)
+        _rollback(conn, role)
+        raise
+    else:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _rollback(conn, role)
+    finally:
+        now = time.monotonic()
+        if role in _connections:
+            _connections[role]['last_used'] = now
+        if not readonly:
+            _last_write = now
+
+def _rollback(conn, role):
+    try:
+        conn.rollback()
+    except psycopg2.Error as e:
+        logger.warning(f"Rollback failed, discarding connection: {e}")
+        close_db_connection(role)
+        return
+    if conn.closed:
+        close_db_connection(role)
+
+def table_versions(cur, *tables):
+    """
+    Change counters of the given tables, bumped by statement triggers on every
+    write (table_versions in db/schema.sql). The listings derive their ETags from them.
+    """
+    cur.execute("SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s);", (list(tables),))
+    versions = dict(cur.fetchall())
+    return [versions.get(table, 0) for table in tables]
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+# =================================================================================
+# CONDITIONAL GET
+# =================================================================================
+# Listings are tagged with a cheap version of the data they read (a change
+# counter or a state marker) plus the request parameters. When the client sends
+# the tag back in If-None-Match and it still matches, the handler answers 304
+# before running the listing query or serializing anything.
+
+# Browsers revalidate on every use instead of serving the cached copy blindly
+CACHE_HEADERS = {'Cache-Control': 'private, no-cache'}
+
+
+def make_etag(version, *params):
+    """
+    ETag over a data version and the parameters that shape the response. Weak,
+    because the same listing may go out gzip, br or uncompressed.
+    """
+    raw = json.dumps([version, params], sort_keys=True, separators=(',', ':'), default=str)
+    return 'W/"' + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+def if_none_match(event):
+    """Entity tags listed in the request's If-None-Match header, W/ prefixes dropped (weak comparison)."""
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return frozenset(tag.strip().removeprefix('W/') for tag in (headers.get('if-none-match') or '').split(',') if tag.strip())
+
+
+def etag_matches(tags, etag):
+    return etag.removeprefix('W/') in tags or '*' in tags
+
+
+def etag_headers(etag):
+    return {'ETag': etag, **CACHE_HEADERS}
+
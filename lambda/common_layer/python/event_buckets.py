@@ -0,0 +1,48 @@
+import os
+import zlib
+from datetime import datetime, timezone
+
+# =================================================================================
+# TIME BUCKETS FOR THE ACCESS EVENTS TABLE
+# =================================================================================
+# Every event carries `time_bucket` = "<UTC day>#<shard>", the partition key of
+# the time_bucket_index GSI (sort key: timestamp). Reading the newest events
+# across all tokens is then a few descending queries on the latest days instead
+# of a table scan. Each day is split over EVENT_BUCKET_SHARDS partitions
+# (picked from the token id) so one day's writes do not land on a single hot
+# partition. Readers query every shard of a day, so the shard count may be
+# raised later but must never be lowered.
+
+TIME_BUCKET_INDEX = 'time_bucket_index'
+EVENT_BUCKET_SHARDS = int(os.environ.get('EVENT_BUCKET_SHARDS', '4'))
+# Event timestamps are epoch milliseconds
+DAY_MS = 24 * 3600 * 1000
+
+
+def day_start(timestamp_ms):
+    """Start of the UTC day holding `timestamp_ms`."""
+    return timestamp_ms - timestamp_ms % DAY_MS
+
+
+def _day_label(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime('%Y%m%d')
+
+
+def token_shard(token_id, shards=EVENT_BUCKET_SHARDS):
+    """Write shard of a token within a day."""
+    return zlib.crc32(str(token_id).encode('utf-8')) % shards
+
+
+def time_bucket(token_id, timestamp_ms):
+    """GSI partition key for an event, or None when the timestamp is out of datetime range."""
+    try:
+        day = _day_label(timestamp_ms)
+    except (OverflowError, OSError, ValueError):
+        return None
+    return f'{day}#{token_shard(token_id)}'
+
+
+def day_buckets(timestamp_ms):
+    """Every shard key of the UTC day holding `timestamp_ms`."""
+    day = _day_label(timestamp_ms)
+    return [f'{day}#{shard}' for shard in range(EVENT_BUCKET_SHARDS)]
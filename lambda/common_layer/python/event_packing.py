@@ -0,0 +1,158 @@
+import os
+from botocore.exceptions import ClientError  # type: ignore
+from event_buckets import time_bucket
+
+# =================================================================================
+# PACKED EVENT BUCKETS (EVENT_STORAGE_MODE=bucket)
+# =================================================================================
+# Optional compact layout for the access events: instead of one item per event,
+# the events of one token in one hour share an item in the bucket table:
+#
+#   token_id (hash) | bucket (range) = hour start (epoch ms) + part
+#   events          = [packed, ...]   packed = offset_ms << 3 | flags
+#   event_count, time_bucket ("<UTC day>#<shard>", same GSI scheme as events)
+#
+# New events are appended server-side with list_append. When an item holds
+# PACKED_BUCKET_MAX_EVENTS events the writer rolls over to the next part, which
+# keeps items far below the 400 KB limit and bounds the write units of each
+# append (an UpdateItem is billed on the larger of the old and new item size).
+# An edited event is appended again; readers keep the last value per timestamp,
+# which matches the overwrite semantics of the per-event layout. Across the
+# parts of an hour the highest part wins, so appends only ever go to the
+# highest part: a part that a purge trimmed is sealed, and the writer rolls
+# past it instead of refilling the room the purge made. An append
+# also removes expires_at: an event that arrives after its hour was archived
+# must not be deleted by TTL together with the archived values. list_append
+# cannot be made conditional per event, so the event handler checks redelivered
+# SQS records against stored_timestamps() before appending them. With that
+# check turned off (INGEST_CONDITIONAL_WRITES=never) ingest is at-least-once:
+# a repeated event costs space and counts in event_count, never a second record.
+
+EVENT_STORAGE_MODE = os.environ.get('EVENT_STORAGE_MODE', 'item')
+PACKED_BUCKET_MS = 3600 * 1000
+PACKED_BUCKET_MAX_EVENTS = int(os.environ.get('PACKED_BUCKET_MAX_EVENTS', '2000'))
+# Parts live in the low digits of the sort key, below the next hour
+MAX_BUCKET_PARTS = 1000
+
+_AUTHORIZED = 1
+_VALID_KNOWN = 2
+_VALID = 4
+
+# (table, token_id, hour start) -> part currently being filled, per container
+_open_parts = {}
+
+
+def packing_enabled():
+    return EVENT_STORAGE_MODE == 'bucket'
+
+
+def bucket_start(timestamp_ms):
+    return timestamp_ms - timestamp_ms % PACKED_BUCKET_MS
+
+
+def split_sort_key(sort_key):
+    """(hour start, part) of a bucket item's sort key."""
+    sort_key = int(sort_key)
+    return bucket_start(sort_key), sort_key % PACKED_BUCKET_MS
+
+
+def sort_key_range(start_ms, end_ms):
+    """Inclusive sort key range of every bucket item holding events in [start_ms, end_ms]."""
+    return bucket_start(start_ms), bucket_start(end_ms) + MAX_BUCKET_PARTS - 1
+
+
+def pack_event(timestamp_ms, authorized, token_valid=None):
+    flags = _AUTHORIZED if authorized else 0
+    if token_valid is not None:
+        flags |= _VALID_KNOWN | (_VALID if token_valid else 0)
+    return (timestamp_ms - bucket_start(timestamp_ms)) << 3 | flags
+
+
+def unpack_timestamp(hour_start, value):
+    return hour_start + (int(value) >> 3)
+
+
+def unpack_events(token_id, sort_key, values):
+    """
+    Decodes one bucket item's packed values into event records (the same shape
+    as the per-event layout), oldest first, keeping the last value per timestamp.
+    """
+    start, _ = split_sort_key(sort_key)
+    events = {}
+    for value in values:
+        value = int(value)
+        timestamp = unpack_timestamp(start, value)
+        event = {'token_id': token_id, 'timestamp': timestamp, 'authorized': bool(value & _AUTHORIZED)}
+        if value & _VALID_KNOWN:
+            event['token_valid'] = bool(value & _VALID)
+        events[timestamp] = event
+    return [events[timestamp] for timestamp in sorted(events)]
+
+
+def stored_timestamps(client, table_name, token_id, hour_start):
+    """Timestamps already stored in any part of the token's bucket for `hour_start` (strongly consistent)."""
+    low, high = sort_key_range(hour_start, hour_start)
+    args = {
+        'TableName': table_name,
+        'KeyConditionExpression': 'token_id = :token AND #b BETWEEN :low AND :high',
+        'ProjectionExpression': '#events',
+        'ExpressionAttributeNames': {'#b': 'bucket', '#events': 'events'},
+        'ExpressionAttributeValues': {':token': {'S': token_id}, ':low': {'N': str(low)}, ':high': {'N': str(high)}},
+        'ConsistentRead': True,
+    }
+    timestamps = set()
+    while True:
+        response = client.query(**args)
+        for item in response.get('Items', []):
+            timestamps.update(unpack_timestamp(hour_start, value['N']) for value in item.get('events', {}).get('L', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return timestamps
+        args['ExclusiveStartKey'] = last_key
+
+
+def append_events(client, table_name, token_id, hour_start, values):
+    """
+    Appends packed values to the token's bucket for `hour_start` with a
+    low-level client, rolling over to the next part whenever the open one is
+    full or sealed. Raises when every part of the hour is full.
+    """
+    cache_key = (table_name, token_id, hour_start)
+    part = _open_parts.get(cache_key, 0)
+    update = ('SET #events = list_append(if_not_exists(#events, :empty), :new), '
+              'event_count = if_not_exists(event_count, :zero) + :count')
+    values_by_name = {':empty': {'L': []}, ':zero': {'N': '0'}}
+    bucket = time_bucket(token_id, hour_start)
+    if bucket:
+        update += ', time_bucket = :time_bucket'
+        values_by_name[':time_bucket'] = {'S': bucket}
+    update += ' REMOVE expires_at'
+
+    for start in range(0, len(values), PACKED_BUCKET_MAX_EVENTS):
+        chunk = values[start:start + PACKED_BUCKET_MAX_EVENTS]
+        while True:
+            if part >= MAX_BUCKET_PARTS:
+                raise RuntimeError(f'Every part of bucket {hour_start} for token {token_id} is full')
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key={'token_id': {'S': token_id}, 'bucket': {'N': str(hour_start + part)}},
+                    UpdateExpression=update,
+                    ConditionExpression='(attribute_not_exists(event_count) OR event_count <= :room) '
+                                        'AND attribute_not_exists(sealed)',
+                    ExpressionAttributeNames={'#events': 'events'},
+                    ExpressionAttributeValues={
+                        **values_by_name,
+                        ':new': {'L': [{'N': str(value)} for value in chunk]},
+                        ':count': {'N': str(len(chunk))},
+                        ':room': {'N': str(PACKED_BUCKET_MAX_EVENTS - len(chunk))},
+                    }
+                )
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                part += 1
+        if len(_open_parts) > 10000:
+            _open_parts.clear()
+        _open_parts[cache_key] = part
@@ -0,0 +1,30 @@
+# Change markers behind the ETags of GET /events, kept in the token state table.
+# A token's own state item already changes with every ingested event (last
+# timestamp and event_count); edits and purges bump its edit_version on top. The
+# cross-token listing reads one extra item under ALL_EVENTS_MARKER, whose
+# event_count the event handler raises once per batch. `#` never occurs in a
+# token id, so the marker cannot collide with a real token.
+
+ALL_EVENTS_MARKER = '#all'
+MARKER_ATTRIBUTES = ('last_timestamp', 'event_count', 'edit_version')
+
+
+def marker(item):
+    """Version of one state/marker item; None when it does not exist."""
+    if not item:
+        return None
+    return [str(item[name]) if name in item else None for name in MARKER_ATTRIBUTES]
+
+
+def bump(state_table, token_id=None):
+    """
+    Records an edit or deletion of stored events on the token's state item
+    (created if missing) and on the cross-token marker. Pass no token after a
+    full purge, which removes the token's state item instead.
+    """
+    for key in ([token_id] if token_id else []) + [ALL_EVENTS_MARKER]:
+        state_table.update_item(
+            Key={'token_id': key},
+            UpdateExpression='ADD edit_version :one',
+            ExpressionAttributeValues={':one': 1}
+        )
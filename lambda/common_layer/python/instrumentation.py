@@ -0,0 +1,140 @@
+import contextvars
+import functools
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+
+# =================================================================================
+# REQUEST INSTRUMENTATION
+# =================================================================================
+# lambda_handler is wrapped with @instrumented(); inside it the code that does
+# the work marks its stages with `with stage('query'):`. Each sampled
+# invocation is printed as one CloudWatch Embedded Metric Format (EMF) record:
+# the total time and the time per stage, with FunctionName, Route and Outcome
+# dimensions. CloudWatch turns these log lines into metrics without any
+# PutMetricData call. Invocations that are not sampled skip the timing
+# altogether.
+
+STAGES = ('parse', 'credentials', 'connect', 'query', 'serialize', 'write')
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AccessControl/Requests')
+# Fraction of invocations whose stage timings are emitted
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1'))
+# Fraction of invocations whose full event is logged; off unless asked for, as
+# events carry request bodies and headers
+DEBUG_EVENT_SAMPLE_RATE = float(os.environ.get('DEBUG_EVENT_SAMPLE_RATE', '0'))
+
+# Stage timings (ms) of the invocation being handled; None when it is not sampled
+_stages = contextvars.ContextVar('instrumentation_stages', default=None)
+
+
+def function_name(default='local'):
+    return os.environ.get('AWS_LAMBDA_FUNCTION_NAME', default)
+
+
+def emf_record(namespace, dimensions, metrics, properties=None):
+    """
+    EMF record for `metrics` ({name: (value, unit)}) under one dimension set
+    ({name: value}); `properties` are logged alongside without becoming metrics.
+    """
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()],
+            }]
+        },
+        **dimensions,
+        **(properties or {}),
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+
+
+def emit_metrics(namespace, dimensions, metrics, properties=None):
+    """Prints an EMF record to stdout, where the Lambda log agent picks it up."""
+    print(json.dumps(emf_record(namespace, dimensions, metrics, properties)))
+
+
+@contextmanager
+def stage(name):
+    """Adds the time spent in the block to `name` of the current sampled invocation."""
+    stages = _stages.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def parse_json(text):
+    """json.loads, timed as the `parse` stage."""
+    with stage('parse'):
+        return json.loads(text)
+
+
+def _route(event):
+    route = event.get('routeKey')
+    if route and route != '$default':
+        return route
+    method = ((event.get('requestContext') or {}).get('http') or {}).get('method')
+    return f"{method} {event.get('rawPath') or ''}".strip() if method else 'unknown'
+
+
+def _outcome(response):
+    if not isinstance(response, dict):
+        return 'ok'
+    if 'statusCode' in response:
+        return f"{int(response['statusCode']) // 100}xx"
+    if 'isAuthorized' in response:
+        return 'allowed' if response['isAuthorized'] else 'denied'
+    if 'batchItemFailures' in response:
+        return 'partial' if response['batchItemFailures'] else 'ok'
+    return 'ok'
+
+
+def _sampled(rate):
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def instrumented(route=None):
+    """
+    Decorates a lambda_handler. `route` names the entry point for non-HTTP
+    triggers; HTTP API events are named by their route key ("GET /events").
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if _sampled(DEBUG_EVENT_SAMPLE_RATE):
+                print(f"Event: {json.dumps(event, default=str)}")
+            if not _sampled(METRICS_SAMPLE_RATE):
+                return handler(event, context)
+
+            stages = {}
+            token = _stages.set(stages)
+            outcome = 'error'
+            start = time.perf_counter()
+            try:
+                response = handler(event, context)
+                outcome = _outcome(response)
+                return response
+            finally:
+                total = (time.perf_counter() - start) * 1000
+                _stages.reset(token)
+                metrics = {'TotalTime': (round(total, 3), 'Milliseconds')}
+                for name in STAGES:
+                    if name in stages:
+                        metrics[f'{name.capitalize()}Time'] = (round(stages[name], 3), 'Milliseconds')
+                emit_metrics(
+                    NAMESPACE,
+                    {'FunctionName': function_name(), 'Route': route or _route(event), 'Outcome': outcome},
+                    metrics,
+                    {'SampleRate': METRICS_SAMPLE_RATE},
+                )
+        return wrapper
+    return decorate
@@ -0,0 +1,73 @@
+import importlib.util
+import sys
+import threading
+
+# =================================================================================
+# LAZY DEPENDENCIES
+# =================================================================================
+# Importing boto3 and building a client (loading its service model) costs tens
+# to hundreds of milliseconds of every cold start. Handlers get their clients
+# from here instead of creating them at import time, so a container only pays
+# for the services its requests actually use, and requests that use none
+# (CORS preflights, rejected API keys) none at all. lazy_import() defers heavy
+# packages such as psycopg2 the same way.
+
+_clients = {}
+_clients_lock = threading.Lock()
+# boto3 resources are not thread-safe, so every thread keeps its own
+_thread_resources = threading.local()
+
+
+def lazy_import(name):
+    """
+    Returns module `name`, executing its code on first attribute access
+    (importlib.util.LazyLoader). An already imported module is returned as is.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def client(service):
+    """The container's low-level boto3 client for `service`, built on first use."""
+    existing = _clients.get(service)
+    if existing is not None:
+        return existing
+    with _clients_lock:
+        if service not in _clients:
+            import boto3  # type: ignore
+            _clients[service] = boto3.client(service)
+        return _clients[service]
+
+
+def set_client(service, value):
+    """Replaces the shared client for `service` (local runs and benchmarks)."""
+    with _clients_lock:
+        _clients[service] = value
+
+
+def dynamodb_resource():
+    """The calling thread's DynamoDB service resource, built on first use."""
+    resource = getattr(_thread_resources, 'dynamodb', None)
+    if resource is None:
+        import boto3  # type: ignore
+        resource = _thread_resources.dynamodb = boto3.resource('dynamodb')
+    return resource
+
+
+def table(name):
+    """The calling thread's boto3 Table resource for `name`."""
+    tables = getattr(_thread_resources, 'tables', None)
+    if tables is None:
+        tables = _thread_resources.tables = {}
+    if name not in tables:
+        tables[name] = dynamodb_resource().Table(name)
+    return tables[name]
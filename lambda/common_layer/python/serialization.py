@@ -0,0 +1,134 @@
+import base64
+import datetime
+import decimal
+import gzip
+import json
+import os
+import uuid
+from instrumentation import stage
+
+# Optional faster encoders: orjson serializes in C and natively knows UUIDs and
+# datetimes; brotli adds `br` to the content codings. Without them the standard
+# library's C encoder and gzip are used.
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+# =================================================================================
+# RESPONSE RENDERING
+# =================================================================================
+# Handlers build API Gateway proxy responses with plain Python bodies (DynamoDB
+# Decimals, UUIDs and datetimes included) and lambda_handler renders them once
+# with render(): a single encoder pass, NDJSON for listing pages when the client
+# asks for it, and gzip/br for large bodies the client accepts, sent base64
+# encoded with isBase64Encoded.
+
+# Bodies below this size go out uncompressed; compressing them saves less than it costs
+COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '8192'))
+GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '4'))
+
+JSON_TYPE = 'application/json'
+NDJSON_TYPE = 'application/x-ndjson'
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+
+def dumps(obj):
+    """Compact JSON as UTF-8 bytes; Decimals become ints or floats in the same pass."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def ndjson(items):
+    """One JSON document per line, newline terminated."""
+    return b''.join(dumps(item) + b'\n' for item in items)
+
+
+class Page(dict):
+    """A listing page ({items, next}); rendered as NDJSON when the client accepts it."""
+
+
+def page(items, next_cursor):
+    return Page(items=items, next=next_cursor)
+
+
+def _header(request, name):
+    for key, value in ((request or {}).get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _accepted_codings(request):
+    codings = set()
+    for part in (_header(request, 'accept-encoding') or '').split(','):
+        coding, _, params = part.partition(';')
+        q = params.strip().removeprefix('q=').strip()
+        if coding.strip() and q not in ('0', '0.0', '0.00', '0.000'):
+            codings.add(coding.strip().lower())
+    return codings
+
+
+def wants_ndjson(request):
+    return NDJSON_TYPE in (_header(request, 'accept') or '')
+
+
+def render(response, request=None):
+    """
+    Finishes a handler's response for API Gateway: serializes a Python body
+    (None: empty), and compresses it when it is large and the request's
+    Accept-Encoding allows br or gzip. String bodies are passed through as they are.
+    """
+    with stage('serialize'):
+        body = response.get('body')
+        headers = dict(response.get('headers') or {})
+        if isinstance(body, Page) and wants_ndjson(request):
+            payload = ndjson(body['items'])
+            headers['Content-Type'] = NDJSON_TYPE
+            if body.get('next'):
+                # No envelope to carry the cursor in
+                headers['X-Next-Cursor'] = body['next']
+        elif body is None:
+            payload = b''
+        elif isinstance(body, str):
+            payload = body.encode('utf-8')
+        else:
+            payload = dumps(body)
+
+        rendered = {**response, 'headers': headers}
+        if len(payload) >= COMPRESS_MIN_BYTES:
+            headers['Vary'] = 'Accept-Encoding'
+            codings = _accepted_codings(request)
+            if brotli is not None and 'br' in codings:
+                payload, coding = brotli.compress(payload, quality=BROTLI_QUALITY), 'br'
+            elif 'gzip' in codings:
+                payload, coding = gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+            else:
+                coding = None
+            if coding:
+                headers['Content-Encoding'] = coding
+                rendered['body'] = base64.b64encode(payload).decode('ascii')
+                rendered['isBase64Encoded'] = True
+                return rendered
+        rendered['body'] = payload.decode('utf-8')
+        return rendered
@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timezone
+from event_buckets import DAY_MS, day_start
+
+# =================================================================================
+# ROLLING ALLOW/DENY COUNTERS OF THE TOKEN STATE ITEMS
+# =================================================================================
+# The event handler adds every event to a pair of per-UTC-day attributes on the
+# token's state item (allowed_20240115 / denied_20240115); GET /events/state sums
+# the days of the last TOKEN_STATE_WINDOW_DAYS into allowed_count/denied_count.
+# Both stay single-item operations: one UpdateItem per token and batch, one
+# BatchGetItem for up to 100 tokens. Every update also removes the day pairs
+# of the window before the current one, so an active token's item does not
+# grow; events older than the window are not counted at all.
+
+TOKEN_STATE_WINDOW_DAYS = int(os.environ.get('TOKEN_STATE_WINDOW_DAYS', '7'))
+
+_PREFIXES = ('allowed_', 'denied_')
+
+
+def _label(day):
+    return datetime.fromtimestamp(day / 1000, tz=timezone.utc).strftime('%Y%m%d')
+
+
+def window_start(now_ms, days=TOKEN_STATE_WINDOW_DAYS):
+    """Start of the oldest UTC day that still counts."""
+    return day_start(now_ms) - (days - 1) * DAY_MS
+
+
+def day_attributes(timestamp_ms):
+    """(allowed, denied) attribute names of the UTC day holding `timestamp_ms`."""
+    label = _label(day_start(timestamp_ms))
+    return tuple(prefix + label for prefix in _PREFIXES)
+
+
+def expired_attributes(now_ms, days=TOKEN_STATE_WINDOW_DAYS):
+    """Attribute names of the `days` days just before the window, for REMOVE."""
+    first = window_start(now_ms, days)
+    return [name for offset in range(1, days + 1) for name in day_attributes(first - offset * DAY_MS)]
+
+
+def rolling_state(item, now_ms, days=TOKEN_STATE_WINDOW_DAYS):
+    """
+    A state item as GET /events/state returns it: the day pairs replaced by
+    allowed_count/denied_count over the window.
+    """
+    counted = {day_attributes(window_start(now_ms, days) + offset * DAY_MS) for offset in range(days)}
+    allowed = denied = 0
+    for allowed_name, denied_name in counted:
+        allowed += int(item.get(allowed_name, 0))
+        denied += int(item.get(denied_name, 0))
+    state = {name: value for name, value in item.items() if not name.startswith(_PREFIXES)}
+    state.update(allowed_count=allowed, denied_count=denied, window_days=days)
+    return state
@@ -1,37 +1,125 @@
-import boto3  # type: ignore
+import hmac
 import logging
+import os
+import threading
+import time
+import lazy
+from instrumentation import instrumented, stage
 
 # Setup logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize SSM client outside the handler for re-use
-ssm = boto3.client('ssm')
+# Every parameter listed here holds valid keys; a StringList parameter may hold
+# several comma-separated keys, so old and new keys can overlap during rotation.
+API_KEY_PARAMETER_NAMES = [
+    name.strip()
+    for name in os.environ.get(
+        'API_KEY_PARAMETER_NAMES',
+        os.environ.get('API_KEY_PARAMETER_NAME', 'dragan-api-key')
+    ).split(',')
+    if name.strip()
+]
+API_KEY_CACHE_TTL_SECONDS = float(os.environ.get('API_KEY_CACHE_TTL_SECONDS', '300'))
+# After a failed refresh the stale keys are kept and SSM is retried this much later
+API_KEY_REFRESH_RETRY_SECONDS = float(os.environ.get('API_KEY_REFRESH_RETRY_SECONDS', '10'))
 
+# Module-level key cache, shared by every invocation in this container
+_cached_keys = None
+_cached_at = 0.0
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+
+
+def _fetch_keys():
+    """Loads every valid API key from SSM in a single GetParameters call."""
+    with stage('credentials'):
+        response = lazy.client('ssm').get_parameters(
+            Names=API_KEY_PARAMETER_NAMES,
+            WithDecryption=True
+        )
+    if response.get('InvalidParameters'):
+        logger.warning("Unknown API key parameters: %s", response['InvalidParameters'])
+
+    keys = []
+    for parameter in response.get('Parameters', []):
+        keys.extend(key.strip() for key in parameter['Value'].split(',') if key.strip())
+    if not keys:
+        raise ValueError("No API keys found in SSM.")
+    return tuple(key.encode('utf-8') for key in keys)
+
+
+def _set_keys(keys):
+    global _cached_keys, _cached_at
+    _cached_keys, _cached_at = keys, time.monotonic()
+
+
+def _refresh_keys():
+    global _cached_at, _refresh_thread
+    try:
+        keys = _fetch_keys()
+        _set_keys(keys)
+        logger.info("Refreshed %d API key(s) from SSM.", len(keys))
+    except Exception as e:
+        # Keep serving the previous keys instead of hammering a throttled SSM
+        logger.error("Failed to retrieve token from SSM: %s", str(e))
+        _cached_at = time.monotonic() - API_KEY_CACHE_TTL_SECONDS + API_KEY_REFRESH_RETRY_SECONDS
+    finally:
+        with _refresh_lock:
+            _refresh_thread = None
+
+
+def get_valid_keys():
+    """
+    Returns the cached API keys. A cold container fetches them synchronously;
+    once the TTL expires the stale keys keep being served while a single
+    background thread refreshes them.
+    """
+    global _refresh_thread
+    if _cached_keys is None:
+        with _refresh_lock:
+            if _cached_keys is None:
+                try:
+                    _set_keys(_fetch_keys())
+                except Exception as e:
+                    logger.error("Failed to retrieve token from SSM: %s", str(e))
+                    return ()
+        return _cached_keys
+
+    if time.monotonic() - _cached_at >= API_KEY_CACHE_TTL_SECONDS:
+        with _refresh_lock:
+            if _refresh_thread is None:
+                _refresh_thread = threading.Thread(target=_refresh_keys, daemon=True)
+                _refresh_thread.start()
+    return _cached_keys
+
+
+def is_valid_key(token, valid_keys):
+    """Constant-time comparison against every valid key, without short-circuiting."""
+    candidate = token.encode('utf-8')
+    matched = False
+    for key in valid_keys:
+        matched |= hmac.compare_digest(candidate, key)
+    return matched
+
+
+@instrumented(route='authorize')
 def lambda_handler(event, context):
-    logger.info("Authorizer triggered. Event received.")
+    logger.debug("Authorizer triggered. Event received.")
 
     # Extract the token directly (no "Bearer " prefix expected)
-    token = event.get("headers", {}).get("authorization")
+    token = (event.get("headers") or {}).get("authorization")
     if not token:
         logger.warning("Missing Authorization header.")
         return {"isAuthorized": False}
 
-    try:
-        response = ssm.get_parameter(
-            Name='dragan-api-key',
-            WithDecryption=True
-        )
-        expected_token = response['Parameter']['Value']
-    except Exception as e:
-        logger.error("Failed to retrieve token from SSM: %s", str(e))
+    valid_keys = get_valid_keys()
+    if not valid_keys:
         return {"isAuthorized": False}
 
-    # Compare tokens directly
-    if token == expected_token:
-        logger.info("Authorization successful.")
+    if is_valid_key(token, valid_keys):
+        logger.debug("Authorization successful.")
         return {"isAuthorized": True}
     else:
         logger.warning("Authorization failed: Invalid token.")
-        return {"isAuthorized": False
-    }
+        return {"isAuthorized": False}
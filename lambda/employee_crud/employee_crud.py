@@ -1,10 +1,16 @@
 
+import base64
+import csv
+import io
 import json
 import logging
 import os
-import boto3 #type: ignore
-import psycopg2
-from psycopg2 import errors
+from datetime import datetime
+from db_connection import db_session, table_versions, wants_consistent_read
+from etags import etag_headers, etag_matches, if_none_match, make_etag
+from serialization import page, render
+from instrumentation import instrumented, parse_json
+import lazy
 
 # =================================================================================
 # GLOBAL SETUP
@@ -12,53 +18,35 @@ from psycopg2 import errors
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-secrets_manager = boto3.client('secretsmanager')
-db_secret_arn = os.environ.get('DB_SECRET_ARN')
-db_creds = None
+
+psycopg2 = lazy.lazy_import('psycopg2')
+
+# Page size for the employee listing
+DEFAULT_PAGE_LIMIT = int(os.environ.get('EMPLOYEES_DEFAULT_PAGE_LIMIT', '100'))
+MAX_PAGE_LIMIT = int(os.environ.get('EMPLOYEES_MAX_PAGE_LIMIT', '500'))
+
+# Upper bound on rows accepted by one bulk import request
+MAX_IMPORT_ROWS = int(os.environ.get('EMPLOYEES_MAX_IMPORT_ROWS', '100000'))
+EMPLOYEE_FIELDS = ('first_name', 'last_name', 'email')
 
 # =================================================================================
 # HELPER FUNCTIONS
 # =================================================================================
 
-def _response(status, body):
+def _response(status, body, headers=None):
+    """Unrendered response; lambda_handler serializes the body once via serialization.render."""
     return {
         'statusCode': status,
         'headers': {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "https://dragan.stilltesting.xyz",  # Or "*", but best to use your frontend origin
             "Access-Control-Allow-Headers": "Content-Type,Authorization",
-            "Access-Control-Allow-Methods": "OPTIONS,GET,POST,PUT,DELETE"
+            "Access-Control-Allow-Methods": "OPTIONS,GET,POST,PUT,DELETE",
+            **(headers or {})
         },
-        'body': json.dumps(body)
+        'body': body
     }
 
-def get_db_credentials():
-    """Fetches DB credentials from Secrets Manager, caching them globally."""
-    global db_creds
-    if db_creds:
-        return db_creds
-    if not db_secret_arn:
-        raise ValueError("DB_SECRET_ARN environment variable is not set.")
-    try:
-        logger.info("Fetching database credentials from Secrets Manager.")
-        secret_response = secrets_manager.get_secret_value(SecretId=db_secret_arn)
-        db_creds = json.loads(secret_response['SecretString'])
-        return db_creds
-    except Exception as e:
-        logger.error(f"Failed to retrieve database credentials: {e}")
-        raise
-
-def get_db_connection():
-    """Establishes a new database connection."""
-    creds = get_db_credentials()
-    return psycopg2.connect(
-        host=creds['DB_HOST'],
-        port=creds['DB_PORT'],
-        dbname=creds['DB_NAME'],
-        user=creds['DB_USER'],
-        password=creds['DB_PASSWORD']
-    )
-
 def format_employee_record(record):
     """Converts a database record tuple into a dictionary."""
     if not record:
@@ -72,69 +60,132 @@ def format_employee_record(record):
         'created_at': record[4].isoformat() # Format timestamp as string
     }
 
+def encode_cursor(created_at, employee_id):
+    """Opaque keyset cursor for the (created_at, id) position of the last row on a page."""
+    raw = json.dumps([created_at.isoformat(), str(employee_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, employee_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(employee_id)
+    except Exception:
+        raise ValueError('Invalid pagination cursor')
+
+def _parse_limit(value):
+    if value is None:
+        return DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_LIMIT)
+
+def _like_prefix(value):
+    """Lower-cased LIKE prefix pattern with wildcards in the input escaped."""
+    escaped = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
 # =================================================================================
 # CRUD HANDLERS
 # =================================================================================
 def handle_create_employee(event):
-    conn = None
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_json(event.get('body', '{}'))
         first_name, last_name, email = body.get('first_name'), body.get('last_name'), body.get('email')
 
         if not all([first_name, last_name, email]):
-            return {'statusCode': 400, 'body': json.dumps({'message': 'Missing required fields: first_name, last_name, email'})}
+            return _response(400, {'message': 'Missing required fields: first_name, last_name, email'})
 
-        conn = get_db_connection()
         sql = "INSERT INTO employees (first_name, last_name, email) VALUES (%s, %s, %s) RETURNING id;"
-        
-        with conn.cursor() as cur:
+
+        with db_session() as conn, conn.cursor() as cur:
             cur.execute(sql, (first_name, last_name, email))
             new_employee_id = cur.fetchone()[0]
             conn.commit()
-        
+
         logger.info(f"Successfully created employee with ID: {new_employee_id}")
-        return {'statusCode': 201, 'body': json.dumps({'employee_id': new_employee_id, 'message': 'Employee created successfully.'})}
+        return _response(201, {'employee_id': new_employee_id, 'message': 'Employee created successfully.'})
     except (psycopg2.errors.UniqueViolation):
         logger.error(f"Conflict: The email '{email}' already exists.")
-        return {'statusCode': 409, 'body': json.dumps({'message': f"An employee with the email '{email}' already exists."})}
-    finally:
-        if conn: conn.close()
+        return _response(409, {'message': f"An employee with the email '{email}' already exists."})
 
 def handle_read_employee(event):
-    conn = None
+    body = parse_json(event.get('body') or '{}')
+    query_params = event.get('queryStringParameters') or {}
+    employee_id = body.get('employee_id') or query_params.get('employee_id')
+    # Reads go to the Aurora reader unless the caller asks to see its own writes
+    consistent = wants_consistent_read(event)
+
+    if employee_id:
+        # Get ONE employee by ID from body
+        logger.info(f"Fetching employee with ID from body: {employee_id}")
+        sql = "SELECT id, first_name, last_name, email, created_at FROM employees WHERE id = %s;"
+        with db_session(readonly=True, consistent=consistent) as conn, conn.cursor() as cur:
+            cur.execute(sql, (employee_id,))
+            record = cur.fetchone()
+        if not record:
+            return _response(404, {'message': 'Employee not found.'})
+        return _response(200, format_employee_record(record))
+
+    return handle_list_employees(query_params, body, consistent, if_none_match(event))
+
+def handle_list_employees(query_params, body, consistent=False, cached_etags=frozenset()):
+    """
+    Lists employees newest first, one keyset page at a time. `search` is a
+    case-insensitive prefix match on first name, last name or email. Answers
+    304 without running the listing when an ETag in `cached_etags` still matches.
+    """
     try:
-        body = json.loads(event.get('body', '{}'))
-        employee_id = body.get('employee_id')
-        conn = get_db_connection()
-
-        with conn.cursor() as cur:
-            if employee_id:
-                # Get ONE employee by ID from body
-                logger.info(f"Fetching employee with ID from body: {employee_id}")
-                sql = "SELECT id, first_name, last_name, email, created_at FROM employees WHERE id = %s;"
-                cur.execute(sql, (employee_id,))
-                record = cur.fetchone()
-                if not record:
-                    return {'statusCode': 404, 'body': json.dumps({'message': 'Employee not found.'})}
-                return {'statusCode': 200, 'body': json.dumps(format_employee_record(record))}
-            else:
-                # Get ALL employees
-                logger.info("Fetching all employees.")
-                sql = "SELECT id, first_name, last_name, email, created_at FROM employees ORDER BY created_at DESC;"
-                cur.execute(sql)
-                records = cur.fetchall()
-                employees = [format_employee_record(rec) for rec in records]
-                return {'statusCode': 200, 'body': json.dumps(employees)}
-    finally:
-        if conn: conn.close()
+        limit = _parse_limit(query_params.get('limit') or body.get('limit'))
+        cursor = query_params.get('next') or body.get('next')
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return _response(400, {'message': str(e)})
+    search = (query_params.get('search') or body.get('search') or '').strip()
+
+    conditions, params = [], []
+    if search:
+        pattern = _like_prefix(search)
+        # Each branch is served by its lower(...) text_pattern_ops index
+        conditions.append("(lower(first_name) LIKE %s OR lower(last_name) LIKE %s OR lower(email) LIKE %s)")
+        params.extend([pattern, pattern, pattern])
+    if position:
+        conditions.append("(created_at, id) < (%s, %s::uuid)")
+        params.extend(position)
+
+    sql = "SELECT id, first_name, last_name, email, created_at FROM employees"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # One extra row tells whether another page follows
+    sql += " ORDER BY created_at DESC, id DESC LIMIT %s;"
+    params.append(limit + 1)
+
+    logger.info(f"Listing employees (limit={limit}, search={search!r}, cursor={'yes' if position else 'no'}).")
+    with db_session(readonly=True, consistent=consistent) as conn, conn.cursor() as cur:
+        # Counter first: a write landing before the listing only costs the next request a 200
+        etag = make_etag(table_versions(cur, 'employees'), limit, search, cursor)
+        if etag_matches(cached_etags, etag):
+            return _response(304, None, etag_headers(etag))
+        cur.execute(sql, params)
+        records = cur.fetchall()
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1][4], records[-1][0])
+
+    return _response(200, page([format_employee_record(rec) for rec in records], next_cursor), etag_headers(etag))
 
 def handle_update_employee(event):
-    conn = None
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_json(event.get('body', '{}'))
         employee_id = body.get('employee_id')
         if not employee_id:
-            return {'statusCode': 400, 'body': json.dumps({'message': 'employee_id is missing from request body.'})}
+            return _response(400, {'message': 'employee_id is missing from request body.'})
         
         update_fields, update_values = [], []
         for key, value in body.items():
@@ -143,51 +194,175 @@ def handle_update_employee(event):
                 update_values.append(value)
         
         if not update_fields:
-            return {'statusCode': 400, 'body': json.dumps({'message': 'No valid fields to update provided.'})}
+            return _response(400, {'message': 'No valid fields to update provided.'})
 
         update_values.append(employee_id)
         sql = f"UPDATE employees SET {', '.join(update_fields)} WHERE id = %s;"
 
-        conn = get_db_connection()
-        with conn.cursor() as cur:
+        with db_session() as conn, conn.cursor() as cur:
             cur.execute(sql, tuple(update_values))
             if cur.rowcount == 0:
-                return {'statusCode': 404, 'body': json.dumps({'message': 'Employee not found.'})}
+                return _response(404, {'message': 'Employee not found.'})
             conn.commit()
         
         logger.info(f"Successfully updated employee with ID: {employee_id}")
-        return {'statusCode': 200, 'body': json.dumps({'message': 'Employee updated successfully.'})}
+        return _response(200, {'message': 'Employee updated successfully.'})
     except (psycopg2.errors.UniqueViolation):
-        return {'statusCode': 409, 'body': json.dumps({'message': 'The provided email already exists for another employee.'})}
-    finally:
-        if conn: conn.close()
+        return _response(409, {'message': 'The provided email already exists for another employee.'})
 
 def handle_delete_employee(event):
-    conn = None
+    body = parse_json(event.get('body', '{}'))
+    employee_id = body.get('employee_id')
+    if not employee_id:
+        return _response(400, {'message': 'employee_id is missing from request body.'})
+
+    sql = "DELETE FROM employees WHERE id = %s;"
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute(sql, (employee_id,))
+        if cur.rowcount == 0:
+            return _response(404, {'message': 'Employee not found.'})
+        conn.commit()
+
+    logger.info(f"Successfully deleted employee with ID: {employee_id}")
+    return _response(204, None)
+
+# =================================================================================
+# BULK IMPORT
+# =================================================================================
+
+def _load_import_source(body):
+    """
+    Returns the import rows as a list of dicts. Accepts an inline JSON array
+    ("employees"), inline CSV text ("csv") or an S3 object reference
+    ("s3": {"bucket": ..., "key": ...}) holding either format.
+    """
+    if isinstance(body.get('employees'), list):
+        return body['employees']
+    if isinstance(body.get('csv'), str):
+        return list(csv.DictReader(io.StringIO(body['csv'])))
+
+    reference = body.get('s3')
+    if isinstance(reference, dict) and reference.get('bucket') and reference.get('key'):
+        logger.info(f"Loading employee import from s3://{reference['bucket']}/{reference['key']}")
+        obj = lazy.client('s3').get_object(Bucket=reference['bucket'], Key=reference['key'])
+        content = obj['Body'].read().decode('utf-8-sig')
+        if reference['key'].lower().endswith('.json'):
+            rows = parse_json(content)
+            if not isinstance(rows, list):
+                raise ValueError('S3 JSON import must contain an array of employees')
+            return rows
+        return list(csv.DictReader(io.StringIO(content)))
+
+    raise ValueError('Provide employees (JSON array), csv (text) or s3 ({bucket, key})')
+
+def _validate_import_rows(rows):
+    """Splits rows into valid (row_no, first_name, last_name, email) tuples, errors and in-file duplicates."""
+    valid, row_errors, conflicts = [], [], []
+    seen_emails = {}
+    for row_no, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            row_errors.append({'row': row_no, 'message': 'Row must be an object with first_name, last_name, email'})
+            continue
+        values = [str(row.get(field) or '').strip() for field in EMPLOYEE_FIELDS]
+        missing = [field for field, value in zip(EMPLOYEE_FIELDS, values) if not value]
+        if missing:
+            row_errors.append({'row': row_no, 'message': f"Missing required fields: {', '.join(missing)}"})
+            continue
+        first_name, last_name, email = values
+        if '@' not in email:
+            row_errors.append({'row': row_no, 'email': email, 'message': 'Invalid email address'})
+            continue
+        if email in seen_emails:
+            conflicts.append({'row': row_no, 'email': email, 'message': f'Duplicate of row {seen_emails[email]} in this import'})
+            continue
+        seen_emails[email] = row_no
+        valid.append((row_no, first_name, last_name, email))
+    return valid, row_errors, conflicts
+
+def handle_import_employees(event):
+    """
+    Bulk import: COPY the rows into a temporary staging table, then merge them
+    into employees with one INSERT ... ON CONFLICT (email). Rows that fail
+    validation or hit an existing email are reported individually instead of
+    failing the whole batch. on_conflict "update" overwrites the names of
+    existing employees instead of skipping them.
+    """
     try:
-        body = json.loads(event.get('body', '{}'))
-        employee_id = body.get('employee_id')
-        if not employee_id:
-            return {'statusCode': 400, 'body': json.dumps({'message': 'employee_id is missing from request body.'})}
+        body = parse_json(event.get('body') or '{}')
+        rows = _load_import_source(body)
+    except (ValueError, csv.Error) as e:
+        return _response(400, {'message': f'Invalid import payload: {e}'})
 
-        conn = get_db_connection()
-        sql = "DELETE FROM employees WHERE id = %s;"
-        with conn.cursor() as cur:
-            cur.execute(sql, (employee_id,))
-            if cur.rowcount == 0:
-                return {'statusCode': 404, 'body': json.dumps({'message': 'Employee not found.'})}
-            conn.commit()
+    on_conflict = body.get('on_conflict', 'skip')
+    if on_conflict not in ('skip', 'update'):
+        return _response(400, {'message': "on_conflict must be 'skip' or 'update'"})
+    if len(rows) > MAX_IMPORT_ROWS:
+        return _response(413, {'message': f'Import is limited to {MAX_IMPORT_ROWS} rows per request'})
+
+    valid, row_errors, conflicts = _validate_import_rows(rows)
 
-        logger.info(f"Successfully deleted employee with ID: {employee_id}")
-        return {'statusCode': 204, 'body': ''}
-    finally:
-        if conn: conn.close()
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(valid)
+    buffer.seek(0)
+
+    if on_conflict == 'update':
+        conflict_clause = "DO UPDATE SET first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name"
+    else:
+        conflict_clause = "DO NOTHING"
+
+    created, updated = 0, 0
+    with db_session() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE employee_import (
+                row_no INT NOT NULL,
+                first_name TEXT NOT NULL,
+                last_name TEXT NOT NULL,
+                email TEXT NOT NULL
+            ) ON COMMIT DROP;
+        """)
+        cur.copy_expert("COPY employee_import (row_no, first_name, last_name, email) FROM STDIN WITH (FORMAT csv)", buffer)
+        # (xmax = 0) is true for freshly inserted rows and false for rows taken by DO UPDATE
+        cur.execute(f"""
+            WITH merged AS (
+                INSERT INTO employees (first_name, last_name, email)
+                SELECT first_name, last_name, email FROM employee_import ORDER BY row_no
+                ON CONFLICT (email) {conflict_clause}
+                RETURNING email, (xmax = 0) AS inserted
+            )
+            SELECT s.row_no, s.email, m.inserted
+            FROM employee_import s
+            LEFT JOIN merged m ON m.email = s.email
+            ORDER BY s.row_no;
+        """)
+        for row_no, email, inserted in cur:
+            if inserted is None:
+                conflicts.append({'row': row_no, 'email': email, 'message': 'An employee with this email already exists'})
+            elif inserted:
+                created += 1
+            else:
+                updated += 1
+        conn.commit()
+
+    conflicts.sort(key=lambda item: item['row'])
+    logger.info(f"Employee import: {len(rows)} rows, {created} created, {updated} updated, "
+                f"{len(conflicts)} conflicts, {len(row_errors)} errors.")
+    return _response(200, {
+        'total': len(rows),
+        'created': created,
+        'updated': updated,
+        'conflicts': conflicts,
+        'errors': row_errors
+    })
 
 # =================================================================================
 # MAIN LAMBDA HANDLER
 # =================================================================================
 
+@instrumented()
 def lambda_handler(event, context):
+    return render(_handle(event), event)
+
+def _handle(event):
     try:
         # Defensive access to HTTP method
         http_method = None
@@ -198,13 +373,17 @@ def lambda_handler(event, context):
             return _response(400, {'message': 'Malformed event: missing requestContext.http'})
 
         path = event.get('rawPath') or event.get('path') or ''
-        logger.info(f"Received {http_method} request for path {path}")
+        logger.debug(f"Received {http_method} request for path {path}")
 
         if http_method == 'OPTIONS':
             return _response(200, {'message': 'CORS preflight OK'})
 
         # You can route based on path, if you plan to extend
-        if path.startswith('/employee'):
+        if path == '/employee/import':
+            if http_method == 'POST':
+                return handle_import_employees(event)
+            return _response(405, {'message': f'Method {http_method} is not supported on {path}.'})
+        elif path.startswith('/employee'):
             if http_method == 'POST':
                 return handle_create_employee(event)
             elif http_method == 'GET':
@@ -1,78 +1,459 @@
 import json
 import os
-import boto3  # type: ignore
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError  # type: ignore
+from event_buckets import time_bucket
+from event_packing import append_events, bucket_start, pack_event, packing_enabled, stored_timestamps
+from event_versions import ALL_EVENTS_MARKER
+from instrumentation import emit_metrics, function_name, instrumented, stage
+from token_counters import day_attributes, expired_attributes, window_start
+import lazy
 
-dynamodb = boto3.client('dynamodb')
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+# EVENT_STORAGE_MODE=bucket packs events into per-token, per-hour items in this table
+EVENT_BUCKET_TABLE_NAME = os.environ.get('EVENT_BUCKET_TABLE_NAME')
+# Optional per-token "last seen" state table, kept up to date for every written event
+TOKEN_STATE_TABLE_NAME = os.environ.get('TOKEN_STATE_TABLE_NAME')
 
+# BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_WRITE_MAX_ITEMS = 25
+# How many times UnprocessedItems are re-sent before the records are reported as failed
+BATCH_WRITE_MAX_ATTEMPTS = int(os.environ.get('BATCH_WRITE_MAX_ATTEMPTS', '5'))
+BATCH_WRITE_BASE_DELAY = float(os.environ.get('BATCH_WRITE_BASE_DELAY', '0.05'))
+# BatchWriteItem calls in flight at once; a flushed device buffer expands into many chunks
+BATCH_WRITE_CONCURRENCY = int(os.environ.get('BATCH_WRITE_CONCURRENCY', '8'))
+# Cap on the events of one multi-event body ({"events": [...]}); the whole body
+# also has to fit into a single SQS message (256 KiB)
+MAX_EVENTS_PER_MESSAGE = int(os.environ.get('MAX_EVENTS_PER_MESSAGE', '2000'))
 
+_write_pool = ThreadPoolExecutor(max_workers=BATCH_WRITE_CONCURRENCY)
+
+# SQS redelivers a whole batch after an error or timeout. Keys of events this
+# container has written and IDs of messages it has fully written are kept in an
+# LRU, so a redelivery that lands here again is skipped without any I/O.
+# Redelivered records that miss the LRU are written with a conditional PutItem
+# (attribute_not_exists) instead of BatchWriteItem, which cannot carry a
+# condition: an event that is already stored costs a rejected write instead of
+# an overwrite and is not counted into the token state again. In the packed
+# layout the token's stored hour is read first instead, as list_append cannot
+# carry a per-event condition. "always" applies this to first deliveries too,
+# at one call per event (per token and hour when packed); "never" turns it off.
+INGEST_DEDUP_CACHE_SIZE = int(os.environ.get('INGEST_DEDUP_CACHE_SIZE', '20000'))
+INGEST_CONDITIONAL_WRITES = os.environ.get('INGEST_CONDITIONAL_WRITES', 'redelivered').lower()
+
+# (token_id, timestamp) of written events and message IDs -> None, oldest first
+_recent = OrderedDict()
+
+# Server-side token validation against the Postgres tokens table (needs DB_SECRET_ARN)
+TOKEN_VALIDATION_ENABLED = os.environ.get('TOKEN_VALIDATION_ENABLED', 'false').lower() == 'true'
+token_cache = None
+if TOKEN_VALIDATION_ENABLED:
+    from token_cache import TokenCache
+    token_cache = TokenCache()
+
+
+@instrumented(route='sqs')
 def lambda_handler(event, context):
-    print(f"Received SQS event with {len(event.get('Records', []))} records.")
+    records = event.get('Records', [])
+
+    if not DYNAMODB_TABLE_NAME or (packing_enabled() and not EVENT_BUCKET_TABLE_NAME):
+        # Returning every message as failed keeps them on the queue instead of
+        # letting SQS delete a batch that was never written.
+        print("Error: DYNAMODB_TABLE_NAME (and EVENT_BUCKET_TABLE_NAME in bucket mode) must be set.")
+        return _batch_response([record.get('messageId', 'unknown-id') for record in records])
 
-    if not DYNAMODB_TABLE_NAME:
-        error_message = "Error: DYNAMODB_TABLE_NAME environment variable is not set."
-        print(error_message)
-        return _response(500, {'message': error_message})
+    if token_cache:
+        token_cache.ensure_fresh()
 
-    processed_count = 0
-    failed_message_ids = []
+    received_events = 0
+    rejected_events = 0
+    rejected_messages = 0
+    skipped_messages = 0
+    skipped_events = 0
+    # Items keyed by (token_id, timestamp): BatchWriteItem rejects a request that
+    # contains the same key twice, so duplicates inside one SQS batch collapse
+    # into a single put and all of their message IDs share its outcome.
+    pending = {}
 
-    for record in event.get('Records', []):
+    for record in records:
         message_id = record.get('messageId', 'unknown-id')
+        if 'messageId' in record and _seen(message_id):
+            skipped_messages += 1
+            continue
+        with stage('parse'):
+            items, rejected = _parse_record(record)
+        received_events += len(items) + rejected
+        rejected_events += rejected
+        if not items:
+            # A message without a single valid event would fail again on every
+            # redelivery and block its FIFO message group, so it is acknowledged
+            # and counted instead of reported
+            rejected_messages += 1
+            continue
+        conditional = _conditional(record)
+
+        for item in items:
+            key = _item_key(item)
+            if _seen(key):
+                skipped_events += 1
+            elif key in pending:
+                skipped_events += 1
+                pending[key]['item'] = item
+                pending[key]['conditional'] = pending[key]['conditional'] or conditional
+                if message_id not in pending[key]['message_ids']:
+                    pending[key]['message_ids'].append(message_id)
+            else:
+                pending[key] = {'item': item, 'message_ids': [message_id], 'conditional': conditional}
+
+    entries = list(pending.values())
+    with stage('write'):
+        if packing_enabled():
+            failed = _write_packed(entries)
+        else:
+            checked = [entry for entry in entries if entry['conditional']]
+            plain = [entry for entry in entries if not entry['conditional']]
+            chunks = [plain[start:start + BATCH_WRITE_MAX_ITEMS] for start in range(0, len(plain), BATCH_WRITE_MAX_ITEMS)]
+            failed = [entry for chunk_failed in _write_pool.map(_write_chunk, chunks) for entry in chunk_failed]
+            for entry, outcome in zip(checked, _write_pool.map(_put_if_absent, checked)):
+                if outcome == 'failed':
+                    failed.append(entry)
+                elif outcome == 'duplicate':
+                    entry['duplicate'] = True
+    duplicates = sum(1 for entry in entries if entry.get('duplicate'))
+    failed_message_ids = _redelivered_message_ids(records, failed)
+    unfinished = set(failed_message_ids)
+
+    stored = [entry for entry in entries if not unfinished.intersection(entry['message_ids'])]
+    if TOKEN_STATE_TABLE_NAME:
+        # Events of a redelivered message are counted when it comes back;
+        # events that were already stored have been counted before
+        counted = [entry for entry in stored if not entry.get('duplicate')]
+        if counted:
+            with stage('write'):
+                _update_token_states(counted)
+    _remember(_item_key(entry['item']) for entry in stored)
+    _remember(record['messageId'] for record in records if 'messageId' in record and record['messageId'] not in unfinished)
+
+    processed_count = len(records) - len(failed_message_ids)
+    print(f"Batch processing complete: Processed: {processed_count}, Failed: {len(failed_message_ids)}, "
+          f"Rejected messages: {rejected_messages}, Events: {received_events}, Rejected events: {rejected_events}, "
+          f"Unwritten events: {len(failed)}, "
+          f"Skipped messages: {skipped_messages}, Skipped events: {skipped_events}, Duplicate events: {duplicates}")
+    _emit_metrics(received_events, rejected_events, len(failed), skipped_messages, skipped_events, duplicates,
+                  rejected_messages)
+    if token_cache:
+        token_cache.emit_metrics()
+    return _batch_response(failed_message_ids)
+
+
+def _parse_record(record):
+    """
+    Turns one SQS record into DynamoDB items. The body is either a single event
+    or {"events": [...]} from a device flushing its offline buffer. Returns
+    (items, number of rejected events); a body that is not a valid event or
+    event list yields no items, and its events (at least one) count as rejected.
+    """
+    message_id = record.get('messageId', 'unknown-id')
+    try:
+        request_data = json.loads(record.get('body', '{}'))
+    except json.JSONDecodeError:
+        print(f"Rejecting SQS message ID: {message_id}, invalid JSON in body: {record.get('body')}")
+        return [], 1
+
+    if not isinstance(request_data, dict):
+        print(f"Rejecting SQS message ID: {message_id}, body is not a JSON object: {request_data}")
+        return [], 1
+
+    if 'events' not in request_data:
+        item = _parse_event(request_data, message_id)
+        return ([], 1) if item is None else ([item], 0)
+
+    events = request_data['events']
+    if not isinstance(events, list) or not events:
+        print(f"Rejecting SQS message ID: {message_id}, 'events' must be a non-empty array")
+        return [], 1
+    if len(events) > MAX_EVENTS_PER_MESSAGE:
+        print(f"Rejecting SQS message ID: {message_id}, {len(events)} events exceed the limit of {MAX_EVENTS_PER_MESSAGE}")
+        return [], len(events)
+
+    # A malformed entry would fail again on every redelivery, so it is dropped
+    # on its own and the rest of the buffer is still written
+    items = []
+    for index, event_data in enumerate(events):
+        item = _parse_event(event_data, f"{message_id}[{index}]")
+        if item is not None:
+            items.append(item)
+    return items, len(events) - len(items)
+
+
+def _parse_event(request_data, label):
+    """Turns one event object into a DynamoDB item, or returns None if it is invalid."""
+    if not isinstance(request_data, dict):
+        print(f"Skipping event {label}, not a JSON object: {request_data}")
+        return None
+
+    token_id = request_data.get('token')
+    timestamp = request_data.get('timestamp')
+    authorized = request_data.get('authorized')
+
+    if not token_id or timestamp is None or authorized is None:
+        print(f"Skipping event {label} due to missing fields: {request_data}")
+        return None
+
+    try:
+        item = {
+            'token_id': {'S': str(token_id)},
+            'timestamp': {'N': str(int(timestamp))},  # ensures numeric value
+            'authorized': {'BOOL': bool(authorized)},
+        }
+    except (TypeError, ValueError):
+        print(f"Skipping event {label} due to non-numeric timestamp: {timestamp}")
+        return None
+
+    # Partition key of the time_bucket_index GSI (newest events across tokens)
+    bucket = time_bucket(item['token_id']['S'], int(item['timestamp']['N']))
+    if bucket:
+        item['time_bucket'] = {'S': bucket}
+
+    if token_cache:
+        # Server-side decision next to what the reader reported; left out when
+        # the token set could not be loaded
+        token_valid = token_cache.check(token_id)
+        if token_valid is not None:
+            item['token_valid'] = {'BOOL': token_valid}
+    return item
+
+
+def _conditional(record):
+    """Whether the record's events are written with a conditional PutItem."""
+    if INGEST_CONDITIONAL_WRITES == 'always':
+        return True
+    if INGEST_CONDITIONAL_WRITES != 'redelivered':
+        return False
+    attributes = record.get('attributes') or {}
+    return int(attributes.get('ApproximateReceiveCount', '1')) > 1
+
+
+def _seen(key):
+    if key in _recent:
+        _recent.move_to_end(key)
+        return True
+    return False
+
+
+def _remember(keys):
+    if INGEST_DEDUP_CACHE_SIZE <= 0:
+        return
+    for key in keys:
+        _recent[key] = None
+        _recent.move_to_end(key)
+    while len(_recent) > INGEST_DEDUP_CACHE_SIZE:
+        _recent.popitem(last=False)
+
+
+def _put_if_absent(entry):
+    """Writes one item unless its key is already stored: 'written', 'duplicate' or 'failed'."""
+    try:
+        lazy.client('dynamodb').put_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Item=entry['item'],
+            ConditionExpression='attribute_not_exists(token_id)'
+        )
+        return 'written'
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return 'duplicate'
+        print(f"PutItem failed for event {_item_key(entry['item'])}: {e}")
+    except Exception as e:
+        print(f"PutItem failed for event {_item_key(entry['item'])}: {e}")
+    return 'failed'
+
+
+def _write_chunk(chunk):
+    """
+    Writes up to 25 items with BatchWriteItem, re-sending UnprocessedItems with
+    exponential backoff. Returns the entries that could not be written.
+    """
+    by_key = {_item_key(entry['item']): entry for entry in chunk}
+    requests = [{'PutRequest': {'Item': entry['item']}} for entry in chunk]
+
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        if attempt:
+            # Full jitter so concurrent pollers do not retry in lockstep
+            time.sleep(random.uniform(0, BATCH_WRITE_BASE_DELAY * (2 ** attempt)))
         try:
-            message_body_str = record.get('body', '{}')
-            request_data = json.loads(message_body_str)
+            response = lazy.client('dynamodb').batch_write_item(RequestItems={DYNAMODB_TABLE_NAME: requests})
+        except Exception as e:
+            print(f"BatchWriteItem failed for {len(requests)} items: {e}")
+            break
 
-            print(f"Processing SQS message ID: {message_id}, Body: {request_data}")
+        requests = (response.get('UnprocessedItems') or {}).get(DYNAMODB_TABLE_NAME, [])
+        if not requests:
+            return []
+        print(f"BatchWriteItem left {len(requests)} unprocessed items, retrying.")
+    else:
+        print(f"Giving up on {len(requests)} unprocessed items after {BATCH_WRITE_MAX_ATTEMPTS} attempts.")
 
-            token_id = request_data.get('token')
-            timestamp = request_data.get('timestamp')
-            authorized = request_data.get('authorized')
+    return [by_key[_item_key(req['PutRequest']['Item'])] for req in requests]
 
-            if not token_id or timestamp is None or authorized is None:
-                print(f"Skipping SQS message ID: {message_id} due to missing fields: {request_data}")
-                failed_message_ids.append(message_id)
-                continue
 
-            item = {
-                'token_id': {'S': str(token_id)},
-                'timestamp': {'N': str(int(timestamp))},  # ensures numeric value
-                'authorized': {'BOOL': bool(authorized)},
-            }
+def _write_packed(entries):
+    """
+    Appends the events to their token/hour bucket items with one UpdateItem per
+    bucket. Conditional entries whose timestamp is already stored in the bucket
+    are marked as duplicates and not appended. Returns the entries that could
+    not be written.
+    """
+    groups = {}
+    for entry in entries:
+        item = entry['item']
+        groups.setdefault((item['token_id']['S'], bucket_start(int(item['timestamp']['N']))), []).append(entry)
 
-            dynamodb.put_item(
-                TableName=DYNAMODB_TABLE_NAME,
-                Item=item
-            )
+    failed = []
+    for (token_id, hour_start), group in groups.items():
+        try:
+            if any(entry['conditional'] for entry in group):
+                stored = stored_timestamps(lazy.client('dynamodb'), EVENT_BUCKET_TABLE_NAME, token_id, hour_start)
+                for entry in group:
+                    if entry['conditional'] and int(entry['item']['timestamp']['N']) in stored:
+                        entry['duplicate'] = True
+            values = [
+                pack_event(
+                    int(entry['item']['timestamp']['N']),
+                    entry['item']['authorized']['BOOL'],
+                    entry['item'].get('token_valid', {}).get('BOOL')
+                )
+                for entry in group if not entry.get('duplicate')
+            ]
+            if values:
+                append_events(lazy.client('dynamodb'), EVENT_BUCKET_TABLE_NAME, token_id, hour_start, values)
+        except Exception as e:
+            print(f"Failed to append {len(group)} events to bucket {hour_start} of token {token_id}: {e}")
+            failed.extend(group)
+    return failed
 
-            print(f"Stored item successfully: token_id={token_id}, message_id={message_id}")
-            processed_count += 1
 
-        except json.JSONDecodeError:
-            print(f"Invalid JSON in message body for message ID: {message_id}. Body: {record.get('body')}")
-            failed_message_ids.append(message_id)
+def _update_token_states(entries):
+    """Folds the written events into one conditional UpdateItem per token, plus the all-events marker."""
+    now_ms = int(time.time() * 1000)
+    oldest_counted = window_start(now_ms)
+    states = {}
+    for entry in entries:
+        item = entry['item']
+        timestamp = int(item['timestamp']['N'])
+        authorized = item['authorized']['BOOL']
+        state = states.setdefault(item['token_id']['S'], {'timestamp': None, 'authorized': None, 'events': 0, 'days': {}})
+        state['events'] += 1
+        if timestamp >= oldest_counted:
+            # (allowed, denied) attribute name -> count, for the rolling counters
+            name = day_attributes(timestamp)[0 if authorized else 1]
+            state['days'][name] = state['days'].get(name, 0) + 1
+        if state['timestamp'] is None or timestamp > state['timestamp']:
+            state['timestamp'], state['authorized'] = timestamp, authorized
+
+    # Also drops the lifetime counters that state items carried before the window
+    expired = expired_attributes(now_ms) + ['allowed_count', 'denied_count']
+    for token_id, state in states.items():
+        try:
+            _update_token_state(token_id, state, expired)
         except Exception as e:
-            print(f"Error processing message ID {message_id}: {e}")
-            failed_message_ids.append(message_id)
+            # The events themselves are stored; a missed state update is not
+            # worth re-delivering the batch for
+            print(f"Failed to update state for token {token_id}: {e}")
+
+    try:
+        # Moves the ETag of the cross-token GET /events listing
+        lazy.client('dynamodb').update_item(
+            TableName=TOKEN_STATE_TABLE_NAME,
+            Key={'token_id': {'S': ALL_EVENTS_MARKER}},
+            UpdateExpression='ADD event_count :count',
+            ExpressionAttributeValues={':count': {'N': str(len(entries))}}
+        )
+    except Exception as e:
+        print(f"Failed to update the all-events marker: {e}")
+
+
+def _update_token_state(token_id, state, expired):
+    """
+    Moves last_timestamp/last_authorized forward only when this batch holds a
+    newer event, so out-of-order deliveries never roll the state back. The
+    per-day allow/deny counters and event_count (the item's change marker) are
+    added either way, and the day counters that left the window are removed.
+    """
+    key = {'token_id': {'S': token_id}}
+    names, values = {}, {':events': {'N': str(state['events'])}}
+    added = ['event_count :events']
+    for index, (name, count) in enumerate(sorted(state['days'].items())):
+        names[f'#day{index}'] = name
+        values[f':day{index}'] = {'N': str(count)}
+        added.append(f'#day{index} :day{index}')
+    for index, name in enumerate(expired):
+        names[f'#old{index}'] = name
+    counters = 'ADD ' + ', '.join(added) + ' REMOVE ' + ', '.join(f'#old{index}' for index in range(len(expired)))
+
+    try:
+        lazy.client('dynamodb').update_item(
+            TableName=TOKEN_STATE_TABLE_NAME,
+            Key=key,
+            UpdateExpression='SET last_timestamp = :ts, last_authorized = :authorized ' + counters,
+            ConditionExpression='attribute_not_exists(last_timestamp) OR last_timestamp < :ts',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={
+                ':ts': {'N': str(state['timestamp'])},
+                ':authorized': {'BOOL': state['authorized']},
+                **values
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # A newer (or the same) event is already recorded; only count this batch
+        lazy.client('dynamodb').update_item(
+            TableName=TOKEN_STATE_TABLE_NAME,
+            Key=key,
+            UpdateExpression=counters,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+
+def _emit_metrics(received, rejected, unwritten, skipped_messages, skipped_events, duplicates, rejected_messages):
+    """Prints the event counts of one invocation as a CloudWatch Embedded Metric Format record."""
+    emit_metrics('AccessControl/Ingest', {'FunctionName': function_name('event_handler')}, {
+        'IngestEvents': (received, 'Count'),
+        'IngestRejectedEvents': (rejected, 'Count'),
+        'IngestUnwrittenEvents': (unwritten, 'Count'),
+        'IngestSkippedMessages': (skipped_messages, 'Count'),
+        'IngestSkippedEvents': (skipped_events, 'Count'),
+        'IngestDuplicateEvents': (duplicates, 'Count'),
+        'IngestRejectedMessages': (rejected_messages, 'Count'),
+    })
+
+
+def _item_key(item):
+    return (item['token_id']['S'], item['timestamp']['N'])
 
-    summary = {
-        'message': f'Processed: {processed_count}, Failed: {len(failed_message_ids)}',
-        'failedMessageIds': failed_message_ids
-    }
 
-    print("Batch processing complete:", summary)
-    return _response(200, summary)
+def _redelivered_message_ids(records, failed):
+    """
+    Message IDs to report in batchItemFailures. A message with any unwritten
+    event is redelivered as a whole, and on a FIFO queue so is every message
+    after it in the batch: reporting only the failed one would let the messages
+    behind it in its group be stored ahead of it.
+    """
+    failed_messages = {message_id for entry in failed for message_id in entry['message_ids']}
+    message_ids = list(dict.fromkeys(record.get('messageId', 'unknown-id') for record in records))
+    for index, message_id in enumerate(message_ids):
+        if message_id in failed_messages:
+            return message_ids[index:]
+    return []
 
 
-def _response(status_code, body):
-    """Standard JSON response with optional CORS headers."""
+def _batch_response(failed_message_ids):
+    """Partial batch response understood by the SQS event source mapping."""
     return {
-        'statusCode': status_code,
-        'headers': {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",  # Optional, remove if only for SQS
-            "Access-Control-Allow-Headers": "Content-Type",
-            "Access-Control-Allow-Methods": "OPTIONS,POST"
-        },
-        'body': json.dumps(body)
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]
     }
@@ -0,0 +1,173 @@
+import os
+import time
+import uuid
+from datetime import timedelta
+from instrumentation import emit_metrics, function_name
+
+# In-memory set of valid token IDs from the Postgres `tokens` table, so the
+# ingest path can validate every event without a per-event database lookup.
+# After the initial load it only pulls deltas: tokens issued since the last
+# refresh (by issued_at) and revocations logged by the trigger on tokens into
+# token_revocations (by revoked_at).
+
+# Seconds between incremental refreshes
+TOKEN_CACHE_REFRESH_SECONDS = float(os.environ.get('TOKEN_CACHE_REFRESH_SECONDS', '30'))
+# A lookup miss triggers an early refresh so a freshly issued badge is accepted
+# within seconds; refresh attempts are never closer together than this
+TOKEN_CACHE_MISS_REFRESH_SECONDS = float(os.environ.get('TOKEN_CACHE_MISS_REFRESH_SECONDS', '5'))
+# Safety net: rebuild the whole set this often
+TOKEN_CACHE_FULL_RELOAD_SECONDS = float(os.environ.get('TOKEN_CACHE_FULL_RELOAD_SECONDS', '21600'))
+# issued_at / revoked_at are transaction start times, so a row can commit after
+# the watermark has passed it; re-reading this window makes deltas overlap
+TOKEN_CACHE_DELTA_OVERLAP = timedelta(seconds=float(os.environ.get('TOKEN_CACHE_DELTA_OVERLAP_SECONDS', '300')))
+
+
+def normalize_token(token_id):
+    """Canonical lower-case UUID string, or None if the value is not a UUID."""
+    try:
+        return str(uuid.UUID(str(token_id)))
+    except ValueError:
+        return None
+
+
+class TokenCache:
+    def __init__(self):
+        self.tokens = set()
+        self.loaded = False
+        self.issued_watermark = None
+        self.revoked_watermark = None
+        self.refreshed_at = 0.0
+        self.attempted_at = None
+        self.full_loaded_at = 0.0
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'unverified': 0,
+            'refreshes': 0,
+            'full_reloads': 0,
+            'refresh_ms': 0.0,
+            'refresh_rows': 0,
+            'refresh_errors': 0,
+        }
+
+    def _full_load(self, cur):
+        cur.execute("SELECT id, issued_at FROM tokens;")
+        tokens, watermark = set(), None
+        for token_id, issued_at in cur:
+            tokens.add(str(token_id))
+            if watermark is None or issued_at > watermark:
+                watermark = issued_at
+        cur.execute("SELECT max(revoked_at) FROM token_revocations;")
+        self.revoked_watermark = cur.fetchone()[0]
+        self.tokens = tokens
+        self.issued_watermark = watermark
+        self.metrics['full_reloads'] += 1
+        return len(tokens)
+
+    def _apply_deltas(self, cur):
+        rows = 0
+        if self.issued_watermark is None:
+            cur.execute("SELECT id, issued_at FROM tokens;")
+        else:
+            cur.execute(
+                "SELECT id, issued_at FROM tokens WHERE issued_at > %s;",
+                (self.issued_watermark - TOKEN_CACHE_DELTA_OVERLAP,)
+            )
+        for token_id, issued_at in cur:
+            self.tokens.add(str(token_id))
+            if self.issued_watermark is None or issued_at > self.issued_watermark:
+                self.issued_watermark = issued_at
+            rows += 1
+
+        # Revocations are applied after additions: a token issued and revoked
+        # inside the same window must end up absent
+        if self.revoked_watermark is None:
+            cur.execute("SELECT token_id, revoked_at FROM token_revocations;")
+        else:
+            cur.execute(
+                "SELECT token_id, revoked_at FROM token_revocations WHERE revoked_at > %s;",
+                (self.revoked_watermark - TOKEN_CACHE_DELTA_OVERLAP,)
+            )
+        for token_id, revoked_at in cur:
+            self.tokens.discard(str(token_id))
+            if self.revoked_watermark is None or revoked_at > self.revoked_watermark:
+                self.revoked_watermark = revoked_at
+            rows += 1
+        return rows
+
+    def refresh(self, force_full=False):
+        """Loads or updates the token set; on failure the previous set is kept."""
+        from db_connection import db_session  # only containers that validate need psycopg2
+
+        started = time.monotonic()
+        self.attempted_at = started
+        full = force_full or not self.loaded or started - self.full_loaded_at >= TOKEN_CACHE_FULL_RELOAD_SECONDS
+        try:
+            with db_session() as conn, conn.cursor() as cur:
+                rows = self._full_load(cur) if full else self._apply_deltas(cur)
+            self.loaded = True
+            self.refreshed_at = started
+            if full:
+                self.full_loaded_at = started
+        except Exception as e:
+            self.metrics['refresh_errors'] += 1
+            print(f"Token cache refresh failed, keeping {len(self.tokens)} cached tokens: {e}")
+            return False
+
+        self.metrics['refreshes'] += 1
+        self.metrics['refresh_rows'] += rows
+        self.metrics['refresh_ms'] += (time.monotonic() - started) * 1000
+        return True
+
+    def _recently_attempted(self, now):
+        # Throttles refreshes while the database is unreachable
+        return self.attempted_at is not None and now - self.attempted_at < TOKEN_CACHE_MISS_REFRESH_SECONDS
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._recently_attempted(now):
+            return
+        if not self.loaded or now - self.refreshed_at >= TOKEN_CACHE_REFRESH_SECONDS:
+            self.refresh()
+
+    def check(self, token_id):
+        """
+        Returns True/False for a known/unknown token, or None when the cache
+        has never been loaded and the decision cannot be made.
+        """
+        self.metrics['lookups'] += 1
+        if not self.loaded:
+            self.metrics['unverified'] += 1
+            return None
+
+        normalized = normalize_token(token_id)
+        if normalized is not None and normalized not in self.tokens \
+                and not self._recently_attempted(time.monotonic()):
+            self.refresh()
+
+        if normalized is not None and normalized in self.tokens:
+            self.metrics['hits'] += 1
+            return True
+        self.metrics['misses'] += 1
+        return False
+
+    def emit_metrics(self, namespace='AccessControl/Ingest'):
+        """Prints the counters since the last call as a CloudWatch Embedded Metric Format record."""
+        m = self.metrics
+        emit_metrics(namespace, {'FunctionName': function_name('event_handler')}, {
+            'TokenCacheLookups': (m['lookups'], 'Count'),
+            'TokenCacheHits': (m['hits'], 'Count'),
+            'TokenCacheMisses': (m['misses'], 'Count'),
+            'TokenCacheUnverified': (m['unverified'], 'Count'),
+            'TokenCacheHitRate': (round(100.0 * m['hits'] / m['lookups'], 2) if m['lookups'] else 0.0, 'Percent'),
+            'TokenCacheRefreshes': (m['refreshes'], 'Count'),
+            'TokenCacheRefreshErrors': (m['refresh_errors'], 'Count'),
+            'TokenCacheRefreshRows': (m['refresh_rows'], 'Count'),
+            'TokenCacheRefreshTime': (round(m['refresh_ms'], 3), 'Milliseconds'),
+            'TokenCacheSize': (len(self.tokens), 'Count'),
+        }, {'TokenCacheFullReloads': m['full_reloads']})
+        self.reset_metrics()
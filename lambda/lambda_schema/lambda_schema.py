@@ -1,9 +1,8 @@
 import os
 import psycopg2
-import boto3
 import json
+import lazy
 
-secrets_manager = boto3.client('secretsmanager')
 db_secret_arn = os.environ.get('DB_SECRET_ARN')
 db_creds = None 
 
@@ -15,7 +14,7 @@ def get_db_credentials():
         raise ValueError("DB_SECRET_ARN environment variable is not set.")
     try:
         print("Fetching database credentials from Secrets Manager.")
-        secret_response = secrets_manager.get_secret_value(SecretId=db_secret_arn)
+        secret_response = lazy.client('secretsmanager').get_secret_value(SecretId=db_secret_arn)
         db_creds = json.loads(secret_response['SecretString'])
         return db_creds
     except Exception as e:
@@ -60,7 +59,59 @@ def lambda_handler(event, context):
             );
 
             CREATE INDEX IF NOT EXISTS idx_employees_email ON employees (email);
-            CREATE INDEX IF NOT EXISTS idx_tokens_employee_id ON tokens (employee_id);
+
+            CREATE INDEX IF NOT EXISTS idx_employees_created_at_id ON employees (created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_employees_first_name_prefix ON employees (lower(first_name) text_pattern_ops);
+            CREATE INDEX IF NOT EXISTS idx_employees_last_name_prefix ON employees (lower(last_name) text_pattern_ops);
+            CREATE INDEX IF NOT EXISTS idx_employees_email_prefix ON employees (lower(email) text_pattern_ops);
+
+            CREATE TABLE IF NOT EXISTS token_revocations (
+                token_id UUID NOT NULL,
+                revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_tokens_issued_at ON tokens (issued_at);
+            CREATE INDEX IF NOT EXISTS idx_token_revocations_revoked_at ON token_revocations (revoked_at);
+
+            CREATE INDEX IF NOT EXISTS idx_tokens_employee_issued_at ON tokens (employee_id, issued_at DESC, id DESC);
+            DROP INDEX IF EXISTS idx_tokens_employee_id;
+
+            CREATE OR REPLACE FUNCTION log_token_revocations() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO token_revocations (token_id) SELECT id FROM revoked_tokens;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_tokens_revocations ON tokens;
+            CREATE TRIGGER trg_tokens_revocations
+                AFTER DELETE ON tokens
+                REFERENCING OLD TABLE AS revoked_tokens
+                FOR EACH STATEMENT EXECUTE FUNCTION log_token_revocations();
+
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            );
+
+            INSERT INTO table_versions (table_name) VALUES ('employees'), ('tokens') ON CONFLICT DO NOTHING;
+
+            CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trg_employees_version ON employees;
+            CREATE TRIGGER trg_employees_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employees
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+            DROP TRIGGER IF EXISTS trg_tokens_version ON tokens;
+            CREATE TRIGGER trg_tokens_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tokens
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
         """)
         
         conn.commit()
@@ -1,9 +1,15 @@
+import base64
 import json
 import logging
 import os
-import boto3  # type: ignore
-import psycopg2
-from psycopg2 import errors
+import uuid
+from datetime import datetime
+from typing import Union
+from db_connection import db_session, table_versions, wants_consistent_read
+from etags import etag_headers, etag_matches, if_none_match, make_etag
+from serialization import page, render
+from instrumentation import instrumented, parse_json
+import lazy
 
 # =================================================================================
 # GLOBAL SETUP
@@ -12,43 +18,21 @@ from psycopg2 import errors
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-secrets_manager = boto3.client('secretsmanager')
-db_secret_arn = os.environ.get('DB_SECRET_ARN')
-db_creds = None
+psycopg2 = lazy.lazy_import('psycopg2')
 
 ENABLE_CORS = True  # Toggle this if used with API Gateway
 
+# Page size for the token listing
+DEFAULT_PAGE_LIMIT = int(os.environ.get('TOKENS_DEFAULT_PAGE_LIMIT', '100'))
+MAX_PAGE_LIMIT = int(os.environ.get('TOKENS_MAX_PAGE_LIMIT', '500'))
+
+# Upper bound on items in one batch issue/revoke request
+MAX_BATCH_ITEMS = int(os.environ.get('TOKENS_MAX_BATCH_ITEMS', '1000'))
+
 # =================================================================================
 # HELPERS
 # =================================================================================
 
-def get_db_credentials():
-    """Fetches DB credentials from Secrets Manager, caching them globally."""
-    global db_creds
-    if db_creds:
-        return db_creds
-    if not db_secret_arn:
-        raise ValueError("DB_SECRET_ARN environment variable is not set.")
-    try:
-        logger.info("Fetching database credentials from Secrets Manager.")
-        secret_response = secrets_manager.get_secret_value(SecretId=db_secret_arn)
-        db_creds = json.loads(secret_response['SecretString'])
-        return db_creds
-    except Exception as e:
-        logger.error(f"Failed to retrieve database credentials: {e}")
-        raise
-
-def get_db_connection():
-    """Establishes a new PostgreSQL connection."""
-    creds = get_db_credentials()
-    return psycopg2.connect(
-        host=creds['DB_HOST'],
-        port=creds['DB_PORT'],
-        dbname=creds['DB_NAME'],
-        user=creds['DB_USER'],
-        password=creds['DB_PASSWORD']
-    )
-
 def format_token_record(record):
     """Converts a token record tuple into a dictionary."""
     if not record:
@@ -59,11 +43,81 @@ def format_token_record(record):
         'issued_at': record[2].isoformat()
     }
 
-def response(status_code: int, body: dict | str):
-    """Standard HTTP JSON response with optional CORS headers."""
-    if isinstance(body, dict):
-        body = json.dumps(body)
+def format_listed_token(record):
+    """Converts a joined (token, employee) listing row into a dictionary."""
+    return {
+        'id': record[0],
+        'employee_id': record[1],
+        'issued_at': record[2].isoformat(),
+        'first_name': record[3],
+        'last_name': record[4],
+        'email': record[5]
+    }
+
+def encode_cursor(issued_at, token_id):
+    """Opaque keyset cursor for the (issued_at, id) position of the last row on a page."""
+    raw = json.dumps([issued_at.isoformat(), str(token_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
 
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        issued_at, token_id = json.loads(raw)
+        return datetime.fromisoformat(issued_at), str(uuid.UUID(token_id))
+    except Exception:
+        raise ValueError('Invalid pagination cursor')
+
+def _parse_limit(value):
+    if value is None:
+        return DEFAULT_PAGE_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_LIMIT)
+
+def _parse_datetime(value, field):
+    """ISO 8601 timestamp (a trailing Z is accepted), or None when absent."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{field} must be an ISO 8601 timestamp')
+
+def _parse_uuid(value, field):
+    if not value:
+        return None
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise ValueError(f'{field} must be a UUID')
+
+def _parse_uuid_list(values, field):
+    """Validates a list of UUID strings, returning (valid ids in order without duplicates, per-item errors)."""
+    if not isinstance(values, list) or not values:
+        raise ValueError(f'{field} must be a non-empty list')
+    if len(values) > MAX_BATCH_ITEMS:
+        raise ValueError(f'{field} is limited to {MAX_BATCH_ITEMS} items per request')
+    valid, invalid, seen = [], [], set()
+    for value in values:
+        try:
+            normalized = str(uuid.UUID(str(value)))
+        except ValueError:
+            invalid.append({'id': value, 'status': 'invalid', 'message': 'Not a valid UUID'})
+            continue
+        if normalized not in seen:
+            seen.add(normalized)
+            valid.append(normalized)
+    return valid, invalid
+
+def response(status_code: int, body: Union[dict, list, str, None], extra_headers: dict = None):
+    """
+    Standard HTTP JSON response with optional CORS headers. The body stays a
+    Python value until lambda_handler renders it (serialization.render).
+    """
     headers = {"Content-Type": "application/json"}
     if ENABLE_CORS:
         headers.update({
@@ -71,6 +125,8 @@ def response(status_code: int, body: dict | str):
             "Access-Control-Allow-Methods": "GET,POST,DELETE,OPTIONS",
             "Access-Control-Allow-Headers": "Content-Type"
         })
+    if extra_headers:
+        headers.update(extra_headers)
 
     return {
         'statusCode': status_code,
@@ -84,18 +140,16 @@ def response(status_code: int, body: dict | str):
 
 def handle_create_token(event):
     """Handles POST to create (issue) a new token for an employee."""
-    conn = None
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_json(event.get('body', '{}'))
         employee_id = body.get('employee_id')
 
         if not employee_id:
             return response(400, {'message': 'Missing required field: employee_id'})
 
-        conn = get_db_connection()
         sql = "INSERT INTO tokens (employee_id) VALUES (%s) RETURNING id, issued_at;"
 
-        with conn.cursor() as cur:
+        with db_session() as conn, conn.cursor() as cur:
             cur.execute(sql, (employee_id,))
             new_token_id, issued_at = cur.fetchone()
             conn.commit()
@@ -107,30 +161,30 @@ def handle_create_token(event):
             'message': 'Token issued successfully.'
         })
 
-    except errors.ForeignKeyViolation:
+    except psycopg2.errors.ForeignKeyViolation:
         logger.warning(f"Employee not found for ID '{employee_id}'")
         return response(404, {'message': f"Employee with ID '{employee_id}' not found."})
     except Exception as e:
         logger.error(f"Error issuing token: {e}")
         return response(500, {'message': 'Error issuing token'})
-    finally:
-        if conn:
-            conn.close()
 
 def handle_read_token(event):
-    """Handles GET to retrieve all tokens for a specific employee."""
-    conn = None
+    """
+    Handles GET /token. With `employee_id` in the body it returns that
+    employee's tokens as a plain list; otherwise the paginated listing.
+    """
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_json(event.get('body') or '{}')
         employee_id = body.get('employee_id')
+        # Reads go to the Aurora reader unless the caller asks to see its own writes
+        consistent = wants_consistent_read(event)
 
         if not employee_id:
-            return response(400, {'message': 'Missing required field: employee_id'})
+            return handle_list_tokens(event.get('queryStringParameters') or {}, body, consistent, if_none_match(event))
 
-        conn = get_db_connection()
         sql = "SELECT id, employee_id, issued_at FROM tokens WHERE employee_id = %s ORDER BY issued_at DESC;"
 
-        with conn.cursor() as cur:
+        with db_session(readonly=True, consistent=consistent) as conn, conn.cursor() as cur:
             cur.execute(sql, (employee_id,))
             records = cur.fetchall()
             tokens = [format_token_record(rec) for rec in records]
@@ -140,24 +194,19 @@ def handle_read_token(event):
     except Exception as e:
         logger.error(f"Error retrieving tokens: {e}")
         return response(500, {'message': 'Error retrieving tokens'})
-    finally:
-        if conn:
-            conn.close()
 
 def handle_delete_token(event):
     """Handles DELETE to revoke a token by ID."""
-    conn = None
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_json(event.get('body', '{}'))
         token_id = body.get('id')
 
         if not token_id:
             return response(400, {'message': 'Missing required field: id'})
 
-        conn = get_db_connection()
         sql = "DELETE FROM tokens WHERE id = %s;"
 
-        with conn.cursor() as cur:
+        with db_session() as conn, conn.cursor() as cur:
             cur.execute(sql, (token_id,))
             if cur.rowcount == 0:
                 return response(404, {'message': 'Token not found'})
@@ -169,23 +218,205 @@ def handle_delete_token(event):
     except Exception as e:
         logger.error(f"Error deleting token: {e}")
         return response(500, {'message': 'Error deleting token'})
-    finally:
-        if conn:
-            conn.close()
+
+def handle_list_tokens(query_params, body, consistent=False, cached_etags=frozenset()):
+    """
+    Lists tokens newest first, joined with their employee's name and email,
+    one keyset page at a time. Optional filters: `employee_id` and an
+    `issued_from`/`issued_to` range (inclusive, ISO 8601). Answers 304 without
+    running the join when an ETag in `cached_etags` still matches.
+    """
+    try:
+        limit = _parse_limit(query_params.get('limit') or body.get('limit'))
+        cursor = query_params.get('next') or body.get('next')
+        position = decode_cursor(cursor) if cursor else None
+        employee_id = _parse_uuid(query_params.get('employee_id'), 'employee_id')
+        issued_from = _parse_datetime(query_params.get('issued_from') or body.get('issued_from'), 'issued_from')
+        issued_to = _parse_datetime(query_params.get('issued_to') or body.get('issued_to'), 'issued_to')
+    except ValueError as e:
+        return response(400, {'message': str(e)})
+
+    conditions, params = [], []
+    if employee_id:
+        # Served by idx_tokens_employee_issued_at in (issued_at, id) order
+        conditions.append("t.employee_id = %s")
+        params.append(employee_id)
+    if issued_from:
+        conditions.append("t.issued_at >= %s")
+        params.append(issued_from)
+    if issued_to:
+        conditions.append("t.issued_at <= %s")
+        params.append(issued_to)
+    if position:
+        conditions.append("(t.issued_at, t.id) < (%s, %s::uuid)")
+        params.extend(position)
+
+    sql = """
+        SELECT t.id, t.employee_id, t.issued_at, e.first_name, e.last_name, e.email
+        FROM tokens t
+        JOIN employees e ON e.id = t.employee_id
+    """
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # One extra row tells whether another page follows
+    sql += " ORDER BY t.issued_at DESC, t.id DESC LIMIT %s;"
+    params.append(limit + 1)
+
+    logger.info(f"Listing tokens (limit={limit}, employee={employee_id}, cursor={'yes' if position else 'no'}).")
+    with db_session(readonly=True, consistent=consistent) as conn, conn.cursor() as cur:
+        # Both joined tables count: a renamed employee changes the listed rows too
+        etag = make_etag(table_versions(cur, 'tokens', 'employees'), limit, cursor, employee_id, issued_from, issued_to)
+        if etag_matches(cached_etags, etag):
+            return response(304, None, etag_headers(etag))
+        cur.execute(sql, params)
+        records = cur.fetchall()
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1][2], records[-1][0])
+
+    return response(200, page([format_listed_token(rec) for rec in records], next_cursor), etag_headers(etag))
+
+# =================================================================================
+# BATCH HANDLERS
+# =================================================================================
+
+def handle_batch_create_tokens(event):
+    """
+    Handles POST /token/batch: issues one token for every listed employee_id
+    in a single INSERT ... SELECT unnest(...) and reports the result per employee.
+    """
+    try:
+        body = parse_json(event.get('body') or '{}')
+        employee_ids, results = _parse_uuid_list(body.get('employee_ids'), 'employee_ids')
+    except ValueError as e:
+        return response(400, {'message': str(e)})
+
+    # Joining employees skips unknown IDs instead of failing the whole
+    # statement on the foreign key
+    sql = """
+        WITH requested AS (
+            SELECT r.employee_id, r.ord
+            FROM unnest(%s::uuid[]) WITH ORDINALITY AS r(employee_id, ord)
+        ), inserted AS (
+            INSERT INTO tokens (employee_id)
+            SELECT r.employee_id
+            FROM requested r
+            JOIN employees e ON e.id = r.employee_id
+            ORDER BY r.ord
+            RETURNING id, employee_id, issued_at
+        )
+        SELECT r.employee_id, i.id, i.issued_at
+        FROM requested r
+        LEFT JOIN inserted i ON i.employee_id = r.employee_id
+        ORDER BY r.ord;
+    """
+    try:
+        if employee_ids:
+            with db_session() as conn, conn.cursor() as cur:
+                cur.execute(sql, (employee_ids,))
+                rows = cur.fetchall()
+                conn.commit()
+        else:
+            rows = []
+    except psycopg2.errors.ForeignKeyViolation:
+        # An employee was deleted while the batch ran; nothing was committed
+        return response(409, {'message': 'An employee was removed during the batch; please retry.'})
+
+    issued = 0
+    for employee_id, token_id, issued_at in rows:
+        if token_id is None:
+            results.append({'employee_id': employee_id, 'status': 'not_found', 'message': 'Employee not found'})
+        else:
+            issued += 1
+            results.append({
+                'employee_id': employee_id,
+                'status': 'issued',
+                'token_id': token_id,
+                'issued_at': issued_at.isoformat()
+            })
+
+    logger.info(f"Batch issued {issued} tokens for {len(employee_ids)} employees.")
+    return response(200, {'issued': issued, 'results': results})
+
+def handle_batch_delete_tokens(event):
+    """
+    Handles DELETE /token/batch: revokes the listed token ids with one
+    DELETE ... WHERE id = ANY(...), or every token of one employee_id.
+    """
+    try:
+        body = parse_json(event.get('body') or '{}')
+        if body.get('employee_id'):
+            employee_id = str(uuid.UUID(str(body['employee_id'])))
+            token_ids, results = None, []
+        else:
+            employee_id = None
+            token_ids, results = _parse_uuid_list(body.get('ids'), 'ids')
+    except ValueError as e:
+        return response(400, {'message': str(e)})
+
+    if employee_id:
+        sql = "DELETE FROM tokens WHERE employee_id = %s RETURNING id;"
+        with db_session() as conn, conn.cursor() as cur:
+            cur.execute(sql, (employee_id,))
+            revoked_ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+        results = [{'id': token_id, 'status': 'revoked'} for token_id in revoked_ids]
+        logger.info(f"Revoked {len(revoked_ids)} tokens of employee {employee_id}")
+        return response(200, {'revoked': len(revoked_ids), 'results': results})
+
+    sql = """
+        WITH deleted AS (
+            DELETE FROM tokens WHERE id = ANY(%s::uuid[]) RETURNING id
+        )
+        SELECT r.id, d.id IS NOT NULL
+        FROM unnest(%s::uuid[]) WITH ORDINALITY AS r(id, ord)
+        LEFT JOIN deleted d ON d.id = r.id
+        ORDER BY r.ord;
+    """
+    rows = []
+    if token_ids:
+        with db_session() as conn, conn.cursor() as cur:
+            cur.execute(sql, (token_ids, token_ids))
+            rows = cur.fetchall()
+            conn.commit()
+
+    revoked = 0
+    for token_id, deleted in rows:
+        if deleted:
+            revoked += 1
+            results.append({'id': token_id, 'status': 'revoked'})
+        else:
+            results.append({'id': token_id, 'status': 'not_found', 'message': 'Token not found'})
+
+    logger.info(f"Batch revoked {revoked} of {len(token_ids)} tokens.")
+    return response(200, {'revoked': revoked, 'results': results})
 
 # =================================================================================
 # MAIN ENTRYPOINT
 # =================================================================================
 
+@instrumented()
 def lambda_handler(event, context):
+    return render(_handle(event), event)
+
+def _handle(event):
     try:
         http_method = event['requestContext']['http']['method']
         path = event.get('rawPath', '')
-        logger.info(f"Received {http_method} request for path {path}")
+        logger.debug(f"Received {http_method} request for path {path}")
 
         if http_method == 'OPTIONS':
             return response(200, {})  # For CORS preflight
 
+        if path.endswith('/token/batch'):
+            if http_method == 'POST':
+                return handle_batch_create_tokens(event)
+            elif http_method == 'DELETE':
+                return handle_batch_delete_tokens(event)
+            return response(405, {'message': f'Method {http_method} is not supported on {path}.'})
+
         if http_method == 'POST':
             return handle_create_token(event)
         elif http_method == 'GET':
@@ -9,7 +9,10 @@ resource "aws_apigatewayv2_api" "http_api_gateway" {
   cors_configuration {
   allow_origins = ["*"]
   allow_methods = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-  allow_headers = ["Content-Type", "Authorization"]
+  allow_headers = ["Content-Type", "Authorization", "X-Consistent-Read", "If-None-Match"]
+  # Listings carry an ETag for conditional GETs (If-None-Match -> 304); NDJSON
+  # listings return their cursor in X-Next-Cursor
+  expose_headers = ["ETag", "X-Next-Cursor"]
 }
 }
 
@@ -147,6 +150,38 @@ resource "aws_apigatewayv2_route" "event_get_rud" {
   target             = "integrations/${aws_apigatewayv2_integration.event_rud_lambda_integration.id}"
 }
 
+resource "aws_apigatewayv2_route" "event_stats_get" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "GET /events/stats"
+  authorization_type = "JWT"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  target             = "integrations/${aws_apigatewayv2_integration.event_rud_lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "event_state_get" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "GET /events/state"
+  authorization_type = "JWT"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  target             = "integrations/${aws_apigatewayv2_integration.event_rud_lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "event_query_post" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "POST /events/query"
+  authorization_type = "JWT"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  target             = "integrations/${aws_apigatewayv2_integration.event_rud_lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "event_purge_get" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "GET /events/purge"
+  authorization_type = "JWT"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  target             = "integrations/${aws_apigatewayv2_integration.event_rud_lambda_integration.id}"
+}
+
 resource "aws_apigatewayv2_route" "event_delete_rud" {
   api_id             = aws_apigatewayv2_api.http_api_gateway.id
   route_key          = "DELETE /events"
@@ -172,6 +207,14 @@ resource "aws_apigatewayv2_route" "employee_post_route" {
 
   target = "integrations/${aws_apigatewayv2_integration.employee_api_integration.id}"
 }
+resource "aws_apigatewayv2_route" "employee_import_route" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "POST /employee/import"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  authorization_type = "JWT"
+
+  target = "integrations/${aws_apigatewayv2_integration.employee_api_integration.id}"
+}
 resource "aws_apigatewayv2_route" "employee_put_route" {
   api_id             = aws_apigatewayv2_api.http_api_gateway.id
   route_key          = "PUT /employee"
@@ -224,6 +267,24 @@ resource "aws_apigatewayv2_route" "tokens_delete_route" {
   target = "integrations/${aws_apigatewayv2_integration.crud_tokens_lambda_integration.id}"
 }
 
+resource "aws_apigatewayv2_route" "tokens_batch_post_route" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "POST /token/batch"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  authorization_type = "JWT"
+
+  target = "integrations/${aws_apigatewayv2_integration.crud_tokens_lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "tokens_batch_delete_route" {
+  api_id             = aws_apigatewayv2_api.http_api_gateway.id
+  route_key          = "DELETE /token/batch"
+  authorizer_id      = aws_apigatewayv2_authorizer.cognito_auth.id
+  authorization_type = "JWT"
+
+  target = "integrations/${aws_apigatewayv2_integration.crud_tokens_lambda_integration.id}"
+}
+
 # ----------- Domain Name for API Gateway -----------
 
 resource "aws_apigatewayv2_domain_name" "api_custom_subdomain" {
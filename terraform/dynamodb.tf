@@ -12,8 +12,110 @@ resource "aws_dynamodb_table" "access_events" {
     name = "timestamp"
     type = "N"
   }
+  attribute {
+    name = "time_bucket"
+    type = "S"
+  }
+
+  # Newest events across all tokens: "<UTC day>#<shard>" partitions sorted by timestamp
+  global_secondary_index {
+    name            = "time_bucket_index"
+    hash_key        = "time_bucket"
+    range_key       = "timestamp"
+    projection_type = "ALL"
+  }
+
+  # Set by the archive job once an event is in the Parquet archive (event_archive.py)
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
 
   tags = {
     Project = "${var.acc}-access-events-table-db"
   }
-}
\ No newline at end of file
+}
+
+# Packed layout (event_storage_mode = "bucket"): one item per token, hour and part
+# holding that hour's events as a list of packed numbers
+resource "aws_dynamodb_table" "access_event_buckets" {
+  name         = "${var.acc}-dynamo-access-event-buckets-table"
+  billing_mode = "PAY_PER_REQUEST"
+
+  hash_key  = "token_id"
+  range_key = "bucket"
+  attribute {
+    name = "token_id"
+    type = "S"
+  }
+  attribute {
+    name = "bucket"
+    type = "N"
+  }
+  attribute {
+    name = "time_bucket"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "time_bucket_index"
+    hash_key        = "time_bucket"
+    range_key       = "bucket"
+    projection_type = "ALL"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project = "${var.acc}-access-event-buckets-table-db"
+  }
+}
+
+# Per-token "last seen" state (last timestamp/decision, allow/deny counters), written on ingest
+resource "aws_dynamodb_table" "token_state" {
+  name         = "${var.acc}-dynamo-token-state-table"
+  billing_mode = "PAY_PER_REQUEST"
+
+  hash_key = "token_id"
+  attribute {
+    name = "token_id"
+    type = "S"
+  }
+
+  tags = {
+    Project = "${var.acc}-token-state-table-db"
+  }
+}
+
+# Progress of asynchronous jobs (large DELETE /events purges); records expire after a week
+resource "aws_dynamodb_table" "event_jobs" {
+  name         = "${var.acc}-dynamo-event-jobs-table"
+  billing_mode = "PAY_PER_REQUEST"
+
+  hash_key = "job_id"
+  attribute {
+    name = "job_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project = "${var.acc}-event-jobs-table-db"
+  }
+}
+
+# The event handler runs in the data subnets (no NAT); reach DynamoDB through a gateway endpoint
+resource "aws_vpc_endpoint" "dynamodb" {
+  vpc_id            = aws_vpc.dragan_vpc.id
+  service_name      = "com.amazonaws.${var.aws_region}.dynamodb"
+  vpc_endpoint_type = "Gateway"
+
+  route_table_ids = [aws_route_table.data_subnet_rt.id]
+}
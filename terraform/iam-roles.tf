@@ -341,7 +341,8 @@ resource "aws_iam_role" "lambda_iot_access_event_handler_role" {
   })
 }
 
-# Policy for DynamoDB PutItem permission
+# Policy for DynamoDB PutItem / BatchWriteItem on events, UpdateItem on token state / packed buckets,
+# and Query on packed buckets (redelivered records are checked against the stored hour)
 resource "aws_iam_policy" "dynamodb_put_policy" {
   name        = "${var.acc}-dynamodb-put-policy"
   description = "Allows Lambda to put items into the specific DynamoDB table"
@@ -351,10 +352,24 @@ resource "aws_iam_policy" "dynamodb_put_policy" {
     Statement = [
       {
         Action = [
-          "dynamodb:PutItem"
+          "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem"
         ],
         Effect   = "Allow",
         Resource = aws_dynamodb_table.access_events.arn # References the DynamoDB table from main.tf
+      },
+      {
+        Action = "dynamodb:UpdateItem",
+        Effect = "Allow",
+        Resource = [
+          aws_dynamodb_table.token_state.arn,
+          aws_dynamodb_table.access_event_buckets.arn
+        ]
+      },
+      {
+        Action   = "dynamodb:Query",
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.access_event_buckets.arn
       }
     ]
   })
@@ -398,6 +413,28 @@ resource "aws_iam_role_policy_attachment" "lambda_basic_execution_policy_attachm
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
 }
 
+# The event handler reads the tokens table for ingest-time validation
+resource "aws_iam_role_policy_attachment" "event_handler_vpc_access" {
+  role       = aws_iam_role.lambda_iot_access_event_handler_role.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole"
+}
+
+resource "aws_iam_role_policy" "event_handler_db_secret_get" {
+  name = "allow-db-secret-get"
+  role = aws_iam_role.lambda_iot_access_event_handler_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = "secretsmanager:GetSecretValue",
+        Resource = aws_secretsmanager_secret.db_creds.arn
+      }
+    ]
+  })
+}
+
 # ------------------------- RUD ------------------------------
 resource "aws_iam_role" "event_rud_role" {
   name = "${var.project_prefix}-event-rud-role"
@@ -438,7 +475,11 @@ resource "aws_iam_policy" "dynamodb_full_access_policy" {
         ],
         Resource = [
           aws_dynamodb_table.access_events.arn,
-          "${aws_dynamodb_table.access_events.arn}/index/*"
+          "${aws_dynamodb_table.access_events.arn}/index/*",
+          aws_dynamodb_table.token_state.arn,
+          aws_dynamodb_table.access_event_buckets.arn,
+          "${aws_dynamodb_table.access_event_buckets.arn}/index/*",
+          aws_dynamodb_table.event_jobs.arn
         ]
       }
     ]
@@ -450,6 +491,86 @@ resource "aws_iam_role_policy_attachment" "dynamodb_full_access_attach" {
   policy_arn = aws_iam_policy.dynamodb_full_access_policy.arn
 }
 
+# DELETE /events hands large purges to the purge function; it and the archive job re-invoke themselves
+resource "aws_iam_policy" "event_purge_invoke_policy" {
+  name = "${var.project_prefix}-event-purge-invoke-policy"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action = "lambda:InvokeFunction",
+        Resource = [
+          aws_lambda_function.event_purge_func.arn,
+          aws_lambda_function.event_archive_func.arn
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "event_purge_invoke_attach" {
+  role       = aws_iam_role.event_rud_role.name
+  policy_arn = aws_iam_policy.event_purge_invoke_policy.arn
+}
+
+# Multipart uploads of event exports
+resource "aws_iam_policy" "event_export_s3_policy" {
+  name = "${var.project_prefix}-event-export-s3-policy"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow",
+        Action = [
+          "s3:PutObject",
+          "s3:AbortMultipartUpload",
+          "s3:ListMultipartUploadParts"
+        ],
+        Resource = "${aws_s3_bucket.event_exports.arn}/*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "event_export_s3_attach" {
+  role       = aws_iam_role.event_rud_role.name
+  policy_arn = aws_iam_policy.event_export_s3_policy.arn
+}
+
+# Archive files and manifest: written by the archive job, read by GET /events?tier=all,
+# token files rewritten by purges
+resource "aws_iam_policy" "event_archive_s3_policy" {
+  name = "${var.project_prefix}-event-archive-s3-policy"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow",
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ],
+        Resource = "${aws_s3_bucket.event_archive.arn}/*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = "s3:ListBucket",
+        Resource = aws_s3_bucket.event_archive.arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "event_archive_s3_attach" {
+  role       = aws_iam_role.event_rud_role.name
+  policy_arn = aws_iam_policy.event_archive_s3_policy.arn
+}
+
 ##ssm
 
 # Attach custom policy for reading DB credentials from SSM
@@ -589,3 +710,20 @@ resource "aws_iam_role_policy" "allow_secretsmanager_get" {
     ]
   })
 }
+
+# Read bulk employee import files
+resource "aws_iam_role_policy" "allow_employee_import_read" {
+  name = "allow-employee-import-read"
+  role = aws_iam_role.crud_vpc_lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = "s3:GetObject",
+        Resource = "${aws_s3_bucket.employee_imports.arn}/*"
+      }
+    ]
+  })
+}
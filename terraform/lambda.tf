@@ -33,6 +33,13 @@ data "archive_file" "event_rud_zip" {
   output_path = "${path.module}/../lambda/access_event_rud.zip"
 }
 
+# Shared helpers (Postgres connection manager, ...) published as a layer under python/
+data "archive_file" "common_layer_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/../lambda/common_layer"
+  output_path = "${path.module}/../lambda/common_layer.zip"
+}
+
 data "archive_file" "schema_zip" {
   type        = "zip"
   source_dir  = "${path.module}/../lambda/lambda_schema"
@@ -48,12 +55,31 @@ resource "aws_lambda_function" "eh_lambda" {
 
   filename         = data.archive_file.eh_zip.output_path
   source_code_hash = filebase64sha256(data.archive_file.eh_zip.output_path)
+  # A batch of 10 multi-event messages can carry 20000 events
+  timeout = 60
+
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
 
   environment {
     variables = {
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.access_events.name
+      DYNAMODB_TABLE_NAME      = aws_dynamodb_table.access_events.name
+      TOKEN_STATE_TABLE_NAME   = aws_dynamodb_table.token_state.name
+      EVENT_STORAGE_MODE       = var.event_storage_mode
+      EVENT_BUCKET_TABLE_NAME  = aws_dynamodb_table.access_event_buckets.name
+      DB_SECRET_ARN            = aws_secretsmanager_secret.db_creds.arn
+      TOKEN_VALIDATION_ENABLED = "true"
     }
   }
+
+  # Runs next to Aurora to keep the token cache warm; DynamoDB is reached
+  # through the gateway endpoint on the data subnets
+  vpc_config {
+    subnet_ids         = [for subnet in aws_subnet.data : subnet.id]
+    security_group_ids = [aws_security_group.vpc_lambda_sg.id]
+  }
   tags = {
     Name = "${var.acc}-eh-lambda"
   }
@@ -68,13 +94,17 @@ resource "aws_lambda_function" "custom_auth" {
   filename         = data.archive_file.auth_zip.output_path
   source_code_hash = filebase64sha256(data.archive_file.auth_zip.output_path)
 
+  # Shared lazily built boto3 clients
+  layers = [aws_lambda_layer_version.common_layer.arn]
+
   tags = {
     Name = "${var.acc}-auth-lambda"
   }
 
   environment {
     variables = {
-      API_KEY_PARAMETER_NAME = "${var.acc}-api-key"
+      API_KEY_PARAMETER_NAME    = "${var.acc}-api-key"
+      API_KEY_CACHE_TTL_SECONDS = "300"
     }
   }
 }
@@ -88,17 +118,144 @@ resource "aws_lambda_function" "event_rud_func" {
   source_code_hash = filebase64sha256(data.archive_file.event_rud_zip.output_path)
   runtime          = "python3.9"
 
+  # The dependency layer also carries orjson/brotli for the event listings' responses
+  # and pyarrow for GET /events?tier=all
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
+
   environment {
     variables = {
-      DYNAMODB_TABLE_NAME = aws_dynamodb_table.access_events.name
+      DYNAMODB_TABLE_NAME     = aws_dynamodb_table.access_events.name
+      TOKEN_STATE_TABLE_NAME  = aws_dynamodb_table.token_state.name
+      EVENT_STORAGE_MODE      = var.event_storage_mode
+      EVENT_BUCKET_TABLE_NAME = aws_dynamodb_table.access_event_buckets.name
+      EVENT_JOBS_TABLE_NAME   = aws_dynamodb_table.event_jobs.name
+      PURGE_FUNCTION_NAME     = aws_lambda_function.event_purge_func.function_name
+      ARCHIVE_LOCATION        = "s3://${aws_s3_bucket.event_archive.bucket}/events"
     }
   }
 
+  # Inline purges of up to PURGE_SYNC_MAX_ITEMS events; API Gateway gives up after 30 s
+  timeout = 29
+
   tags = {
     Name = "${var.project_prefix}-event-rud"
   }
 }
 
+# Large DELETE /events purges, started asynchronously by the event RUD function;
+# shipped in the same package and continues itself before hitting the timeout
+resource "aws_lambda_function" "event_purge_func" {
+  filename         = data.archive_file.event_rud_zip.output_path
+  function_name    = "${var.acc}-event-purge"
+  role             = aws_iam_role.event_rud_role.arn
+  handler          = "event_purge.lambda_handler"
+  source_code_hash = filebase64sha256(data.archive_file.event_rud_zip.output_path)
+  runtime          = "python3.9"
+  timeout          = 900
+
+  # pyarrow from the dependency layer rewrites the archive files of a purged token
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
+
+  environment {
+    variables = {
+      DYNAMODB_TABLE_NAME     = aws_dynamodb_table.access_events.name
+      TOKEN_STATE_TABLE_NAME  = aws_dynamodb_table.token_state.name
+      EVENT_STORAGE_MODE      = var.event_storage_mode
+      EVENT_BUCKET_TABLE_NAME = aws_dynamodb_table.access_event_buckets.name
+      EVENT_JOBS_TABLE_NAME   = aws_dynamodb_table.event_jobs.name
+      ARCHIVE_LOCATION        = "s3://${aws_s3_bucket.event_archive.bucket}/events"
+    }
+  }
+
+  tags = {
+    Name = "${var.project_prefix}-event-purge"
+  }
+}
+
+# Standalone full-table export (parallel scan -> NDJSON/gzip on S3), shipped in the event RUD package
+resource "aws_lambda_function" "event_export_func" {
+  filename         = data.archive_file.event_rud_zip.output_path
+  function_name    = "${var.acc}-event-export"
+  role             = aws_iam_role.event_rud_role.arn
+  handler          = "event_export.lambda_handler"
+  source_code_hash = filebase64sha256(data.archive_file.event_rud_zip.output_path)
+  runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 1024
+
+  # serialization.py (NDJSON encoder) lives in the common layer
+  layers = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DYNAMODB_TABLE_NAME = aws_dynamodb_table.access_events.name
+      EXPORT_DESTINATION  = "s3://${aws_s3_bucket.event_exports.bucket}/exports/access-events.ndjson.gz"
+      EXPORT_SEGMENTS     = "8"
+    }
+  }
+
+  tags = {
+    Name = "${var.project_prefix}-event-export"
+  }
+}
+
+# Daily move of old access events into the Parquet archive, shipped in the event RUD package;
+# one run at a time, as each run updates the archive manifest
+resource "aws_lambda_function" "event_archive_func" {
+  filename                       = data.archive_file.event_rud_zip.output_path
+  function_name                  = "${var.acc}-event-archive"
+  role                           = aws_iam_role.event_rud_role.arn
+  handler                        = "event_archive.lambda_handler"
+  source_code_hash               = filebase64sha256(data.archive_file.event_rud_zip.output_path)
+  runtime                        = "python3.9"
+  timeout                        = 900
+  memory_size                    = 1024
+  reserved_concurrent_executions = 1
+
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
+
+  environment {
+    variables = {
+      DYNAMODB_TABLE_NAME     = aws_dynamodb_table.access_events.name
+      EVENT_STORAGE_MODE      = var.event_storage_mode
+      EVENT_BUCKET_TABLE_NAME = aws_dynamodb_table.access_event_buckets.name
+      ARCHIVE_LOCATION        = "s3://${aws_s3_bucket.event_archive.bucket}/events"
+      ARCHIVE_AFTER_DAYS      = tostring(var.archive_after_days)
+    }
+  }
+
+  tags = {
+    Name = "${var.project_prefix}-event-archive"
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "event_archive_schedule" {
+  name                = "${var.acc}-event-archive-schedule"
+  schedule_expression = "cron(30 2 * * ? *)"
+}
+
+resource "aws_cloudwatch_event_target" "event_archive_target" {
+  rule = aws_cloudwatch_event_rule.event_archive_schedule.name
+  arn  = aws_lambda_function.event_archive_func.arn
+}
+
+resource "aws_lambda_permission" "event_archive_schedule" {
+  statement_id  = "AllowEventBridgeInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.event_archive_func.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.event_archive_schedule.arn
+}
+
 resource "aws_lambda_function" "employee_crud_lambda" {
   filename         = data.archive_file.employee_crud_zip.output_path
   function_name    = "${var.acc}-employee-crud-lambda"
@@ -108,7 +265,10 @@ resource "aws_lambda_function" "employee_crud_lambda" {
   runtime          = "python3.9"
   timeout          = 20
 
-  layers = [aws_lambda_layer_version.psycopg2_layer.arn]
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
 
 
   environment {
@@ -136,7 +296,10 @@ resource "aws_lambda_function" "token_crud_lambda" {
   runtime          = "python3.9"
   timeout          = 20
 
-  layers = [aws_lambda_layer_version.psycopg2_layer.arn]
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
 
   environment {
     variables = {
@@ -175,7 +338,10 @@ resource "aws_lambda_function" "schema_loader" {
     security_group_ids = [aws_security_group.vpc_lambda_sg.id]
   }
 
-  layers = [aws_lambda_layer_version.psycopg2_layer.arn]
+  layers = [
+    aws_lambda_layer_version.psycopg2_layer.arn,
+    aws_lambda_layer_version.common_layer.arn
+  ]
 
 }
 
@@ -186,4 +352,12 @@ resource "aws_lambda_layer_version" "psycopg2_layer" {
   compatible_runtimes = ["python3.9"]
 
   source_code_hash = filebase64sha256("./lambda_layer/psycopg2-layer.zip")
-}
\ No newline at end of file
+}
+
+resource "aws_lambda_layer_version" "common_layer" {
+  filename            = data.archive_file.common_layer_zip.output_path
+  layer_name          = "${var.project_prefix}-common-layer"
+  compatible_runtimes = ["python3.9"]
+
+  source_code_hash = data.archive_file.common_layer_zip.output_base64sha256
+}
@@ -0,0 +1,13 @@
+#!/usr/bin/env bash
+# Builds psycopg2-layer.zip (psycopg2, orjson, brotli and pyarrow for python3.9)
+# from the Dockerfile next to this script. terraform/lambda.tf uploads the zip
+# as the dependency layer, so run this before terraform plan/apply and again
+# whenever the Dockerfile changes.
+set -euo pipefail
+cd "$(dirname "$0")"
+
+docker build -t lambda-dependency-layer .
+container=$(docker create lambda-dependency-layer)
+trap 'docker rm "$container" > /dev/null' EXIT
+docker cp "$container:/tmp/psycopg2-layer.zip" psycopg2-layer.zip
+ls -l psycopg2-layer.zip
@@ -0,0 +1,50 @@
+# Bucket for full access-event exports written by the event export Lambda
+resource "aws_s3_bucket" "event_exports" {
+  bucket = "${var.acc}-access-event-exports"
+
+  tags = {
+    Name = "${var.acc}-access-event-exports"
+  }
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "event_exports_lifecycle" {
+  bucket = aws_s3_bucket.event_exports.id
+
+  rule {
+    id     = "abort-incomplete-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
+# Cold tier of the access events: Parquet files per day and shard written by the archive Lambda
+resource "aws_s3_bucket" "event_archive" {
+  bucket = "${var.acc}-access-event-archive"
+
+  tags = {
+    Name = "${var.acc}-access-event-archive"
+  }
+}
+
+# Bucket for bulk employee imports (CSV or JSON arrays) read by the employee CRUD Lambda
+resource "aws_s3_bucket" "employee_imports" {
+  bucket = "${var.acc}-employee-imports"
+
+  tags = {
+    Name = "${var.acc}-employee-imports"
+  }
+}
+
+# The CRUD Lambdas run in the data subnets without NAT; reach S3 through a gateway endpoint
+resource "aws_vpc_endpoint" "s3" {
+  vpc_id            = aws_vpc.dragan_vpc.id
+  service_name      = "com.amazonaws.${var.aws_region}.s3"
+  vpc_endpoint_type = "Gateway"
+
+  route_table_ids = [aws_route_table.data_subnet_rt.id]
+}
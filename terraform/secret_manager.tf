@@ -7,11 +7,12 @@ resource "aws_secretsmanager_secret_version" "db_creds_version" {
   secret_id = aws_secretsmanager_secret.db_creds.id
 
   secret_string = jsonencode({
-    DB_HOST     = aws_rds_cluster.aurora_cluster.endpoint
-    DB_PORT     = aws_rds_cluster.aurora_cluster.port
-    DB_NAME     = aws_rds_cluster.aurora_cluster.database_name
-    DB_USER     = data.aws_ssm_parameter.db_username.value
-    DB_PASSWORD = data.aws_ssm_parameter.db_pass.value
+    DB_HOST        = aws_rds_cluster.aurora_cluster.endpoint
+    DB_READER_HOST = aws_rds_cluster.aurora_cluster.reader_endpoint
+    DB_PORT        = aws_rds_cluster.aurora_cluster.port
+    DB_NAME        = aws_rds_cluster.aurora_cluster.database_name
+    DB_USER        = data.aws_ssm_parameter.db_username.value
+    DB_PASSWORD    = data.aws_ssm_parameter.db_pass.value
   })
 }
 
@@ -3,6 +3,8 @@ resource "aws_sqs_queue" "iot_event_queue" {
   name                        = "${var.acc}-iot-event-queue.fifo"
   content_based_deduplication = true
   fifo_queue                  = true
+  # Must cover the event handler timeout; AWS recommends six times it
+  visibility_timeout_seconds  = 360
   tags = {
     Name = "${var.acc}-iot-queue"
   }
@@ -11,6 +13,12 @@ resource "aws_sqs_queue" "iot_event_queue" {
 resource "aws_lambda_event_source_mapping" "lambda_sqs_trigger" {
   event_source_arn = aws_sqs_queue.iot_event_queue.arn
   function_name    = aws_lambda_function.eh_lambda.arn
-  batch_size       = 5
+  batch_size       = 10 # FIFO event source mappings are capped at 10 messages
   enabled          = true
+
+  # The handler returns batchItemFailures: the first message with an unwritten
+  # event and every message after it, which keeps FIFO group order. Messages
+  # that can never be parsed are dropped and counted instead of reported, as
+  # the queue has no dead-letter queue to move them to.
+  function_response_types = ["ReportBatchItemFailures"]
 }
\ No newline at end of file
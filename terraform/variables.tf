@@ -35,4 +35,21 @@ variable "asg_max" {}
 
 variable "asg_desired" {}
 
-variable "subdomain_name" {}
\ No newline at end of file
+variable "subdomain_name" {}
+
+# "item" stores one DynamoDB item per access event; "bucket" packs them per token and hour
+variable "event_storage_mode" {
+  type    = string
+  default = "item"
+
+  validation {
+    condition     = contains(["item", "bucket"], var.event_storage_mode)
+    error_message = "event_storage_mode must be \"item\" or \"bucket\"."
+  }
+}
+
+# Access events older than this many days move from DynamoDB to the Parquet archive
+variable "archive_after_days" {
+  type    = number
+  default = 90
+}